@@ -54,9 +54,15 @@ dirs_to_reset=(
     "data/chromadb_ja"
     "data/chromadb_en"
     "data/inputs/processed"
+    "data/scheduler_ja"
+    "data/scheduler_en"
+    "data/run_ja"
+    "data/run_en"
+    "data/cache_ja"
+    "data/cache_en"
 )
 
-# リセット対象のファイル（DBファイル）
+# 削除のみ行う旧形式のファイル（スケジューラーDBはWAL共有のためディレクトリ単位でマウントするようになった）
 files_to_reset=(
     "data/scheduler_ja.db"
     "data/scheduler_en.db"
@@ -84,12 +90,9 @@ done
 # ファイルの処理
 for file in "${files_to_reset[@]}"; do
     if [ -e "$file" ]; then
+        echo "   - Removing legacy DB file: $file"
         sudo rm -rf "$file"
     fi
-    # ディレクトリではなくファイルとして作成
-    echo "   - Recreating empty DB file: $file"
-    touch "$file"
-    chmod 666 "$file"
 done
 
 # AIモデルの削除
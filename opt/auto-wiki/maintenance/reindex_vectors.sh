@@ -0,0 +1,26 @@
+#!/bin/bash
+
+# /opt/auto-wiki/maintenance/reindex_vectors.sh
+# ベクトルDB全件再構築スクリプト
+# 目的: Wiki上の全記事をバッチ埋め込みでベクトルDBに登録し直す（ダンプインポート後・モデル変更後に使用）
+
+# 色の定義
+GREEN='\033[0;32m'
+YELLOW='\033[1;33m'
+NC='\033[0m'
+
+# ルートディレクトリへ移動
+cd "$(dirname "$0")/.." || exit
+
+echo -e "${GREEN}🧠 Vector Index Rebuild Tool${NC}"
+read -p "Target bot [ja/en] (default: ja): " lang
+lang=${lang:-ja}
+read -p "Drop the existing index first? (y/N): " reset
+
+ARGS=""
+if [[ $reset == "y" || $reset == "Y" ]]; then
+    ARGS="--reset"
+fi
+
+echo -e "${YELLOW}▶ Re-indexing with wiki-bot-${lang}...${NC}"
+docker compose exec "wiki-bot-${lang}" python -m src.rag.reindex $ARGS
@@ -53,10 +53,11 @@ while true; do
     echo "  9. Factory Reset (初期化・データ削除)"
     echo " 10. Import Wikipedia Dump (ダンプインポート)"
     echo " 11. Backup/Migrate (バックアップ・移行)"
+    echo " 12. Rebuild Vector Index (ベクトルDB再構築)"
     echo ""
     echo "  0. Exit"
     echo ""
-    read -p "Enter choice [0-11]: " choice
+    read -p "Enter choice [0-12]: " choice
 
     case $choice in
         1) run_script "maintenance/toolbox/enable_progress_log.sh" ;;
@@ -72,6 +73,7 @@ while true; do
         9) run_script "maintenance/factory_reset.sh" ;;
         10) run_script "maintenance/import_dump.sh" ;;
         11) run_script "maintenance/migrate.sh" ;;
+        12) run_script "maintenance/reindex_vectors.sh" ;;
         
         0) echo "Bye!"; exit 0 ;;
         *) echo "Invalid option." ;;
@@ -14,7 +14,11 @@ from openai import OpenAI
 
 sys.path.append("/app")
 from src.scheduler.task_manager import WikiScheduler
-from src.rag.vector_store import WikiVectorDB
+from src.scheduler.notifier import TaskNotifier
+from src.scheduler.pipeline import load_pipeline_metrics
+from src.rag.vector_store import get_vector_db
+from src.rag.embeddings import get_local_embedder
+from src.bot.llm_gateway import LLMGateway, LLMMetrics, load_llm_metrics
 from src.utils.diagnostics import SystemDiagnostics
 
 app = FastAPI(title="Auto-Wiki Control Panel", version="2.6.0")
@@ -22,14 +26,17 @@ templates = Jinja2Templates(directory="/app/src/templates")
 security = HTTPBasic()
 
 # DB接続
-scheduler = WikiScheduler(db_path="/app/scheduler.db")
-vector_db = WikiVectorDB()
+# タスク追加時はBotへ通知し、即座に処理を開始させる
+scheduler = WikiScheduler(db_path=os.getenv("SCHEDULER_DB", "/app/scheduler.db"), notifier=TaskNotifier(os.getenv("NOTIFY_SOCKET", "/app/run/scheduler.sock")))
+vector_db = get_vector_db()
 diagnostics = SystemDiagnostics()
 
 # LLM接続
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://ollama:11434/v1")
 MODEL_NAME = os.getenv("MODEL_NAME", "gemma2")
 llm_client = OpenAI(base_url=OLLAMA_HOST, api_key="ollama")
+# ダッシュボード自身の計測はファイルに書き出さない（Bot側の計測ファイルを上書きしないため）
+llm = LLMGateway(llm_client, MODEL_NAME, metrics=LLMMetrics(path="")).for_agent("dashboard")
 
 SYSTEM_LANG = os.getenv("WIKI_LANG", "ja")
 
@@ -107,6 +114,10 @@ class TaskCreate(BaseModel):
     topic: str
     priority: int = 10
 
+class BulkTaskCreate(BaseModel):
+    topics: list[str]
+    priority: int = 5
+
 class SearchQuery(BaseModel):
     query: str
     limit: int = 3
@@ -114,6 +125,14 @@ class SearchQuery(BaseModel):
 class ChatRequest(BaseModel):
     message: str
 
+class EmbedRequest(BaseModel):
+    texts: list[str]
+    batch_size: int = 32
+
+@app.on_event("shutdown")
+def close_connections():
+    scheduler.close()
+
 @app.get("/")
 async def root():
     return RedirectResponse(url="/dashboard")
@@ -145,6 +164,15 @@ def add_manual_task(task: TaskCreate, username: str = Depends(get_current_userna
     scheduler.add_or_update_task(task.topic, priority=task.priority)
     return {"message": f"Task '{task.topic}' added successfully."}
 
+@app.post("/api/tasks/bulk")
+def add_bulk_tasks(bulk: BulkTaskCreate, username: str = Depends(get_current_username)):
+    """複数トピックを1トランザクションで登録する"""
+    outcomes = scheduler.add_or_update_tasks(bulk.topics, priority=bulk.priority)
+    counts = {"added": 0, "requeued": 0, "skipped": 0}
+    for outcome in outcomes.values():
+        counts[outcome] += 1
+    return {"message": f"{counts['added'] + counts['requeued']} tasks queued.", **counts, "results": outcomes}
+
 # --- タスク削除エンドポイント ---
 @app.delete("/api/tasks/{task_id}")
 def delete_task(task_id: int, username: str = Depends(get_current_username)):
@@ -172,6 +200,19 @@ def get_bot_logs(username: str = Depends(get_current_username)):
     
     return {"logs": logs}
 
+@app.get("/api/llm/metrics")
+def get_llm_metrics_report(username: str = Depends(get_current_username)):
+    """エージェント/呼び出し箇所ごとのLLM計測結果（Bot側はファイル経由、ダッシュボード自身はプロセス内の値）"""
+    return {
+        "bot": load_llm_metrics(),
+        "dashboard": llm.gateway.metrics.snapshot(),
+    }
+
+@app.get("/api/pipeline/metrics")
+def get_pipeline_metrics_report(username: str = Depends(get_current_username)):
+    """Botのステージ別パイプラインのキュー長・処理時間"""
+    return load_pipeline_metrics()
+
 @app.get("/api/diagnostics/run")
 def run_system_diagnostics(username: str = Depends(get_current_username)):
     results = diagnostics.run_all_checks()
@@ -186,6 +227,11 @@ def search_knowledge_base(query: SearchQuery):
         "metadatas": results['metadatas'][0]
     }
 
+@app.post("/api/embed")
+def embed_texts(req: EmbedRequest):
+    """埋め込みワーカー: 各Botコンテナ（EMBEDDING_URL設定時）に代わってベクトルを計算する"""
+    return {"embeddings": get_local_embedder().embed(req.texts, batch_size=req.batch_size)}
+
 @app.post("/api/rag/chat")
 def chat_with_brain(req: ChatRequest):
     user_msg = req.message
@@ -211,14 +257,14 @@ def chat_with_brain(req: ChatRequest):
     prompt = f"【参照知識】\n{context_text}\n\n【質問】\n{user_msg}"
 
     try:
-        resp = llm_client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
+        answer = llm.chat(
+            "rag_chat",
+            [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.3
         )
-        return {"answer": resp.choices[0].message.content, "sources": [m.get("topic") for m in metadatas]}
+        return {"answer": answer, "sources": [m.get("topic") for m in metadatas]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
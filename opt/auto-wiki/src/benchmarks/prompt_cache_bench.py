@@ -0,0 +1,128 @@
+# /opt/auto-wiki/src/benchmarks/prompt_cache_bench.py
+# 日本語タイトル: プロンプトキャッシュ（共通プレフィックス）ベンチマーク
+# 目的: 分割執筆の各セクション呼び出しについて、Ollama のプロンプト評価時間（prompt_eval_duration）を
+#       従来のレイアウト（指示 → 調査メモ）と共通プレフィックスのレイアウト（調査メモ → 指示）で比較する
+#
+# 使い方 (コンテナ内):
+#   python -m src.benchmarks.prompt_cache_bench --topic "東京タワー" --sections 5
+#   SEARCH_BACKEND=fixture SEARCH_FIXTURE=/app/config/search_fixture.json python -m src.benchmarks.prompt_cache_bench ...
+
+import argparse
+import os
+import sys
+import time
+import requests
+
+sys.path.append("/app")
+
+from src.bot.article_prompts import article_prefix, section_task
+from src.bot.research_context import ResearchContext
+from src.bot.search import get_search_client
+
+DEFAULT_SECTIONS = ["概要", "歴史", "特徴", "社会的影響", "評価", "関連する出来事"]
+
+
+def collect_notes(topic: str, sections: list, max_tokens: int, lang: str) -> str:
+    """実際の調査と同じ検索クライアントで出典を集め、記事用の調査メモを作る"""
+    region = "jp-jp" if lang == "ja" else "us-en"
+    client = get_search_client()
+    context = ResearchContext(topic)
+    for query in [topic] + [f"{topic} {s}" for s in sections]:
+        try:
+            context.add(client.search(query, region=region, limit=5))
+        except Exception as e:
+            print(f"⚠️ Search failed for '{query}': {e}")
+    return context.render(max_tokens)
+
+
+def legacy_messages(topic: str, section: str, notes: str) -> list:
+    """変更前のレイアウト: セクションごとの指示が調査メモより前にあり、先頭が呼び出しごとに異なる"""
+    return [{"role": "user", "content": f"""
+            [System Command]
+            You are a text generation engine, NOT a chat assistant.
+            - DO NOT talk to the user.
+            - Output ONLY the requested Wikitext content.
+            - Language: JAPANESE (日本語)
+
+            Task: Write the section "{section}" for the article "{topic}".
+            Input Data: {notes}
+
+            Instruction:
+            - Start strictly with: == {section} ==
+            - Write detailed paragraphs (at least 400 characters).
+            """}]
+
+
+def shared_messages(topic: str, section: str, notes: str, lang: str) -> list:
+    """変更後のレイアウト: 共通プレフィックス + 短い指示"""
+    return article_prefix(topic, notes, lang) + [section_task(topic, section, [])]
+
+
+def run_layout(label: str, build, sections: list, host: str, model: str, num_predict: int, keep_alive: str) -> list:
+    """各セクションを順に呼び出し、プロンプト評価のトークン数と時間を返す"""
+    print(f"\n⏱️  {label}")
+    rows = []
+    for section in sections:
+        started = time.perf_counter()
+        response = requests.post(f"{host}/api/chat", json={
+            "model": model,
+            "messages": build(section),
+            "stream": False,
+            "keep_alive": keep_alive,
+            # 出力は計測対象外なので短く打ち切る
+            "options": {"temperature": 0.3, "num_predict": num_predict},
+        }, timeout=1800)
+        response.raise_for_status()
+        data = response.json()
+        eval_ms = data.get("prompt_eval_duration", 0) / 1e6
+        rows.append((data.get("prompt_eval_count", 0), eval_ms))
+        print(f"   {section:<16} prompt_eval_count={data.get('prompt_eval_count', 0):6d}  "
+              f"prompt_eval={eval_ms:9.1f}ms  total={(time.perf_counter() - started) * 1000:9.1f}ms")
+    return rows
+
+
+def summarize(label: str, rows: list):
+    tokens = sum(r[0] for r in rows)
+    ms = sum(r[1] for r in rows)
+    # 初回はどちらのレイアウトでも調査メモ全体を処理するため、2回目以降の平均も出す
+    rest = rows[1:] or rows
+    rest_ms = sum(r[1] for r in rest) / len(rest)
+    print(f"   {label:<8} total prompt_eval={ms:9.1f}ms ({tokens} tokens)  per section after first={rest_ms:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama prompt-eval time per section: legacy vs shared-prefix layout")
+    parser.add_argument("--topic", default="東京タワー")
+    parser.add_argument("--sections", type=int, default=5)
+    parser.add_argument("--notes-tokens", type=int, default=3000)
+    parser.add_argument("--notes-file", help="調査メモのテキストファイル（指定時は検索しない）")
+    parser.add_argument("--host", default=os.getenv("OLLAMA_HOST", "http://ollama:11434/v1"))
+    parser.add_argument("--model", default=os.getenv("MODEL_NAME", "gemma2"))
+    parser.add_argument("--lang", default=os.getenv("WIKI_LANG", "ja"))
+    parser.add_argument("--num-predict", type=int, default=16)
+    parser.add_argument("--keep-alive", default=os.getenv("LLM_KEEP_ALIVE", "30m"))
+    args = parser.parse_args()
+
+    # OpenAI 互換エンドポイント（/v1）ではなくネイティブAPIの計測値を使う
+    host = args.host.rstrip("/").removesuffix("/v1")
+    sections = (DEFAULT_SECTIONS * (args.sections // len(DEFAULT_SECTIONS) + 1))[:args.sections]
+
+    if args.notes_file:
+        with open(args.notes_file, "r", encoding="utf-8") as f:
+            notes = f.read()
+    else:
+        notes = collect_notes(args.topic, sections, args.notes_tokens, args.lang)
+    print(f"📝 Notes: {len(notes):,} chars, {len(sections)} sections, model={args.model}")
+
+    before = run_layout("Before: task first, per-call prefix", lambda s: legacy_messages(args.topic, s, notes),
+                        sections, host, args.model, args.num_predict, args.keep_alive)
+    after = run_layout("After: shared system/notes prefix", lambda s: shared_messages(args.topic, s, notes, args.lang),
+                       sections, host, args.model, args.num_predict, args.keep_alive)
+
+    print("\n📊 Summary")
+    summarize("before", before)
+    summarize("after", after)
+
+
+if __name__ == "__main__":
+    main()
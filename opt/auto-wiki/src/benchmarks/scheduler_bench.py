@@ -0,0 +1,93 @@
+# /opt/auto-wiki/src/benchmarks/scheduler_bench.py
+# 日本語タイトル: スケジューラーDB ベンチマーク
+# 目的: 大量のタスク（デフォルト100万件）を投入した scheduler.db で、
+#       タスク取得・一覧取得・メンテナンス再キューのレイテンシを計測する
+#
+# 使い方 (コンテナ内):
+#   python -m src.benchmarks.scheduler_bench --tasks 1000000 --db /tmp/scheduler_bench.db
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append("/app")
+
+from src.scheduler.task_manager import WikiScheduler
+
+
+def seed_tasks(scheduler: WikiScheduler, count: int):
+    """ステータス・優先度・日時を散らしたタスクを一括投入する"""
+    print(f"🌱 Seeding {count:,} tasks...")
+    now = datetime.now()
+    rng = random.Random(42)
+    started = time.perf_counter()
+
+    with scheduler._db.transaction() as conn:
+        batch = []
+        for i in range(count):
+            r = rng.random()
+            if r < 0.85:
+                # 完了済みタスクの next_run は再調査予定
+                last_run = now - timedelta(days=rng.randint(0, 60))
+                status, next_run = "FINISHED", last_run + timedelta(days=7)
+            elif r < 0.999:
+                status, next_run, last_run = "PENDING", now - timedelta(minutes=rng.randint(0, 10000)), None
+            else:
+                status, next_run, last_run = "RUNNING", now, now
+            batch.append((f"bench-topic-{i}", rng.randint(1, 10), status, next_run, last_run))
+            if len(batch) >= 50000:
+                conn.executemany("INSERT INTO tasks (topic, priority, status, next_run, last_run) VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO tasks (topic, priority, status, next_run, last_run) VALUES (?, ?, ?, ?, ?)", batch)
+    scheduler._get_conn().execute("ANALYZE")
+    print(f"   done in {time.perf_counter() - started:.1f}s")
+
+
+def measure(label: str, func, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+    p50 = timings[len(timings) // 2]
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"   {label:<32} p50={p50:8.3f}ms  p95={p95:8.3f}ms  (n={repeat})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="scheduler.db latency benchmark")
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--db", default="/tmp/scheduler_bench.db")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+
+    scheduler = WikiScheduler(db_path=args.db)
+    seed_tasks(scheduler, args.tasks)
+
+    print("⏱️  Latency:")
+    claimed = []
+
+    def claim():
+        claimed.extend(scheduler.claim_tasks("bench-worker", limit=1))
+
+    def complete():
+        if claimed:
+            scheduler.complete_task(claimed.pop()["topic"], "bench-worker")
+
+    measure("claim_tasks(limit=1)", claim, args.repeat)
+    measure("complete_task", complete, args.repeat)
+    measure("get_recent_tasks(limit=50)", lambda: scheduler.get_recent_tasks(limit=50), args.repeat)
+    measure("schedule_maintenance_tasks", scheduler.schedule_maintenance_tasks, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
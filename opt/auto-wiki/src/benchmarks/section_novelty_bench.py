@@ -0,0 +1,75 @@
+# /opt/auto-wiki/src/benchmarks/section_novelty_bench.py
+# 日本語タイトル: セクション差分更新の新規性しきい値の調整
+# 目的: 既存記事と実際の調査結果から、出典ごとに「記事中で最も近い一節との類似度」を求め、
+#       SECTION_KNOWN_SIMILARITY の候補値ごとに書き直し対象になる出典・節の数を表示する
+#       （再調査で調査結果がほとんど変わらない記事では、書き直す節が 0 になる値を選ぶ）
+#
+# 使い方 (コンテナ内):
+#   python -m src.benchmarks.section_novelty_bench --topic "東京タワー" --article-file /app/data/tokyo_tower.wiki
+#   SEARCH_BACKEND=fixture SEARCH_FIXTURE=/app/config/search_fixture.json python -m src.benchmarks.section_novelty_bench ...
+
+import argparse
+import os
+import sys
+
+sys.path.append("/app")
+
+from src.bot.research_context import ResearchContext
+from src.bot.search import get_search_client
+from src.bot.section_updater import _FOOTER_TITLES, KNOWN_SIMILARITY, SectionUpdater, parse_sections
+from src.rag.embeddings import get_embedder
+
+THRESHOLDS = [0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9]
+
+
+class _NoLLM:
+    """類似度の計算だけを行うため、LLM は使わない"""
+
+    def for_agent(self, name):
+        return self
+
+
+def collect_research(topic: str, sections: list, lang: str) -> ResearchContext:
+    """実際の調査と同じ検索クライアントで、トピック名と各見出しについて検索する"""
+    region = "jp-jp" if lang == "ja" else "us-en"
+    client = get_search_client()
+    context = ResearchContext(topic)
+    for query in [topic] + [f"{topic} {s['title']}" for s in sections if s["title"]]:
+        try:
+            context.add(client.search(query, region=region, limit=5))
+        except Exception as e:
+            print(f"⚠️ Search failed for '{query}': {e}")
+    return context
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similarity of research sources to the existing article, per threshold")
+    parser.add_argument("--topic", required=True)
+    parser.add_argument("--article-file", required=True, help="既存記事の Wikitext")
+    parser.add_argument("--lang", default=os.getenv("WIKI_LANG", "ja"))
+    args = parser.parse_args()
+
+    with open(args.article_file, "r", encoding="utf-8") as f:
+        sections = parse_sections(f.read())
+    candidates = [i for i, s in enumerate(sections) if s["title"] not in _FOOTER_TITLES and (s["title"] or s["body"].strip())]
+
+    embedder = get_embedder()
+    research = collect_research(args.topic, sections, args.lang)
+    updater = SectionUpdater(_NoLLM(), embedder, lang=args.lang)
+    matches = updater.nearest_passages(args.topic, sections, candidates, research.embedded_sources(embedder))
+    if not matches:
+        print("❌ No research sources found.")
+        return
+
+    print(f"\n📏 {len(matches)} sources (sorted by similarity to the nearest passage)")
+    for source, index, similarity in sorted(matches, key=lambda m: -m[2]):
+        print(f"   {similarity:.3f}  [{sections[index]['title'] or 'Introduction'}]  {source['title'][:60]}")
+
+    print(f"\n📊 Per threshold (current SECTION_KNOWN_SIMILARITY={KNOWN_SIMILARITY})")
+    for threshold in THRESHOLDS:
+        new = [index for _, index, similarity in matches if similarity < threshold]
+        print(f"   {threshold:.2f}  new sources={len(new):3d}/{len(matches)}  sections to rewrite={len(set(new))}")
+
+
+if __name__ == "__main__":
+    main()
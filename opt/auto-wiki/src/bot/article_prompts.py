@@ -0,0 +1,65 @@
+# /opt/auto-wiki/src/bot/article_prompts.py
+# 日本語タイトル: 記事執筆プロンプトの組み立て（共通プレフィックス + 短い指示）
+# 目的: 1記事内の構成案・導入部・各セクションの呼び出しで、system 指示と調査メモを同一のメッセージ列として先頭に置き、
+#       呼び出しごとに異なる指示は末尾の短い user メッセージだけにする
+#       （Ollama は先頭が一致するプロンプトの KV キャッシュを再利用するため、長い調査メモの再処理が初回だけになる）
+
+
+def _language(lang: str) -> str:
+    return "JAPANESE (日本語)" if lang == "ja" else "ENGLISH"
+
+
+def article_prefix(topic: str, notes: str, lang: str = "ja") -> list:
+    """
+    記事内の全呼び出しで共通のメッセージ列（system 指示 + 調査メモ + 固定の応答）。
+    1文字でも変わるとキャッシュが効かないため、呼び出しごとに変わる値を含めないこと
+    """
+    system = f"""
+        [System Command]
+        You are a text generation engine, NOT a chat assistant.
+        - DO NOT talk to the user.
+        - DO NOT say "Here is the article" or "Sure!".
+        - DO NOT ask questions.
+        - Output ONLY the requested content.
+        - Language: {_language(lang)}
+        """
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": f'Research notes for the article "{topic}" (cite them as [Source n]):\n\n{notes}'},
+        {"role": "assistant", "content": "Research notes received."},
+    ]
+
+
+def outline_task(topic: str) -> dict:
+    return {"role": "user", "content": f"""
+        List 4-6 main section titles for a Wikipedia article about "{topic}".
+        Exclude "Introduction" and "See Also".
+        Output ONLY a JSON list of strings. e.g. ["History", "Mechanism", "Impact"]
+        """}
+
+
+def intro_task(topic: str, image_inst: str) -> dict:
+    # 導入部：定義から強制的に始めさせる
+    return {"role": "user", "content": f"""
+        Task: Write the lead section for "{topic}" in Wikitext.
+        Image Code: {image_inst}
+
+        Instruction:
+        - Start strictly with: '''{topic}'''
+        - Write 3-5 summary sentences.
+        - Insert the image code if provided.
+        - NO headings here.
+        """}
+
+
+def section_task(topic: str, section_title: str, source_numbers: list) -> dict:
+    focus = ", ".join(f"[Source {n}]" for n in source_numbers)
+    focus_line = f"- Base the section mainly on {focus}.\n        " if focus else ""
+    return {"role": "user", "content": f"""
+        Task: Write the section "{section_title}" for the article "{topic}" in Wikitext.
+
+        Instruction:
+        {focus_line}- Start strictly with: == {section_title} ==
+        - Write detailed paragraphs (at least 400 characters).
+        - Use bullet points only for lists.
+        """}
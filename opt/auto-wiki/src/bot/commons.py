@@ -3,13 +3,12 @@
 # 目的: Wikimedia Commonsから適切な画像を検索・選定する
 
 import mwclient
-from openai import OpenAI
+from src.bot.llm_gateway import LLMGateway
 
 class CommonsAgent:
-    def __init__(self, client: OpenAI, model_name: str):
+    def __init__(self, llm: LLMGateway):
         self.site = mwclient.Site('commons.wikimedia.org')
-        self.client = client
-        self.model_name = model_name
+        self.llm = llm.for_agent("commons")
 
     def search_images(self, topic: str, limit: int = 5):
         """トピックに関連する画像を検索する"""
@@ -43,14 +42,9 @@ class CommonsAgent:
         """
         
         try:
-            resp = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1
-            )
+            content = self.llm.chat("select_best_image", prompt, temperature=0.1)
         
             # --- 修正箇所: contentがNoneの場合を考慮 ---
-            content = resp.choices[0].message.content
             if not content:
                 return None
             
@@ -0,0 +1,314 @@
+# /opt/auto-wiki/src/bot/llm_gateway.py
+# 日本語タイトル: LLM ゲートウェイ（ストリーミング + 計測）
+# 目的: 全エージェントのLLM呼び出しを1か所に集約し、ストリーミング受信・チャット化した出力の途中打ち切り・
+#       エージェント/呼び出し箇所ごとのトークン数とレイテンシ（初回トークンまで・全体）の計測を行う
+#       入力が同じなら結果も同じとみなせる呼び出しは、(モデル, メッセージ, temperature) をキーに応答をディスクキャッシュする
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from openai import OpenAI
+from src.utils.disk_cache import DiskCache, cache_path
+from src.utils.tokens import estimate_tokens
+
+# 計測結果の出力先（Botとダッシュボードで共有している src ボリューム上。言語ごとに分ける）
+METRICS_FILE = os.getenv("LLM_METRICS_FILE", f"/app/src/llm_metrics_{os.getenv('WIKI_LANG', 'ja')}.json")
+METRICS_DUMP_INTERVAL = 10.0
+
+# Ollama にモデルを読み込んだままにする時間（アンロードされると共通プレフィックスの KV キャッシュも失われる）
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+
+# 応答キャッシュの上限（MB）。0 でキャッシュ無効
+LLM_CACHE_MB = int(os.getenv("LLM_CACHE_MB", "128"))
+# キャッシュしない呼び出し箇所（"agent.call_site" のカンマ区切り）
+LLM_CACHE_DISABLE = {s.strip() for s in os.getenv("LLM_CACHE_DISABLE", "").split(",") if s.strip()}
+_DAY = 24 * 3600
+# 呼び出し箇所ごとの応答キャッシュ有効期限（秒）。ここにない呼び出しはキャッシュしない
+CACHE_TTL = {
+    ("writer", "outline"): 7 * _DAY,
+    ("researcher", "initial_plan"): 7 * _DAY,
+    ("commons", "select_best_image"): 30 * _DAY,
+    ("reviewer", "review_draft"): 7 * _DAY,
+    ("vetter", "vet_search_results"): 7 * _DAY,
+}
+
+# 出力冒頭に現れたらチャット応答とみなす定型句
+_CHATTY_PREFIXES = ("Here is", "Here's", "Sure,", "Sure!", "Certainly", "I'm sorry", "I cannot", "As an AI", "申し訳", "もちろん")
+# 出力冒頭に現れたらチャット応答とみなす前置き（「以下は主な受賞歴である。」のような記事本文の書き出しは含めない）
+_CHATTY_PREAMBLE_RE = re.compile(r"^以下は[^。\n]{0,40}?(記事|本文|ドラフト|Wikitext|ウィキテキスト)(です|になります|を|：|:)")
+# 出力中のどこに現れてもチャット応答とみなす定型句
+_CHATTY_MARKERS = ("Please provide",)
+
+
+class LLMOutputAborted(Exception):
+    """ストリーミング中に出力が不適切（チャット化）と判定され、生成を打ち切った"""
+
+
+def is_chatty(text: str) -> bool:
+    """出力がチャット応答になっているか（記事本文として使えないか）を判定する"""
+    head = text.lstrip()[:40]
+    if any(head.startswith(prefix) for prefix in _CHATTY_PREFIXES):
+        return True
+    if _CHATTY_PREAMBLE_RE.match(text.lstrip()[:80]):
+        return True
+    return any(marker in text for marker in _CHATTY_MARKERS)
+
+
+class LLMMetrics:
+    """エージェント/呼び出し箇所ごとの呼び出し統計（プロセス内で共有）"""
+
+    def __init__(self, path: str = METRICS_FILE, window: int = 200):
+        self.path = path
+        self.window = window
+        self._stats: dict[tuple[str, str], dict] = {}
+        self._cache: dict[tuple[str, str], dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._last_dump = 0.0
+
+    def record_cache(self, agent: str, call_site: str, hit: bool):
+        with self._lock:
+            counters = self._cache.setdefault((agent, call_site), {"hits": 0, "misses": 0})
+            counters["hits" if hit else "misses"] += 1
+
+    def record(self, agent: str, call_site: str, latency: float, ttft: float | None,
+               prompt_tokens: int, completion_tokens: int, outcome: str = "ok"):
+        with self._lock:
+            stat = self._stats.setdefault((agent, call_site), {
+                "calls": 0, "errors": 0, "aborted": 0,
+                "prompt_tokens": 0, "completion_tokens": 0,
+                "latency_total": 0.0, "ttft_total": 0.0, "ttft_count": 0,
+                "latencies": deque(maxlen=self.window),
+            })
+            stat["calls"] += 1
+            if outcome == "error":
+                stat["errors"] += 1
+            elif outcome == "aborted":
+                stat["aborted"] += 1
+            stat["prompt_tokens"] += prompt_tokens
+            stat["completion_tokens"] += completion_tokens
+            stat["latency_total"] += latency
+            stat["latencies"].append(latency)
+            if ttft is not None:
+                stat["ttft_total"] += ttft
+                stat["ttft_count"] += 1
+            due = time.monotonic() - self._last_dump >= METRICS_DUMP_INTERVAL
+        if due:
+            self.dump()
+
+    def snapshot(self) -> dict:
+        """{agent: {call_site: 集計値}} を返す"""
+        result: dict[str, dict[str, dict]] = {}
+        with self._lock:
+            for (agent, call_site), counters in self._cache.items():
+                result.setdefault(agent, {})[call_site] = {"calls": 0, "cache_hits": counters["hits"], "cache_misses": counters["misses"]}
+            for (agent, call_site), stat in self._stats.items():
+                latencies = sorted(stat["latencies"])
+                calls = stat["calls"]
+                completion_seconds = stat["latency_total"] - stat["ttft_total"]
+                result.setdefault(agent, {}).setdefault(call_site, {}).update({
+                    "calls": calls,
+                    "errors": stat["errors"],
+                    "aborted": stat["aborted"],
+                    "prompt_tokens": stat["prompt_tokens"],
+                    "completion_tokens": stat["completion_tokens"],
+                    "avg_latency_s": round(stat["latency_total"] / calls, 3) if calls else 0.0,
+                    "p50_latency_s": round(latencies[len(latencies) // 2], 3) if latencies else 0.0,
+                    "p95_latency_s": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else 0.0,
+                    "avg_ttft_s": round(stat["ttft_total"] / stat["ttft_count"], 3) if stat["ttft_count"] else None,
+                    "total_seconds": round(stat["latency_total"], 1),
+                    "completion_tokens_per_s": round(stat["completion_tokens"] / completion_seconds, 2) if completion_seconds > 0 else None,
+                })
+        return result
+
+    def dump(self):
+        """集計値をJSONファイルに書き出す（ダッシュボードが読む）"""
+        self._last_dump = time.monotonic()
+        if not self.path:
+            return
+        data = {"updated_at": time.time(), "agents": self.snapshot()}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ LLM metrics dump failed: {e}")
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_llm_metrics() -> LLMMetrics:
+    """プロセス共有の計測レジストリを返す"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = LLMMetrics()
+    return _metrics
+
+
+_cache = None
+_cache_failed = False
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> DiskCache | None:
+    """プロセス共有の応答キャッシュを返す（無効・開けない場合は None）"""
+    global _cache, _cache_failed
+    if LLM_CACHE_MB <= 0 or _cache_failed:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None and not _cache_failed:
+                try:
+                    _cache = DiskCache(cache_path("llm_responses.sqlite"), max_bytes=LLM_CACHE_MB * 1024 * 1024)
+                except Exception as e:
+                    print(f"⚠️ LLM response cache disabled: {e}")
+                    _cache_failed = True
+    return _cache
+
+
+def load_llm_metrics(path: str = METRICS_FILE) -> dict:
+    """他プロセス（Bot）が書き出した計測結果を読み込む"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class LLMGateway:
+    """
+    全エージェント共通のLLM呼び出し口。
+    エージェントは for_agent() で自分の名前を束縛したビューを受け取り、chat() を呼ぶ
+    """
+
+    def __init__(self, client: OpenAI, model_name: str, metrics: LLMMetrics | None = None):
+        self.client = client
+        self.model_name = model_name
+        self.metrics = metrics or get_llm_metrics()
+
+    def for_agent(self, agent: str) -> "AgentLLM":
+        return AgentLLM(self, agent)
+
+    def chat(self, agent: str, call_site: str, messages, temperature: float = 0.3,
+             timeout: float | None = None, abort_on=None, stream: bool = True,
+             cache_ttl: float | None = None, **extra) -> str:
+        """
+        チャット補完を実行して本文を返す（None の場合は空文字）。
+        messages: メッセージのリスト、または user メッセージ1つ分の文字列
+        abort_on: 受信途中の本文を受け取り True を返したら生成を打ち切る関数（LLMOutputAborted を送出）
+        cache_ttl: 応答キャッシュの有効期限（秒）。省略時は CACHE_TTL の設定、0 でこの呼び出しはキャッシュしない
+        """
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+
+        if cache_ttl is None:
+            cache_ttl = CACHE_TTL.get((agent, call_site), 0)
+        cache = get_llm_cache() if cache_ttl and f"{agent}.{call_site}" not in LLM_CACHE_DISABLE else None
+        cache_key = None
+        if cache is not None:
+            payload = json.dumps(
+                {"model": self.model_name, "messages": messages, "temperature": temperature},
+                ensure_ascii=False, sort_keys=True
+            )
+            cache_key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+            try:
+                cached = cache.get(cache_key, max_age=cache_ttl)
+            except Exception as e:
+                print(f"⚠️ LLM cache read failed: {e}")
+                cached = None
+            self.metrics.record_cache(agent, call_site, cached is not None)
+            if cached is not None:
+                return cached.decode("utf-8")
+
+        text = self._complete(agent, call_site, messages, temperature, timeout, abort_on, stream, extra)
+
+        # 空の応答はキャッシュしない（失敗・打ち切りは例外になるためここに来ない）
+        if cache is not None and cache_key is not None and text.strip():
+            try:
+                cache.set(cache_key, text.encode("utf-8"))
+            except Exception as e:
+                print(f"⚠️ LLM cache write failed: {e}")
+        return text
+
+    def _complete(self, agent, call_site, messages, temperature, timeout, abort_on, stream, extra) -> str:
+        """LLMを実際に呼び出し、計測値を記録する"""
+        started = time.perf_counter()
+        ttft = None
+        usage = None
+        text = ""
+        outcome = "ok"
+        if timeout is not None:
+            extra["timeout"] = timeout
+        if LLM_KEEP_ALIVE:
+            # OpenAI 互換APIの引数に無いため extra_body で Ollama に渡す
+            extra["extra_body"] = {"keep_alive": LLM_KEEP_ALIVE, **extra.get("extra_body", {})}
+        try:
+            if stream:
+                response = self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **extra
+                )
+                try:
+                    for chunk in response:
+                        if chunk.usage:
+                            usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if not delta:
+                            continue
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                        text += delta
+                        if abort_on and abort_on(text):
+                            outcome = "aborted"
+                            raise LLMOutputAborted(f"{agent}.{call_site}: output aborted after {len(text)} chars")
+                finally:
+                    response.close()
+            else:
+                response = self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    **extra
+                )
+                usage = response.usage
+                text = response.choices[0].message.content or ""
+                if abort_on and abort_on(text):
+                    outcome = "aborted"
+                    raise LLMOutputAborted(f"{agent}.{call_site}: output rejected")
+            return text
+        except Exception:
+            if outcome == "ok":
+                outcome = "error"
+            raise
+        finally:
+            # usage が返らないサーバーでは概算値で記録する
+            prompt_tokens = getattr(usage, "prompt_tokens", None) or sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+            completion_tokens = getattr(usage, "completion_tokens", None) or estimate_tokens(text)
+            self.metrics.record(agent, call_site, time.perf_counter() - started, ttft,
+                                prompt_tokens, completion_tokens, outcome)
+
+
+class AgentLLM:
+    """エージェント名を束縛した LLMGateway のビュー"""
+
+    def __init__(self, gateway: LLMGateway, agent: str):
+        self.gateway = gateway
+        self.agent = agent
+        self.model_name = gateway.model_name
+
+    def chat(self, call_site: str, messages, **kwargs) -> str:
+        return self.gateway.chat(self.agent, call_site, messages, **kwargs)
@@ -0,0 +1,211 @@
+# /opt/auto-wiki/src/bot/quality.py
+# 日本語タイトル: 記事品質ゲート（吟味・査読・修正）
+# 目的: 執筆済みのドラフトを投稿前に検査する。まずローカルの簡易スコアで判定し、低い場合だけ
+#       検索結果をバッチ並列で吟味した事実リストを根拠に LLM 査読を行い、時間予算の範囲で修正を繰り返す
+#       どこまで行うか（品質とレイテンシのバランス）はタスクの優先度ごとのプロファイルで切り替える
+#       既存記事の更新では、差分更新で書き直された節だけを査読・修正して元の位置へ戻す（他の節は1バイトも変えない）
+
+import os
+import re
+import time
+from typing import TypedDict
+from src.bot.llm_gateway import LLMGateway, is_chatty
+from src.bot.vetter import InformationVetter
+from src.bot.reviewer import ArticleReviewer
+from src.bot.research_context import ResearchContext
+from src.bot.section_updater import MIN_LENGTH_RATIO, parse_sections, splice_section_body, strip_section_heading
+
+# プロファイル定義
+#   vet_max_batches: 吟味する検索結果のバッチ数（None で全件、0 で吟味せず調査メモをそのまま根拠にする）
+#   review: "off" = 査読しない / "auto" = 簡易スコアが低い場合だけ / "always" = 常に査読
+#   refine_budget_s: 査読・修正ループ全体の時間予算（秒）
+#   max_rounds: 査読 → 修正 の最大回数
+class QualityProfile(TypedDict):
+    vet_max_batches: int | None
+    review: str
+    refine_budget_s: float
+    max_rounds: int
+
+
+QUALITY_PROFILES: dict[str, QualityProfile] = {
+    "fast": {"vet_max_batches": 0, "review": "off", "refine_budget_s": 0, "max_rounds": 0},
+    "balanced": {"vet_max_batches": 2, "review": "auto", "refine_budget_s": 180, "max_rounds": 1},
+    "thorough": {"vet_max_batches": None, "review": "always", "refine_budget_s": 600, "max_rounds": 2},
+}
+# 優先度 -> プロファイル（"下限:プロファイル" のカンマ区切り。優先度がその値以上なら適用）
+# デフォルト: トレンド（8）は速報性重視、通常（5）は必要な時だけ査読、メンテナンス（3）は時間をかけて査読
+QUALITY_BY_PRIORITY = os.getenv("QUALITY_BY_PRIORITY", "8:fast,5:balanced,0:thorough")
+# 簡易スコアがこれ以上なら "auto" プロファイルでは LLM 査読を省略する
+REVIEW_SKIP_SCORE = float(os.getenv("REVIEW_SKIP_SCORE", "0.8"))
+# 吟味の1バッチあたりの検索結果数と並列数
+VET_BATCH_SIZE = 6
+VET_PARALLELISM = int(os.getenv("VET_PARALLELISM", "2"))
+# 吟味に回す検索結果の上限（関連度順の上位だけを LLM に渡す）
+VET_MAX_SOURCES = 24
+# 吟味しない場合に査読の根拠として渡す調査メモの長さ（トークン）
+REVIEW_SOURCE_TOKENS = 2000
+# 十分な長さとみなす記事の文字数（簡易スコアの長さ項目）
+MIN_ARTICLE_CHARS = 2000
+
+_HEADING_RE = re.compile(r"^={2,6}[^=\n]+={2,6}\s*$", re.MULTILINE)
+_NUMBER_RE = re.compile(r"\d[\d,.]*\d|\d")
+_FAILED_MARKER = "(Content generation failed)"
+
+
+def _parse_priority_map(spec: str) -> list:
+    """ "8:fast,5:balanced,0:thorough" -> [(8, "fast"), (5, "balanced"), (0, "thorough")]（下限の降順）"""
+    mapping = []
+    for item in spec.split(","):
+        if ":" not in item:
+            continue
+        threshold, name = item.split(":", 1)
+        name = name.strip()
+        if name not in QUALITY_PROFILES:
+            print(f"⚠️ Unknown quality profile '{name}' in QUALITY_BY_PRIORITY. Ignored.")
+            continue
+        try:
+            mapping.append((int(threshold), name))
+        except ValueError:
+            continue
+    return sorted(mapping, reverse=True)
+
+
+_PRIORITY_MAP = _parse_priority_map(QUALITY_BY_PRIORITY)
+
+
+def profile_for_priority(priority: int | None) -> str:
+    """タスクの優先度に対応するプロファイル名（該当なしは "balanced"）"""
+    for threshold, name in _PRIORITY_MAP:
+        if (priority if priority is not None else 5) >= threshold:
+            return name
+    return "balanced"
+
+
+def heuristic_score(topic: str, draft: str, source_text: str, baseline: str = "") -> float:
+    """
+    LLM を使わない簡易品質スコア（0〜1）。
+    構造（導入部の太字・見出し数）、長さ、数値の裏付け（ドラフト中の数値が出典に現れる割合）から求める。
+    baseline（更新前の記事）にもともとあった行は裏付けの判定対象にしない
+    """
+    if not draft.strip() or _FAILED_MARKER in draft or is_chatty(draft):
+        return 0.0
+
+    headings = len(_HEADING_RE.findall(draft))
+    structure = 0.5 * (f"'''{topic}'''" in draft or draft.lstrip().startswith("'''")) + 0.5 * min(1.0, headings / 3)
+    length = min(1.0, len(draft) / MIN_ARTICLE_CHARS)
+
+    old_lines = set(baseline.splitlines())
+    new_text = "\n".join(line for line in draft.splitlines() if line not in old_lines)
+    numbers = {n.replace(",", "") for n in _NUMBER_RE.findall(new_text) if len(n) >= 2}
+    if numbers:
+        normalized_sources = source_text.replace(",", "")
+        grounding = sum(1 for n in numbers if n in normalized_sources) / len(numbers)
+    else:
+        grounding = 1.0
+
+    return round(0.3 * structure + 0.3 * length + 0.4 * grounding, 3)
+
+
+class QualityGate:
+    def __init__(self, llm: LLMGateway, lang: str = "ja", vetter: InformationVetter | None = None,
+                 reviewer: ArticleReviewer | None = None):
+        self.vetter = vetter or InformationVetter(llm, lang=lang)
+        self.reviewer = reviewer or ArticleReviewer(llm, lang=lang)
+
+    def check(self, topic: str, draft: str, research: ResearchContext, priority: int | None = None, baseline: str = "") -> str:
+        """
+        ドラフトを検査し、必要なら修正したものを返す（修正できなかった場合は元のドラフト）。
+        baseline: 既存記事の更新時は更新前の本文（変更のない部分をスコアの対象外にし、査読・修正は変更された節だけに行う）
+        """
+        name = profile_for_priority(priority)
+        profile = QUALITY_PROFILES[name]
+        if profile["review"] == "off":
+            print(f"   ⏩ Quality profile '{name}': review disabled.")
+            return draft
+
+        sources = research.ranked()
+        score = heuristic_score(topic, draft, "\n".join(s["body"] for s in sources), baseline)
+        if profile["review"] == "auto" and score >= REVIEW_SKIP_SCORE:
+            print(f"   ✅ Heuristic quality score {score:.2f} >= {REVIEW_SKIP_SCORE}. Skipping LLM review.")
+            return draft
+        print(f"   🔎 Quality profile '{name}' (heuristic score {score:.2f}): reviewing draft...")
+
+        deadline = time.monotonic() + profile["refine_budget_s"]
+        if not baseline:
+            return self._refine(topic, draft, self._evidence(topic, research, profile), profile, deadline)
+
+        sections = parse_sections(draft)
+        old_sections = parse_sections(baseline)
+        # 差分更新は節の数と見出しを変えない。揃っていなければ書き直された節を特定できないので、そのまま投稿する
+        if [s["heading"] for s in sections] != [s["heading"] for s in old_sections]:
+            print("   ⚠️ Section layout differs from the previous article. Skipping review.")
+            return draft
+        changed = [i for i, (new, old) in enumerate(zip(sections, old_sections)) if new["body"] != old["body"]]
+        if not changed:
+            return draft
+
+        evidence = self._evidence(topic, research, profile)
+        for i in changed:
+            sections[i] = self._refine_section(topic, sections[i], evidence, profile, deadline)
+        return "".join(s["heading"] + s["body"] for s in sections)
+
+    def _refine(self, topic: str, draft: str, evidence: str, profile: QualityProfile, deadline: float, section: dict | None = None) -> str:
+        """
+        査読 → 修正 を max_rounds 回まで、deadline までに終わる範囲で繰り返す。
+        section: 1つの節だけを査読・修正する場合はその節（draft は見出し行を除いた本文で、節の本文を返す）
+        """
+        title = None if section is None else (section["title"] or "Introduction")
+        last_refine = 0.0
+        for round_no in range(profile["max_rounds"]):
+            approved, feedback = self.reviewer.review_draft(topic, draft, evidence, section=title)
+            if approved:
+                break
+            remaining = deadline - time.monotonic()
+            # 前回の修正と同じだけ時間がかかると見込み、予算内に終わらないなら打ち切る
+            if remaining <= max(last_refine, 1.0):
+                print(f"   ⏱️ Refine budget exhausted ({profile['refine_budget_s']}s). Publishing current draft.")
+                break
+            started = time.monotonic()
+            refined = self.reviewer.refine_draft(topic, draft, feedback, timeout=remaining, section=title)
+            last_refine = time.monotonic() - started
+            if section is None:
+                refined = refined.replace("```wikitext", "").replace("```", "").strip()
+            else:
+                refined = strip_section_heading(section, refined)
+            if is_chatty(refined) or len(refined) < len(draft) * MIN_LENGTH_RATIO or \
+                    (section is not None and not self._is_section_body(topic, section, refined)):
+                print(f"   ⚠️ Refined draft rejected (round {round_no + 1}). Keeping previous draft.")
+                break
+            draft = refined
+        return draft
+
+    def _refine_section(self, topic: str, section: dict, evidence: str, profile: QualityProfile, deadline: float) -> dict:
+        """書き直された1つの節を査読・修正し、元の見出し行と前後の改行を保って返す"""
+        original = section["body"].strip()
+        body = self._refine(topic, original, evidence, profile, deadline, section=section)
+        if body == original:
+            return section
+        return splice_section_body(section, body)
+
+    @staticmethod
+    def _is_section_body(topic: str, section: dict, body: str) -> bool:
+        """
+        修正結果が節の本文だけになっているか。
+        見出し行を含む（他の節まで出力した）ものや、導入部のように太字のトピック名で始まるもの（記事全体を出力した）は、
+        そのまま節に戻すと導入部や見出しが重複するため使わない
+        """
+        if _HEADING_RE.search(body):
+            return False
+        return not section["title"] or not body.startswith(f"'''{topic}'''")
+
+    def _evidence(self, topic: str, research: ResearchContext, profile: QualityProfile) -> str:
+        """査読の根拠: 吟味した事実リスト（吟味しない・何も残らない場合は調査メモ）"""
+        if profile["vet_max_batches"] != 0:
+            raw_results = [{"title": s["title"], "href": s["url"], "body": s["body"]} for s in research.ranked()[:VET_MAX_SOURCES]]
+            vetted = self.vetter.vet_in_batches(
+                topic, raw_results, batch_size=VET_BATCH_SIZE, parallelism=VET_PARALLELISM,
+                max_batches=profile["vet_max_batches"]
+            )
+            if vetted:
+                return vetted
+        return research.render(REVIEW_SOURCE_TOKENS)
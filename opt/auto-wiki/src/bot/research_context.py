@@ -0,0 +1,229 @@
+# /opt/auto-wiki/src/bot/research_context.py
+# 日本語タイトル: 調査結果コンテキスト
+# 目的: 事前フィルター済みの検索結果を逐次追加しながら、URL重複とミラーサイト等のほぼ同一本文（MinHash）を除外し、
+#       トピックとの関連度順に並べて、指定トークン数に収まる調査メモを必要な時だけ生成する
+#       セクション執筆用には、出典を一度だけ埋め込み、共通の調査メモの中から見出しに意味的に近い出典の番号を選ぶ
+#       指紋用の検索（トピック名そのものを毎回 Web で検索した結果）の MinHash で、前回の調査から実質的に変化したかを判定できる
+
+import hashlib
+import math
+import re
+from collections import Counter
+from src.utils.token_budget import count_tokens
+
+_NUM_PERM = 64
+# 推定 Jaccard 類似度がこれ以上なら同じ本文とみなす
+_DUP_THRESHOLD = 0.8
+_MASK = (1 << 64) - 1
+# MinHash 用のハッシュ関数群（64bit 乗算ハッシュのパラメーター）
+_PERMS = [
+    (int.from_bytes(hashlib.sha1(f"a{i}".encode()).digest()[:8], "big") | 1,
+     int.from_bytes(hashlib.sha1(f"b{i}".encode()).digest()[:8], "big"))
+    for i in range(_NUM_PERM)
+]
+# 関連度計算用: CJK は2文字ずつ、英数字は単語単位
+_TERM_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+|[A-Za-z0-9]+")
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    """空白を詰めた文字 n-gram（日本語でも単語分割なしで使える）"""
+    normalized = re.sub(r"\s+", " ", text.lower()).strip()
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def _minhash(shingles: set) -> tuple:
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+    if not hashes:
+        return ()
+    return tuple(min(((a * h + b) & _MASK) for h in hashes) for a, b in _PERMS)
+
+
+def _similarity(sig_a: tuple, sig_b: tuple) -> float:
+    if not sig_a or not sig_b:
+        return 0.0
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / _NUM_PERM
+
+
+def fingerprint_similarity(a: str, b: str) -> float:
+    """2つの調査結果の指紋から、本文集合の Jaccard 類似度を推定する（形式が異なれば 0）"""
+    if not a or not b or len(a) != len(b):
+        return 0.0
+    size = len(a) // _NUM_PERM
+    return sum(1 for i in range(0, len(a), size) if a[i:i + size] == b[i:i + size]) / _NUM_PERM
+
+
+def normalize_vector(vector) -> list:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def extract_terms(text: str) -> set:
+    terms = set()
+    for piece in _TERM_RE.findall(text.lower()):
+        if piece.isascii():
+            terms.add(piece)
+        elif len(piece) == 1:
+            terms.add(piece)
+        else:
+            terms.update(piece[i:i + 2] for i in range(len(piece) - 1))
+    return terms
+
+
+class ResearchContext:
+    def __init__(self, topic: str):
+        self.topic = topic
+        self._topic_terms = extract_terms(topic)
+        self._sources: list[dict] = []
+        self._seen_urls: set[str] = set()
+        self._signatures: list[tuple] = []
+        # 指紋用の検索結果の署名（重複除外の対象外。取得元や取り込み順によらず同じ結果なら同じ指紋になる）
+        self._anchor_signatures: list[tuple] = []
+        self._render_cache: dict[tuple[int, int], tuple[str, list[dict]]] = {}
+        self.duplicates = 0
+        # 取り込む前に事前フィルター（src.bot.source_filter）で除外された件数（理由ごと）
+        self.filtered: Counter[str] = Counter()
+
+    def __len__(self):
+        return len(self._sources)
+
+    def add(self, results: list, anchor: bool = False) -> int:
+        """
+        新しい検索結果だけを取り込む（ドメイン・言語・関連度の判定は事前フィルターで済ませておく）。
+        結果に "vector"（正規化済みの埋め込み）と "similarity" があれば、再計算せずに使う。
+        anchor: 指紋用の検索（毎回同じクエリで Web から取得した結果）。URL・本文の重複に関係なく指紋に含める
+        Returns: 追加された出典の数
+        """
+        added = 0
+        for res in results:
+            url = res.get('href', '')
+            body = res.get('body', '') or res.get('snippet', '')
+            signature = None
+            if anchor:
+                signature = _minhash(_shingles(body))
+                self._anchor_signatures.append(signature)
+            if url in self._seen_urls:
+                continue
+            self._seen_urls.add(url)
+
+            title = res.get('title', 'No Title')
+            if signature is None:
+                signature = _minhash(_shingles(body))
+            # ミラーサイトや転載記事など、本文がほぼ同じものは除外
+            if any(_similarity(signature, other) >= _DUP_THRESHOLD for other in self._signatures):
+                self.duplicates += 1
+                continue
+            self._signatures.append(signature)
+            source = {
+                "title": title,
+                "url": url,
+                "body": body,
+                "score": self._relevance(title, body, res.get("similarity")),
+                "order": len(self._sources),
+            }
+            if res.get("vector") is not None:
+                source["vector"] = res["vector"]
+            self._sources.append(source)
+            added += 1
+        if added:
+            self._render_cache.clear()
+        return added
+
+    def fingerprint(self) -> str:
+        """
+        指紋用の検索結果（add(..., anchor=True)）の本文をまとめた MinHash（16進文字列。無ければ ""）。
+        調査コーパスから再利用した出典や LLM が毎回変える追加クエリの結果は含めないため、
+        初回と再調査で同じ条件の指紋になる。和集合の MinHash は各出典の署名の要素ごとの最小値なので、追加の計算は不要
+        """
+        signatures = [sig for sig in self._anchor_signatures if sig]
+        if not signatures:
+            return ""
+        return "".join(f"{min(values):016x}" for values in zip(*signatures))
+
+    def _relevance(self, title: str, body: str, similarity: float | None = None) -> float:
+        """トピック語の出現率（タイトル重視）と本文量、あれば埋め込みの類似度から関連度を求める"""
+        semantic = 2.0 * similarity if similarity is not None else 0.0
+        if not self._topic_terms:
+            return semantic
+        title_hit = len(self._topic_terms & extract_terms(title)) / len(self._topic_terms)
+        body_hit = len(self._topic_terms & extract_terms(body)) / len(self._topic_terms)
+        return 2.0 * title_hit + body_hit + 0.1 * math.log1p(len(body) / 100) + semantic
+
+    def ranked(self) -> list:
+        """関連度の高い順（同点は取得順）の出典リスト"""
+        return sorted(self._sources, key=lambda s: (-s["score"], s["order"]))
+
+    def render(self, max_tokens: int, max_sources: int = 30) -> str:
+        """関連度順に、max_tokens に収まるだけの出典を調査メモとして整形する"""
+        return self._render(max_tokens, max_sources)[0]
+
+    def _render(self, max_tokens: int, max_sources: int) -> tuple:
+        """Returns: (調査メモ, メモに含めた出典のリスト（[Source n] の n-1 番目）)"""
+        key = (max_tokens, max_sources)
+        cached = self._render_cache.get(key)
+        if cached is not None:
+            return cached
+        included: list[dict] = []
+        text = self._format(self.ranked()[:max_sources], max_tokens, included)
+        self._render_cache[key] = (text, included)
+        return text, included
+
+    def sources_for_queries(self, queries: list, max_tokens: int, embedder, top_k: int = 6) -> list:
+        """
+        render(max_tokens) の調査メモに含まれる出典のうち、各クエリ（セクション見出しなど）に意味的に近い上位 top_k 件の番号。
+        全セクションで同じ調査メモを共有したまま、セクションごとに参照すべき出典だけを指示するために使う。
+        出典の埋め込みは初回だけ計算し、クエリはまとめて1回で埋め込む。
+        Returns: queries と同じ順の [Source n] の番号リスト（埋め込みに失敗した場合は空リスト）
+        """
+        if not queries:
+            return []
+        included = self._render(max_tokens, 30)[1]
+        try:
+            self._ensure_vectors(embedder)
+            query_vectors = [normalize_vector(v) for v in embedder.embed(list(queries))]
+        except Exception as e:
+            print(f"⚠️ Source embedding failed, sections will use all notes: {e}")
+            return [[] for _ in queries]
+
+        numbers = []
+        for query_vector in query_vectors:
+            nearest = sorted(
+                range(len(included)),
+                key=lambda n: -sum(a * b for a, b in zip(query_vector, included[n]["vector"]))
+            )[:top_k]
+            numbers.append(sorted(n + 1 for n in nearest))
+        return numbers
+
+    def embedded_sources(self, embedder) -> list:
+        """埋め込みベクトル（正規化済み、"vector" キー）付きの出典リストを関連度順に返す"""
+        self._ensure_vectors(embedder)
+        return self.ranked()
+
+    def _ensure_vectors(self, embedder):
+        """まだ埋め込んでいない出典だけをまとめて埋め込む"""
+        missing = [s for s in self._sources if "vector" not in s]
+        if not missing:
+            return
+        vectors = embedder.embed([f"{s['title']}\n{s['body']}" for s in missing])
+        for source, vector in zip(missing, vectors):
+            source["vector"] = normalize_vector(vector)
+
+    def _format(self, sources: list, max_tokens: int, included: list | None = None) -> str:
+        """出典リストを順に、max_tokens に収まるだけ整形する（included を渡すと採用した出典を順に追加する）"""
+        parts: list[str] = []
+        used = 0
+        for source in sources:
+            block = f"[Source {len(parts) + 1}] Title: {source['title']}\nURL: {source['url']}\nContent: {source['body']}\n\n"
+            tokens = count_tokens(block)
+            if used + tokens > max_tokens:
+                if parts:
+                    continue
+                # 最初の1件も入らない場合は本文を詰めて入れる
+                block = block[:max(0, int(len(block) * max_tokens / tokens))]
+                tokens = max_tokens
+            parts.append(block)
+            used += tokens
+            if included is not None:
+                included.append(source)
+        return "".join(parts)
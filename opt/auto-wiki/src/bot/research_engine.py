@@ -0,0 +1,63 @@
+# /opt/auto-wiki/src/bot/research_engine.py
+# 日本語タイトル: 非同期リサーチエンジン
+# 目的: プロセス内で1つのイベントループと長寿命のスレッドプールを共有し、複数トピックの調査を並行に進める
+#       （検索の同時実行数はトピックをまたいだ全体の予算で制限する）
+#       検索は専用のスレッドプールで実行し、応答しない検索が LLM 呼び出し・事前フィルター・コーパス参照のスレッドを奪わないようにする
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 全トピック合計での検索の同時実行数
+RESEARCH_CONCURRENCY = int(os.getenv("RESEARCH_CONCURRENCY", "4"))
+# LLM による計画・分析、事前フィルター、コーパス参照などのブロッキング処理を並行に実行するスレッド数
+RESEARCH_CALL_WORKERS = int(os.getenv("RESEARCH_CALL_WORKERS", "8"))
+# 発行済みクエリのうちこの割合が返ってきたら、残りを待たずに次の分析を始める
+RESEARCH_QUORUM = float(os.getenv("RESEARCH_QUORUM", "0.6"))
+
+
+class ResearchEngine:
+    def __init__(self, concurrency: int = RESEARCH_CONCURRENCY, call_workers: int = RESEARCH_CALL_WORKERS):
+        self.concurrency = max(1, concurrency)
+        # 検索専用（スレッド数 = 同時実行の予算。待ち時間の上限は検索クライアント側で守る）
+        self.search_executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="research-search")
+        # 検索以外のブロッキング処理用
+        self.executor = ThreadPoolExecutor(max_workers=max(1, call_workers), thread_name_prefix="research")
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self._thread = threading.Thread(target=self._run_loop, name="research-loop", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro):
+        """コルーチンをエンジンのイベントループで実行し、結果を待つ（ワーカースレッドから呼ぶ）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def call(self, fn, *args):
+        """ブロッキング関数（LLM呼び出しなど）を共有スレッドプールで実行する"""
+        return await self.loop.run_in_executor(self.executor, fn, *args)
+
+    async def search(self, fn, query: str):
+        """
+        全体予算（検索専用スレッドプール）の枠内で検索を1件実行する。
+        外側で打ち切るとスレッドが検索を続けたまま枠だけが空くため、タイムアウトは fn（検索クライアント）の中で守ること
+        """
+        return await self.loop.run_in_executor(self.search_executor, fn, query)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_research_engine() -> ResearchEngine:
+    """プロセス共有のリサーチエンジンを返す"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ResearchEngine()
+    return _engine
@@ -2,73 +2,175 @@
 # 日本語タイトル: 反復型深層リサーチエージェント (Iterative Deep Research)
 # 目的: 検索→分析→不足情報の再検索というサイクルを回し、網羅的な情報を収集する
 
-from duckduckgo_search import DDGS
-from openai import OpenAI
+import asyncio
+import functools
 import json
-import concurrent.futures
+import math
+from src.bot.llm_gateway import LLMGateway
+from src.bot.research_context import ResearchContext
+from src.bot.research_engine import RESEARCH_QUORUM, get_research_engine
+from src.bot.search import SearchClient, get_search_client
+from src.bot.source_filter import SourceFilter, get_source_filter
+from src.rag.research_corpus import ResearchCorpus
+
+# 不足情報の分析に渡す調査メモの長さ（トークン）
+ANALYSIS_CONTEXT_TOKENS = 1500
+# conduct_deep_research が返す調査メモ全体の長さ（トークン）
+RESEARCH_NOTES_TOKENS = 8000
+# 1クエリの検索件数と、Web検索を省略するのに必要な調査コーパスのヒット数
+SEARCH_LIMIT = 5
+CORPUS_MIN_HITS = 3
+# 調査結果の指紋に使う、トピック名そのものの検索の件数（調査コーパスを使わず毎回 Web から取得する）
+FINGERPRINT_SEARCH_LIMIT = 10
 
 class DeepResearcher:
-    def __init__(self, client: OpenAI, model_name: str, lang: str = "ja"):
-        self.client = client
-        self.model_name = model_name
+    def __init__(self, llm: LLMGateway, lang: str = "ja", search_client: SearchClient | None = None,
+                 source_filter: SourceFilter | None = None, corpus: ResearchCorpus | None = None):
+        self.llm = llm.for_agent("researcher")
         self.lang = lang
+        # 検索はキャッシュ・レート制限付きの共有クライアント経由
+        self.search_client = search_client or get_search_client()
+        # 検索結果は LLM に渡る前に、ブロックリスト・言語・トピックとの類似度でローカルに絞り込む
+        self.source_filter = source_filter or get_source_filter(lang)
+        # 取得済み出典の永続ストア（Web検索の前に引く一次ソース。None なら常に Web 検索）
+        self.corpus = corpus
+        # 検索・分析の並行実行はプロセス共有のエンジン（イベントループ + スレッドプール）で行う
+        self.engine = get_research_engine()
 
     def conduct_deep_research(self, topic: str, max_iterations: int = 2) -> str:
+        """反復型の深層調査を行い、調査メモを文字列で返す"""
+        return self.research(topic, max_iterations).render(RESEARCH_NOTES_TOKENS)
+
+    def research(self, topic: str, max_iterations: int = 2, reuse_corpus: bool = True) -> ResearchContext:
         """
         反復型の深層調査を行う
         1. 初期調査（広範囲）
         2. 不足情報の分析と追加調査（反復）
+        検索・分析は共有のリサーチエンジン上で非同期に進める。
+        reuse_corpus: False なら調査コーパスを引かず、すべて Web 検索する（取得した出典の保存は行う）
+        Returns: 重複除外・関連度順の調査結果（用途ごとに render(トークン数) で整形する）
+        """
+        return self.engine.run(self._research_async(topic, max_iterations, reuse_corpus))
+
+    async def _research_async(self, topic: str, max_iterations: int, reuse_corpus: bool = True) -> ResearchContext:
+        """
+        検索→整形→不足情報の分析をパイプライン化する。
+        発行したクエリの一定割合（RESEARCH_QUORUM）が返った時点で分析を始め、残りの検索は裏で継続させる
         """
         print(f"🕵️ Deep Researching for: {topic} (Iterative Mode)")
-        
+        engine = self.engine
+        context = ResearchContext(topic)
+        pending = set()
+        corpus_stats = {"hits": 0, "skipped_searches": 0}
+
+        async def fetch(query, anchor=False):
+            """
+            調査コーパス → （ヒットが足りなければ）Web検索 → 事前フィルター
+            （Chroma の参照と埋め込み計算はイベントループを塞がないようスレッドプールで）
+            anchor: 指紋用の検索。初回と再調査で同じ条件になるよう、コーパスを引かずに必ず Web から取得する
+            """
+            cached = []
+            if self.corpus and reuse_corpus and not anchor:
+                try:
+                    cached = await engine.call(self.corpus.lookup, query, SEARCH_LIMIT)
+                except Exception as e:
+                    print(f"      ⚠️ Research corpus lookup failed: {e}")
+            corpus_stats["hits"] += len(cached)
+            if len(cached) >= CORPUS_MIN_HITS:
+                corpus_stats["skipped_searches"] += 1
+                return await engine.call(self.source_filter.filter, topic, cached)
+
+            search = functools.partial(self._search, limit=FINGERPRINT_SEARCH_LIMIT) if anchor else self._search
+            results = cached + (await engine.search(search, query) or [])
+            if not results:
+                return [], None
+            kept, rejected = await engine.call(self.source_filter.filter, topic, results)
+            # 新たに Web から取得した出典だけをコーパスに保存する
+            cached_urls = {res["href"] for res in cached}
+            fetched = [res for res in kept if res.get("href") not in cached_urls]
+            if self.corpus and fetched:
+                try:
+                    await engine.call(self.corpus.add, topic, fetched)
+                except Exception as e:
+                    print(f"      ⚠️ Research corpus write failed: {e}")
+            return kept, rejected
+
+        anchors = set()
+
+        def launch(queries, anchor=False):
+            for q in queries:
+                task = asyncio.ensure_future(fetch(q, anchor))
+                pending.add(task)
+                if anchor:
+                    anchors.add(task)
+
+        def absorb(tasks):
+            for task in tasks:
+                pending.discard(task)
+                try:
+                    data, rejected = task.result()
+                    if rejected:
+                        context.filtered.update(rejected)
+                    if data:
+                        context.add(data, anchor=task in anchors)
+                except (asyncio.TimeoutError, TimeoutError):
+                    print("      ⏱️ Search timed out.")
+                except Exception as e:
+                    print(f"      ❌ Search error: {e}")
+
+        async def gather(quorum: float):
+            """未完了の検索のうち quorum の割合が終わるまで待つ（1.0 なら全件）"""
+            need = math.ceil(len(pending) * quorum)
+            finished = 0
+            while pending and finished < need:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                absorb(done)
+                finished += len(done)
+
         # Phase 1: 初期調査 (Initial Breadth Search)
-        # 基本的な観点（歴史、概要、仕組みなど）を網羅する
-        initial_plan = self._create_initial_plan(topic)
+        # トピック名そのものの検索は計画立案と並行して始める（調査結果の指紋にも使う）
+        launch([topic], anchor=True)
+        initial_plan = await engine.call(self._create_initial_plan, topic)
         print(f"   📋 Initial Plan: {initial_plan}")
-        
-        current_context = []
-        queries = [topic] + [f"{topic} {sub}" for sub in initial_plan]
-        current_context.extend(self._execute_parallel_search(queries))
-        
+        launch([f"{topic} {sub}" for sub in initial_plan])
+        await gather(RESEARCH_QUORUM)
+
         # Phase 2: 反復調査 (Iterative Depth Search)
-        formatted_text = self._process_results(current_context)
-        
+        formatted_text = context.render(ANALYSIS_CONTEXT_TOKENS)
+
         for i in range(max_iterations):
             print(f"   🔄 Iteration {i+1}/{max_iterations}: Analyzing missing information...")
-            
-            # 現在の情報で足りないものを分析
-            missing_queries = self._identify_missing_info(topic, formatted_text)
-            
+
+            # 現在の情報で足りないものを分析（その間も未完了の検索は進む）
+            missing_queries = await engine.call(self._identify_missing_info, topic, formatted_text)
+            absorb([task for task in list(pending) if task.done()])
+
             if not missing_queries:
                 print("   ✅ Sufficient information gathered.")
                 break
-                
+
             print(f"   🔍 Digging deeper into: {missing_queries}")
-            new_results = self._execute_parallel_search(missing_queries)
-            
-            if not new_results:
+            before = len(context)
+            launch(missing_queries)
+            await gather(RESEARCH_QUORUM)
+
+            if len(context) == before and not pending:
                 print("   ⚠️ No new info found.")
                 break
-                
-            current_context.extend(new_results)
-            # コンテキストを更新して次のループへ
-            formatted_text = self._process_results(current_context)
 
-        return formatted_text
+            # コンテキストを更新して次のループへ
+            formatted_text = context.render(ANALYSIS_CONTEXT_TOKENS)
 
-    def _execute_parallel_search(self, queries: list) -> list:
-        """クエリリストを並列実行して結果を返す"""
-        results = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_query = {executor.submit(self._search, q): q for q in queries}
-            for future in concurrent.futures.as_completed(future_to_query):
-                try:
-                    data = future.result()
-                    if data:
-                        results.extend(data)
-                except Exception as e:
-                    print(f"      ❌ Search error: {e}")
-        return results
+        # 残りの検索結果を取り込んでから返す
+        await gather(1.0)
+        if context.duplicates:
+            print(f"   🧹 Skipped {context.duplicates} near-duplicate sources.")
+        if context.filtered:
+            print(f"   🛡️  Pre-filtered {sum(context.filtered.values())} results: {dict(context.filtered)}")
+        if corpus_stats["hits"]:
+            print(f"   📚 Reused {corpus_stats['hits']} sources from the research corpus "
+                  f"({corpus_stats['skipped_searches']} web searches skipped).")
+        return context
 
     def _create_initial_plan(self, topic: str) -> list:
         """初期調査計画の立案"""
@@ -77,12 +179,12 @@ class DeepResearcher:
         else:
             prompt = f'「{topic}」をWikipediaレベルで解説するために必須となる4つの観点をJSONリストで挙げてください。例: ["歴史", "仕組み", "問題点", "社会的影響"]'
 
-        return self._get_json_list(prompt)
+        return self._get_json_list("initial_plan", prompt)
 
     def _identify_missing_info(self, topic: str, current_text: str) -> list:
         """現在の調査結果を評価し、追加で調べるべき具体的な検索クエリを生成する"""
-        # コンテキストが長すぎる場合は要約してから渡すなどの工夫が必要だが、ここでは先頭4000文字で判断させる
-        short_context = current_text[:4000]
+        # 関連度順に ANALYSIS_CONTEXT_TOKENS 分へ整形済みのメモを受け取る
+        short_context = current_text
         
         if self.lang == "en":
             prompt = f"""
@@ -105,19 +207,13 @@ class DeepResearcher:
             これ以上調査が不要な場合は [] を出力してください。
             """
             
-        return self._get_json_list(prompt)
+        return self._get_json_list("identify_missing_info", prompt)
 
-    def _get_json_list(self, prompt: str) -> list:
+    def _get_json_list(self, call_site: str, prompt: str) -> list:
         """LLMからJSONリストを堅牢に取得するヘルパー"""
         try:
-            resp = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            
             # --- 修正: contentがNoneの場合をガード ---
-            raw_content = resp.choices[0].message.content
+            raw_content = self.llm.chat(call_site, prompt, temperature=0.3)
             if not raw_content:
                 return []
             content = raw_content.strip()
@@ -135,37 +231,12 @@ class DeepResearcher:
         except Exception:
             return []
 
-    def _search(self, query: str, limit: int = 5) -> list:
-        """DuckDuckGo検索実行"""
+    def _search(self, query: str, limit: int = SEARCH_LIMIT) -> list:
+        """Web検索実行（キャッシュ済みの結果があれば再検索しない）"""
         results = []
         try:
             region = "jp-jp" if self.lang == "ja" else "us-en"
-            with DDGS() as ddgs:
-                raw_res = ddgs.text(query, region=region, max_results=limit)
-                if raw_res:
-                    results.extend(raw_res)
+            results.extend(self.search_client.search(query, region=region, limit=limit))
         except Exception as e:
             print(f"⚠️ Search failed for '{query}': {e}")
         return results
-
-    def _process_results(self, raw_results: list) -> str:
-        """結果の整形（重複排除・ブラックリスト適用）"""
-        seen_urls = set()
-        formatted_text = ""
-        blocked = ["spam.com", "example.com"] 
-
-        idx = 1
-        for res in raw_results:
-            url = res.get('href', '')
-            if url in seen_urls or any(d in url for d in blocked):
-                continue
-            
-            seen_urls.add(url)
-            title = res.get('title', 'No Title')
-            body = res.get('body', '')
-            
-            formatted_text += f"[Source {idx}] Title: {title}\nURL: {url}\nContent: {body}\n\n"
-            idx += 1
-            if idx > 30: break # Deepモードなので少し多めに許容
-                
-        return formatted_text
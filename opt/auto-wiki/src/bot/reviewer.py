@@ -2,28 +2,69 @@
 # 日本語タイトル: 記事品質レビューエージェント
 # 目的: 生成された記事ドラフトを批評し、品質基準（ハルシネーション、中立性）を満たしているか判定する
 
-from openai import OpenAI
+from src.bot.llm_gateway import LLMGateway
+from src.utils.token_budget import PromptBudget, count_tokens
+
+# 査読結果（PASS / FAIL + 修正指示）の出力用に確保するトークン数
+REVIEW_OUTPUT_TOKENS = 512
 
 class ArticleReviewer:
-    def __init__(self, client: OpenAI, model_name: str, lang: str = "ja"):
-        self.client = client
-        self.model_name = model_name
+    def __init__(self, llm: LLMGateway, lang: str = "ja"):
+        self.llm = llm.for_agent("reviewer")
         self.lang = lang
 
-    def review_draft(self, topic: str, draft: str, sources: str) -> tuple[bool, str]:
+    def review_draft(self, topic: str, draft: str, sources: str, section: str | None = None) -> tuple[bool, str]:
         """
         ドラフトをレビューする。
+        section: 記事の1つの節だけを査読する場合はその見出し（draft は見出し行を除いた節の本文。構造は査読しない）
         Returns: (is_approved: bool, feedback: str)
         """
         print(f"🧐 Reviewing draft for: {topic}...")
 
         if self.lang == "en":
             system_prompt = "You are a strict Wikipedia editor/reviewer."
-            prompt = f"""
+        else:
+            system_prompt = "あなたは厳格なWikipediaの編集・査読者です。"
+        # ソースとドラフトをコンテキスト長に収まるよう 1:3 の比で切り詰める（ドラフトは末尾も残す）
+        parts = PromptBudget(reserve_output=REVIEW_OUTPUT_TOKENS).allocate(
+            system_prompt + self._build_review_prompt(topic, "", "", section),
+            {"sources": sources, "draft": draft},
+            weights={"sources": 1, "draft": 3},
+            keep_tail={"draft"}
+        )
+        prompt = self._build_review_prompt(topic, parts["draft"], parts["sources"], section)
+
+        try:
+            content = self.llm.chat(
+                "review_draft",
+                [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.1
+            )
+            result = content.strip() if content else ""
+            
+            if result.startswith("PASS"):
+                print("✅ Review Passed.")
+                return True, "OK"
+            else:
+                print(f"🛑 Review Failed. Feedback: {result}")
+                return False, result
+        except Exception as e:
+            print(f"⚠️ Review process failed: {e}")
+            # エラー時は安全のためPASS扱い（またはFAIL扱い）にするが、ここでは進行を優先してPASS
+            return True, "Review Error (Skipped)"
+
+    def _build_review_prompt(self, topic: str, draft: str, sources: str, section: str | None = None) -> str:
+        if section is not None:
+            return self._build_section_review_prompt(topic, draft, sources, section)
+        if self.lang == "en":
+            return f"""
             Please review the following article draft for the topic "{topic}".
             
             # Trusted Sources
-            {sources[:2000]}...
+            {sources}
 
             # Draft Content
             {draft}
@@ -37,12 +78,11 @@ class ArticleReviewer:
             If there are major issues, output "FAIL" followed by specific instructions for revision.
             """
         else:
-            system_prompt = "あなたは厳格なWikipediaの編集・査読者です。"
-            prompt = f"""
+            return f"""
             トピック「{topic}」の記事ドラフトを査読してください。
             
             # 信頼できるソース情報
-            {sources[:2000]}...
+            {sources}
 
             # ドラフト内容
             {draft}
@@ -56,35 +96,83 @@ class ArticleReviewer:
             重大な問題がある場合は、"FAIL" と出力した後に、具体的な修正指示を箇条書きで記述してください。
             """
 
-        try:
-            resp = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1
-            )
-            # result = resp.choices[0].message.content.strip() を以下に変更
-            content = resp.choices[0].message.content
-            result = content.strip() if content else ""
-            
-            if result.startswith("PASS"):
-                print("✅ Review Passed.")
-                return True, "OK"
-            else:
-                print(f"🛑 Review Failed. Feedback: {result}")
-                return False, result
-        except Exception as e:
-            print(f"⚠️ Review process failed: {e}")
-            # エラー時は安全のためPASS扱い（またはFAIL扱い）にするが、ここでは進行を優先してPASS
-            return True, "Review Error (Skipped)"
+    def _build_section_review_prompt(self, topic: str, draft: str, sources: str, section: str) -> str:
+        if self.lang == "en":
+            return f"""
+            Please review the section "{section}" of the article "{topic}".
+            This is a single section, not the whole article: do not judge the overall article structure.
+
+            # Trusted Sources
+            {sources}
 
-    def refine_draft(self, topic: str, original_draft: str, feedback: str) -> str:
-        """レビュー結果に基づいてドラフトを修正する"""
+            # Section Content
+            {draft}
+
+            # Review Criteria
+            1. **Accuracy**: Is there any information not supported by the sources? (Hallucination check)
+            2. **Neutrality**: Is the tone objective and neutral?
+
+            If the section is good enough to publish, output only "PASS".
+            If there are major issues, output "FAIL" followed by specific instructions for revision.
+            """
+        else:
+            return f"""
+            記事「{topic}」の節「{section}」を査読してください。
+            これは記事全体ではなく1つの節です。記事全体の構成は査読の対象にしないでください。
+
+            # 信頼できるソース情報
+            {sources}
+
+            # 節の内容
+            {draft}
+
+            # 査読基準
+            1. **正確性**: ソースにない虚偽の情報（ハルシネーション）が含まれていませんか？
+            2. **中立性**: 表現は客観的で中立的ですか？
+
+            投稿に値する品質であれば、"PASS" とだけ出力してください。
+            重大な問題がある場合は、"FAIL" と出力した後に、具体的な修正指示を箇条書きで記述してください。
+            """
+
+    def refine_draft(self, topic: str, original_draft: str, feedback: str, timeout: float | None = None,
+                     section: str | None = None) -> str:
+        """
+        レビュー結果に基づいてドラフトを修正する（timeout 秒以内に終わらなければ元のドラフトを返す）。
+        section: 記事の1つの節だけを修正する場合はその見出し（見出し行を除いた節の本文だけを出力させる）
+        """
         print(f"🔧 Refining article based on feedback...")
+
+        # 出力は全文の書き直しなので、入力のドラフトと同じ長さ分を出力用に確保する
+        draft_tokens = count_tokens(original_draft)
+        budget = PromptBudget(reserve_output=draft_tokens + 256)
+        parts = budget.allocate(self._build_refine_prompt(topic, "", "", section), {"draft": original_draft, "feedback": feedback}, weights={"draft": 4, "feedback": 1})
+        if parts["draft"] != original_draft:
+            # ドラフトを切り詰めて書き直させると記事が欠けるため、修正を見送る
+            print(f"⚠️ Draft too long to refine within the context window ({draft_tokens} tokens). Keeping original.")
+            return original_draft
+        prompt = self._build_refine_prompt(topic, original_draft, parts["feedback"], section)
         
-        prompt = f"""
+        try:
+            content = self.llm.chat("refine_draft", prompt, temperature=0.2, timeout=timeout)
+            return content.strip() if content else original_draft
+        except Exception as e:
+            print(f"❌ Refinement failed: {e}")
+            return original_draft
+
+    def _build_refine_prompt(self, topic: str, original_draft: str, feedback: str, section: str | None = None) -> str:
+        if section is not None:
+            return f"""
+        Original Section "{section}" of the article "{topic}":
+        {original_draft}
+
+        Reviewer Feedback:
+        {feedback}
+
+        Please rewrite only the section "{section}" to address the feedback above.
+        Output ONLY the rewritten Wikitext body of the section "{section}",
+        without its heading line, the article introduction, or any other sections.
+        """
+        return f"""
         Original Draft for "{topic}":
         {original_draft}
 
@@ -94,15 +182,3 @@ class ArticleReviewer:
         Please rewrite the article to address the feedback above.
         Output ONLY the full rewritten Wikitext.
         """
-        
-        try:
-            resp = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2
-            )
-            content = resp.choices[0].message.content
-            return content.strip() if content else original_draft
-        except Exception as e:
-            print(f"❌ Refinement failed: {e}")
-            return original_draft
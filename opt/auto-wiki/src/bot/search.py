@@ -0,0 +1,201 @@
+# /opt/auto-wiki/src/bot/search.py
+# 日本語タイトル: Web検索バックエンドと検索クライアント
+# 目的: 検索エンジンを差し替え可能にし（DuckDuckGo / オフライン用フィクスチャ）、
+#       ディスクキャッシュ・同一クエリの同時実行の集約・スレッド共有のレート制限をかけて外部検索の回数を減らす
+#       1クエリの待ち時間の上限（レート制限待ち・集約待ち・HTTP通信）はクライアント内で守り、呼び出し側のスレッドを解放する
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from src.utils.disk_cache import DiskCache, cache_path
+from src.utils.rate_limit import TokenBucket
+
+# 検索バックエンド: "ddg"（DuckDuckGo）または "fixture"（SEARCH_FIXTURE のJSONを返す）
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "ddg")
+SEARCH_FIXTURE = os.getenv("SEARCH_FIXTURE", "/app/config/search_fixture.json")
+# キャッシュ有効期限（秒）と上限（MB、0 で無効）
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(24 * 3600)))
+SEARCH_CACHE_MB = int(os.getenv("SEARCH_CACHE_MB", "64"))
+# 外部検索のレート（1秒あたりのクエリ数）とバースト
+SEARCH_RATE = float(os.getenv("SEARCH_RATE", "0.5"))
+SEARCH_BURST = int(os.getenv("SEARCH_BURST", "3"))
+# 1クエリを待つ上限（秒）。超えたら TimeoutError（調査は結果を捨てて先に進む）
+SEARCH_TIMEOUT = float(os.getenv("RESEARCH_SEARCH_TIMEOUT", "30"))
+
+
+class DuckDuckGoBackend:
+    """
+    DuckDuckGo テキスト検索（スレッドごとに DDGS セッションを使い回す）。
+    HTTP のタイムアウトはセッション単位のため、セッションは設定値 timeout で1度だけ作る
+    （クエリごとの残り時間で作り直すと、待ち時間が変わるたびにセッションと HTTP クライアントが作り直される）。
+    レート制限・集約の待ちを含めた1クエリの期限は SearchClient が守る
+    """
+
+    name = "ddg"
+
+    def __init__(self, timeout: float = SEARCH_TIMEOUT):
+        self.timeout = max(1, int(timeout))
+        self._local = threading.local()
+
+    def _session(self):
+        ddgs = getattr(self._local, "ddgs", None)
+        if ddgs is None:
+            from duckduckgo_search import DDGS
+            ddgs = self._local.ddgs = DDGS(timeout=self.timeout)
+        return ddgs
+
+    def search(self, query: str, region: str, limit: int, timeout: float = SEARCH_TIMEOUT) -> list:
+        try:
+            return list(self._session().text(query, region=region, max_results=limit) or [])
+        except Exception:
+            # セッションが壊れている可能性があるため次回は作り直す
+            self._local.ddgs = None
+            raise
+
+
+class FixtureBackend:
+    """
+    オフライン用の固定検索結果（ベンチマーク・動作確認用）。
+    JSON形式: {"クエリ": [{"title": ..., "href": ..., "body": ...}, ...], ...}
+    latency: 1クエリあたりの疑似的な待ち時間（秒）
+    """
+
+    name = "fixture"
+
+    def __init__(self, path: str, latency: float = 0.0):
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        self.results = {self._normalize(q): r for q, r in raw.items()}
+        self.latency = latency
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    def search(self, query: str, region: str, limit: int, timeout: float = SEARCH_TIMEOUT) -> list:
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+            if self.latency > timeout:
+                raise TimeoutError(f"Fixture search exceeded {timeout:.1f}s")
+        return list(self.results.get(self._normalize(query), []))[:limit]
+
+
+class _InflightSearch:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SearchClient:
+    """キャッシュ・同時実行の集約・レート制限をかけた検索クライアント（プロセス内で共有）"""
+
+    def __init__(self, backend, cache: DiskCache | None = None, ttl: float = SEARCH_CACHE_TTL,
+                 limiter: TokenBucket | None = None, timeout: float = SEARCH_TIMEOUT):
+        self.backend = backend
+        self.cache = cache
+        self.ttl = ttl
+        self.limiter = limiter
+        self.timeout = timeout
+        self._inflight: dict[str, _InflightSearch] = {}
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "cache_hits": 0, "coalesced": 0, "backend_calls": 0}
+
+    def _key(self, query: str, region: str, limit: int) -> str:
+        raw = f"{self.backend.name}\n{region}\n{limit}\n{query.strip()}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def search(self, query: str, region: str = "jp-jp", limit: int = 5) -> list:
+        """
+        検索結果（title / href / body の辞書のリスト）を返す。バックエンドの失敗は例外として伝える。
+        レート制限・同一クエリの集約・バックエンドの待ち時間の合計が timeout を超えたら TimeoutError
+        """
+        deadline = time.monotonic() + self.timeout
+        key = self._key(query, region, limit)
+        with self._lock:
+            self.stats["queries"] += 1
+
+        if self.cache is not None:
+            try:
+                cached = self.cache.get(key, max_age=self.ttl)
+            except Exception as e:
+                print(f"⚠️ Search cache read failed: {e}")
+                cached = None
+            if cached is not None:
+                with self._lock:
+                    self.stats["cache_hits"] += 1
+                return json.loads(cached)
+
+        # 同じクエリが実行中なら、その結果を待って共有する
+        with self._lock:
+            running = self._inflight.get(key)
+            leader = running is None
+            if running is None:
+                call = self._inflight[key] = _InflightSearch()
+            else:
+                call = running
+                self.stats["coalesced"] += 1
+        if not leader:
+            if not call.event.wait(max(0.0, deadline - time.monotonic())):
+                raise TimeoutError(f"Search timed out waiting for a coalesced query: {query}")
+            if call.error is not None:
+                raise call.error
+            return list(call.result)
+
+        try:
+            if self.limiter is not None and not self.limiter.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                raise TimeoutError(f"Search timed out waiting for the rate limiter: {query}")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Search timed out: {query}")
+            with self._lock:
+                self.stats["backend_calls"] += 1
+            call.result = self.backend.search(query, region, limit, timeout=remaining)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+        # 結果が空のときは一時的な失敗の可能性があるためキャッシュしない
+        if self.cache is not None and call.result:
+            try:
+                self.cache.set(key, json.dumps(call.result, ensure_ascii=False).encode("utf-8"))
+            except Exception as e:
+                print(f"⚠️ Search cache write failed: {e}")
+        return list(call.result)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _create_backend():
+    if SEARCH_BACKEND == "fixture":
+        print(f"🔎 Using search fixture: {SEARCH_FIXTURE}")
+        return FixtureBackend(SEARCH_FIXTURE, latency=float(os.getenv("SEARCH_FIXTURE_LATENCY", "0")))
+    return DuckDuckGoBackend()
+
+
+def get_search_client() -> SearchClient:
+    """環境変数の設定に従ってプロセス共有の検索クライアントを返す"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                backend = _create_backend()
+                cache = None
+                # フィクスチャ使用時はキャッシュを通さない（ベンチマークの結果を歪めないため）
+                if SEARCH_CACHE_MB > 0 and backend.name != "fixture":
+                    try:
+                        cache = DiskCache(cache_path("search_results.sqlite"), max_bytes=SEARCH_CACHE_MB * 1024 * 1024)
+                    except Exception as e:
+                        print(f"⚠️ Search cache disabled: {e}")
+                limiter = TokenBucket(SEARCH_RATE, SEARCH_BURST) if backend.name != "fixture" else None
+                _client = SearchClient(backend, cache=cache, limiter=limiter)
+    return _client
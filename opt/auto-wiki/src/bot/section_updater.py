@@ -0,0 +1,208 @@
+# /opt/auto-wiki/src/bot/section_updater.py
+# 日本語タイトル: 既存記事のセクション単位差分更新
+# 目的: 既存記事を「== 見出し ==」単位に分解し、新しい調査結果が情報を追加するセクションだけを
+#       並列に書き直して元の位置へ戻す（出力量は記事の長さではなく変更量に比例する）
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from src.bot.llm_gateway import LLMGateway, LLMOutputAborted, is_chatty
+from src.bot.research_context import ResearchContext, normalize_vector
+from src.rag.chunker import chunk_wikitext
+from src.utils.token_budget import PromptBudget, count_tokens, truncate_tokens
+
+_HEADING_RE = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$", re.MULTILINE)
+# 更新対象にしない末尾の定型セクション
+_FOOTER_TITLES = {"関連項目", "脚注", "参考文献", "外部リンク", "See also", "References", "External links", "Notes"}
+
+# 出典と記事中で最も近い一節とのコサイン類似度がこれ以上なら「記事に既に書かれている」とみなす
+# （語の重なりでは言い換えただけの検索スニペットまで新情報と判定され、毎回上限まで書き直していた）
+# 埋め込みモデルと記事の言語で分布が変わるため、src/benchmarks/section_novelty_bench.py で実際の調査結果から調整する
+KNOWN_SIMILARITY = float(os.getenv("SECTION_KNOWN_SIMILARITY", "0.75"))
+# 出典と比べる記事の一節の長さ（検索スニペットと同程度。トークン）
+PASSAGE_TOKENS = 80
+PASSAGE_OVERLAP_TOKENS = 20
+# 1回の更新で書き直すセクション数の上限
+MAX_SECTIONS_PER_UPDATE = 3
+# 1セクションに渡す出典の数と調査メモの長さ（トークン）
+SOURCES_PER_SECTION = 4
+SECTION_SOURCE_TOKENS = 1200
+# 書き直しで出力に上乗せする追記分（トークン）
+SECTION_GROWTH_TOKENS = 512
+# 書き直し・修正の結果が元より短くなりすぎた場合は欠落とみなして破棄する（品質ゲートの修正でも使う）
+MIN_LENGTH_RATIO = 0.8
+
+
+def parse_sections(text: str) -> list:
+    """
+    Wikitext を見出し単位に分割する（"".join(heading + body) で元の文字列に戻る）。
+    Returns: [{"title": 見出し（導入部は ""）, "heading": 見出し行, "body": 本文}, ...]
+    """
+    sections = []
+    matches = list(_HEADING_RE.finditer(text))
+    first = matches[0].start() if matches else len(text)
+    sections.append({"title": "", "heading": "", "body": text[:first]})
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        sections.append({"title": match.group(2).strip(), "heading": text[match.start():match.end()], "body": text[match.end():end]})
+    return sections
+
+
+def strip_section_heading(section: dict, content: str) -> str:
+    """LLM が書き直した節の本文を取り出す（コードブロック記号と、先頭に出力してしまった節自身の見出し行を取り除く）"""
+    body = content.replace("```wikitext", "").replace("```", "").strip()
+    if section["heading"]:
+        body = re.sub(r"^\s*={2,6}\s*" + re.escape(section["title"]) + r"\s*={2,6}\s*\n?", "", body)
+    return body.strip()
+
+
+def splice_section_body(section: dict, body: str) -> dict:
+    """節の本文を body に置き換える（見出し行は元のものを使い、元の節の前後の改行を保つ）"""
+    lead = section["body"][:len(section["body"]) - len(section["body"].lstrip())]
+    trail = section["body"][len(section["body"].rstrip()):] or "\n"
+    return {"title": section["title"], "heading": section["heading"], "body": lead + body.strip() + trail}
+
+
+class SectionUpdater:
+    def __init__(self, llm: LLMGateway, embedder, lang: str = "ja", parallelism: int = 3, timeout: float | None = None):
+        self.llm = llm.for_agent("section_updater")
+        self.embedder = embedder
+        self.lang = lang
+        self.parallelism = max(1, parallelism)
+        self.timeout = timeout
+
+    def update(self, topic: str, old_text: str, research: ResearchContext) -> str:
+        """新しい情報がある節だけを書き直した記事全文を返す（変更が無ければ old_text をそのまま返す）"""
+        sections = parse_sections(old_text)
+        candidates = [i for i, s in enumerate(sections) if s["title"] not in _FOOTER_TITLES and (s["title"] or s["body"].strip())]
+        if not candidates or not research:
+            return old_text
+
+        assignments = self._assign_sources(topic, sections, candidates, research)
+        if not assignments:
+            print("   ⏹️  Research adds nothing new to any section.")
+            return old_text
+
+        # 新情報の量が多い節から順に MAX_SECTIONS_PER_UPDATE 個まで
+        targets = sorted(assignments, key=lambda i: -sum(score for score, _ in assignments[i]))[:MAX_SECTIONS_PER_UPDATE]
+        print(f"   🧩 Updating {len(targets)}/{len(candidates)} sections: {[sections[i]['title'] or 'Introduction' for i in targets]}")
+
+        with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="section-update") as executor:
+            futures = {
+                i: executor.submit(self._rewrite_section, topic, sections[i], [src for _, src in assignments[i]])
+                for i in targets
+            }
+            rewritten = {i: future.result() for i, future in futures.items()}
+
+        changed = 0
+        for i, new_section in rewritten.items():
+            if new_section is None:
+                continue
+            sections[i] = new_section
+            changed += 1
+        if not changed:
+            return old_text
+        return "".join(s["heading"] + s["body"] for s in sections)
+
+    def _assign_sources(self, topic: str, sections: list, candidates: list, research: ResearchContext) -> dict:
+        """
+        各出典を記事中で最も近い一節と比べ、意味的に近すぎる出典（既に書かれている情報。別の節にあるものも含む）を除き、
+        残りを最も近い一節を含む節に割り当てる。
+        Returns: {節の番号: [(新規性スコア, 出典), ...]}
+        """
+        matches = self.nearest_passages(topic, sections, candidates, research.embedded_sources(self.embedder))
+        assignments: dict[int, list[tuple[float, dict]]] = {}
+        for source, index, similarity in matches:
+            if similarity < KNOWN_SIMILARITY:
+                assignments.setdefault(index, []).append((1.0 - similarity, source))
+        known = len(matches) - sum(len(items) for items in assignments.values())
+        print(f"   📏 {known}/{len(matches)} sources already covered by the article (similarity >= {KNOWN_SIMILARITY}).")
+
+        for index in assignments:
+            assignments[index] = sorted(assignments[index], key=lambda item: -item[0])[:SOURCES_PER_SECTION]
+        return assignments
+
+    def nearest_passages(self, topic: str, sections: list, candidates: list, sources: list) -> list:
+        """
+        記事の各節を出典と同程度の長さの一節に分けて埋め込み、出典ごとに最も近い一節を求める。
+        sources: "vector"（正規化済み）付きの出典
+        Returns: [(出典, 最も近い一節を含む節の番号, コサイン類似度), ...]
+        """
+        passages: list[tuple[int, str]] = []
+        for i in candidates:
+            chunks = chunk_wikitext(sections[i]["body"], max_tokens=PASSAGE_TOKENS, overlap_tokens=PASSAGE_OVERLAP_TOKENS)
+            # 本文が無い節は見出しだけで表す（新しい情報の割り当て先にはなれるようにする）
+            texts = [c["text"] for c in chunks] or [sections[i]["title"]]
+            passages.extend((i, f"{topic} {sections[i]['title']}\n{text}") for text in texts)
+        if not passages:
+            return []
+        passage_vectors = [normalize_vector(v) for v in self.embedder.embed([text for _, text in passages])]
+
+        matches = []
+        for source in sources:
+            similarities = [sum(a * b for a, b in zip(vec, source["vector"])) for vec in passage_vectors]
+            best = max(range(len(passages)), key=lambda k: similarities[k])
+            matches.append((source, passages[best][0], similarities[best]))
+        return matches
+
+    def _rewrite_section(self, topic: str, section: dict, sources: list) -> dict | None:
+        """1つの節を新しい出典で書き直す（失敗・欠落の疑いがある場合は None）"""
+        title = section["title"] or "Introduction"
+        original = section["body"].strip()
+        notes = "".join(
+            f"[Source {n}] Title: {s['title']}\nURL: {s['url']}\nContent: {s['body']}\n\n"
+            for n, s in enumerate(sources, start=1)
+        )
+        notes = truncate_tokens(notes, SECTION_SOURCE_TOKENS)
+
+        # 節の全文を書き直すため、元の長さ + 追記分を出力用に確保する
+        budget = PromptBudget(reserve_output=count_tokens(original) + SECTION_GROWTH_TOKENS)
+        if budget.available(self._build_prompt(topic, title, "", notes)) < count_tokens(original):
+            print(f"   ⚠️ Section '{title}' too long to rewrite within the context window. Skipped.")
+            return None
+
+        try:
+            content = self.llm.chat(
+                "rewrite_section",
+                self._build_prompt(topic, title, original, notes),
+                temperature=0.3,
+                timeout=self.timeout,
+                abort_on=is_chatty
+            )
+        except LLMOutputAborted:
+            print(f"   ⚠️ Section '{title}' rewrite turned chatty. Keeping original.")
+            return None
+        except Exception as e:
+            print(f"   ⚠️ Section '{title}' rewrite failed: {e}")
+            return None
+
+        body = strip_section_heading(section, content)
+        if len(body) < len(original) * MIN_LENGTH_RATIO:
+            print(f"   ⚠️ Section '{title}' rewrite dropped content ({len(body)}/{len(original)} chars). Keeping original.")
+            return None
+
+        print(f"   ✔️  Section updated: {title}")
+        return splice_section_body(section, body)
+
+    def _build_prompt(self, topic: str, title: str, original: str, notes: str) -> str:
+        language = "JAPANESE (日本語)" if self.lang == "ja" else "ENGLISH"
+        return f"""
+        [System Command]
+        You are a text generation engine, NOT a chat assistant.
+        - DO NOT talk to the user.
+        - Output ONLY the updated Wikitext body of the section (without the heading line).
+        - Language: {language}
+
+        Task: Update the section "{title}" of the article "{topic}" with the new information below.
+
+        Rules:
+        - Keep ALL existing content, facts, links and references of the current section.
+        - Add only facts from the new information that the current section does not contain yet.
+        - Integrate them naturally into the existing paragraphs or as new paragraphs.
+
+        New Information:
+        {notes}
+
+        Current Section:
+        {original}
+        """
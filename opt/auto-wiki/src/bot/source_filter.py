@@ -0,0 +1,215 @@
+# /opt/auto-wiki/src/bot/source_filter.py
+# 日本語タイトル: 検索結果のローカル事前フィルター
+# 目的: 検索結果を LLM に渡す前に、ローカルの安価な判定だけで不要なものを落とす
+#       1. config/blocklist.txt のドメイン（＋パス）ルール（ファイル更新を検知して自動で再読み込み）
+#       2. 文字種による言語判定（記事の言語と異なるページを除外）
+#       3. 埋め込みモデル（MiniLM）でのトピックとの類似度（しきい値未満を除外。ベクトルは後段でも再利用する）
+
+import os
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+from src.bot.research_context import normalize_vector
+
+BLOCKLIST_FILE = os.getenv("BLOCKLIST_FILE", "/app/config/blocklist.txt")
+# ブロックリストの更新確認の間隔（秒）
+BLOCKLIST_CHECK_INTERVAL = 5.0
+# トピックとのコサイン類似度がこれ未満の検索結果は除外する（0 で無効）
+SOURCE_MIN_SIMILARITY = float(os.getenv("SOURCE_MIN_SIMILARITY", "0.2"))
+# 言語判定に使う最小文字数（これより短い本文は判定せず通す）
+_LANG_MIN_LETTERS = 20
+# かなを含み、かな・漢字がこの数以上あれば日本語とみなす
+# （英語の文章にかなは現れないため、「Python 3.12 の新機能」のようにラテン文字が大半の技術記事でも日本語と判定する）
+_LANG_MIN_JA_CHARS = 3
+
+_KANA_RE = re.compile(r"[\u3040-\u30ff]")
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+
+
+class DomainRules:
+    """
+    ブロックリスト/許可リスト。1行1ルール、# 以降はコメント。
+      example.com          example.com とそのサブドメインを除外
+      example.com/forum    そのパス配下だけを除外
+      +example.org         許可（除外ルールより優先し、言語・類似度の判定も省略する）
+    ドメインを接尾辞ごとの辞書に展開しておき、URL ごとの判定はラベル数回の辞書引きで済ませる
+    """
+
+    def __init__(self, lines: list | None = None):
+        self.blocked: dict[str, list[str]] = {}
+        self.allowed: dict[str, list[str]] = {}
+        for line in lines or []:
+            rule = line.split("#", 1)[0].strip().lower()
+            if not rule:
+                continue
+            table = self.blocked
+            if rule.startswith("+"):
+                table, rule = self.allowed, rule[1:].strip()
+            rule = re.sub(r"^[a-z]+://", "", rule).removeprefix("*.")
+            host, _, path = rule.partition("/")
+            if host:
+                table.setdefault(host, []).append("/" + path if path else "")
+
+    def __len__(self):
+        return len(self.blocked) + len(self.allowed)
+
+    @staticmethod
+    def _match(table: dict, host: str, path: str) -> bool:
+        labels = host.split(".")
+        for i in range(len(labels)):
+            prefixes = table.get(".".join(labels[i:]))
+            if prefixes and any(path.startswith(p) for p in prefixes):
+                return True
+        return False
+
+    def verdict(self, url: str) -> str | None:
+        """"allow" / "block" / None（ルールなし）"""
+        parts = urlsplit(url if "//" in url else f"//{url}")
+        host = (parts.hostname or "").lower()
+        if not host:
+            return None
+        path = parts.path or "/"
+        if self._match(self.allowed, host, path):
+            return "allow"
+        if self._match(self.blocked, host, path):
+            return "block"
+        return None
+
+
+def detect_script_language(text: str) -> str | None:
+    """
+    文字種から言語を推定する（"ja" / "en" / "other"。判定に足る文字が無ければ None）。
+    かなを含むなら日本語、かなが無くラテン文字が大半なら英語、漢字だけ（中国語など）はその他とみなす
+    """
+    latin = len(_LATIN_RE.findall(text))
+    cjk = len(_CJK_RE.findall(text))
+    if cjk >= _LANG_MIN_JA_CHARS and _KANA_RE.search(text):
+        return "ja"
+    if latin + cjk < _LANG_MIN_LETTERS:
+        return None
+    if latin >= (latin + cjk) * 0.7:
+        return "en"
+    return "other"
+
+
+class SourceFilter:
+    def __init__(self, lang: str = "ja", blocklist_path: str = BLOCKLIST_FILE,
+                 min_similarity: float = SOURCE_MIN_SIMILARITY, embedder=None):
+        self.lang = lang
+        self.blocklist_path = blocklist_path
+        self.min_similarity = min_similarity
+        self._embedder = embedder
+        self._rules = DomainRules()
+        self._mtime: float | None = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._topic_vectors: dict[str, list] = {}
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            from src.rag.embeddings import get_embedder
+            self._embedder = get_embedder()
+        return self._embedder
+
+    def rules(self) -> DomainRules:
+        """ブロックリストを返す（BLOCKLIST_CHECK_INTERVAL ごとに更新時刻を確認し、変わっていれば読み直す）"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return self._rules
+        with self._lock:
+            if now < self._next_check:
+                return self._rules
+            self._next_check = now + BLOCKLIST_CHECK_INTERVAL
+            try:
+                mtime = os.path.getmtime(self.blocklist_path)
+            except OSError:
+                mtime = None
+            if mtime != self._mtime:
+                self._mtime = mtime
+                lines = []
+                if mtime is not None:
+                    try:
+                        with open(self.blocklist_path, "r", encoding="utf-8") as f:
+                            lines = f.read().splitlines()
+                    except OSError as e:
+                        print(f"⚠️ Could not read blocklist {self.blocklist_path}: {e}")
+                        return self._rules
+                self._rules = DomainRules(lines)
+                print(f"🛡️  Loaded {len(self._rules)} domain rules from {self.blocklist_path}.")
+        return self._rules
+
+    def filter(self, topic: str, results: list) -> tuple:
+        """
+        検索結果を判定し、残ったものだけを返す。
+        残った結果には "vector"（正規化済みの埋め込み）と "similarity"（トピックとの類似度）を付ける
+        （ResearchContext が関連度順の並べ替えとセクション選択に再利用する）。
+        Returns: (残った検索結果, 除外理由ごとの件数 Counter)
+        """
+        rejected: Counter[str] = Counter()
+        rules = self.rules()
+        kept, allowed = [], set()
+        for res in results:
+            url = res.get("href", "")
+            verdict = rules.verdict(url)
+            if verdict == "block":
+                rejected["blocked"] += 1
+                continue
+            if verdict == "allow":
+                allowed.add(id(res))
+            else:
+                language = detect_script_language(f"{res.get('title', '')} {res.get('body', '') or res.get('snippet', '')}")
+                if language is not None and language != self.lang:
+                    rejected["language"] += 1
+                    continue
+            kept.append(res)
+
+        if not kept:
+            return kept, rejected
+        # 調査コーパス由来の結果は保存済みの埋め込みを使い、それ以外だけをまとめて埋め込む
+        missing = [res for res in kept if res.get("vector") is None]
+        try:
+            topic_vector = self._topic_vector(topic)
+            vectors = iter(self.embedder.embed([
+                f"{res.get('title', 'No Title')}\n{res.get('body', '') or res.get('snippet', '')}" for res in missing
+            ]))
+        except Exception as e:
+            print(f"⚠️ Relevance filter skipped (embedding failed): {e}")
+            return kept, rejected
+
+        relevant = []
+        for res in kept:
+            vector = normalize_vector(res["vector"] if res.get("vector") is not None else next(vectors))
+            similarity = sum(a * b for a, b in zip(topic_vector, vector))
+            if similarity < self.min_similarity and id(res) not in allowed:
+                rejected["irrelevant"] += 1
+                continue
+            relevant.append({**res, "vector": vector, "similarity": similarity})
+        return relevant, rejected
+
+    def _topic_vector(self, topic: str) -> list:
+        vector = self._topic_vectors.get(topic)
+        if vector is None:
+            vector = normalize_vector(self.embedder.embed([topic])[0])
+            if len(self._topic_vectors) > 256:
+                self._topic_vectors.clear()
+            self._topic_vectors[topic] = vector
+        return vector
+
+
+_filters: dict[str, SourceFilter] = {}
+_filters_lock = threading.Lock()
+
+
+def get_source_filter(lang: str = "ja") -> SourceFilter:
+    """言語ごとのプロセス共有フィルターを返す（ブロックリストの再読み込みも共有する）"""
+    source_filter = _filters.get(lang)
+    if source_filter is None:
+        with _filters_lock:
+            source_filter = _filters.get(lang)
+            if source_filter is None:
+                source_filter = _filters[lang] = SourceFilter(lang)
+    return source_filter
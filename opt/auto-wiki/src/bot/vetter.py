@@ -2,12 +2,16 @@
 # 情報吟味エージェント
 # 目的: 検索結果がWikipediaの出典として適切か判定・要約する
 
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from src.bot.llm_gateway import LLMGateway
+from src.utils.token_budget import PromptBudget
+
+# 抽出結果（箇条書き）の出力用に確保するトークン数
+VETTING_OUTPUT_TOKENS = 1024
 
 class InformationVetter:
-    def __init__(self, client: OpenAI, model_name: str, lang: str = "ja"):
-        self.client = client
-        self.model_name = model_name
+    def __init__(self, llm: LLMGateway, lang: str = "ja"):
+        self.llm = llm.for_agent("vetter")
         self.lang = lang
 
     def vet_search_results(self, topic: str, raw_results: list) -> str:
@@ -25,8 +29,44 @@ class InformationVetter:
             href = r.get('href', '')
             combined_text += f"Title: {title}\nURL: {href}\nContent: {body}\n---\n"
 
+        # 検索結果が多い場合はコンテキスト長に収まるよう切り詰める
+        combined_text = PromptBudget(reserve_output=VETTING_OUTPUT_TOKENS).allocate(
+            self._build_prompt(topic, ""), {"results": combined_text}
+        )["results"]
+        prompt = self._build_prompt(topic, combined_text)
+
+        try:
+            content = self.llm.chat("vet_search_results", prompt, temperature=0.3)
+            vetted_text = content.strip() if content else ""
+            
+            if "NO_INFO" in vetted_text:
+                return ""
+            
+            return vetted_text
+
+        except Exception as e:
+            print(f"⚠️ Vetting error: {e}")
+            return ""
+
+    def vet_in_batches(self, topic: str, raw_results: list, batch_size: int = 6,
+                       parallelism: int = 2, max_batches: int | None = None) -> str:
+        """
+        検索結果を batch_size 件ずつに分けて並列に吟味し、抽出結果を元の順に連結して返す。
+        1回の呼び出しの入出力が短くなり、全件を1プロンプトに詰めた場合の切り詰めも起きない。
+        max_batches: 吟味するバッチ数の上限（関連度順に並んだ結果の先頭から）
+        """
+        batches = [raw_results[i:i + batch_size] for i in range(0, len(raw_results), max(1, batch_size))]
+        if max_batches:
+            batches = batches[:max_batches]
+        if not batches:
+            return ""
+        with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(batches))), thread_name_prefix="vet") as executor:
+            results = list(executor.map(lambda batch: self.vet_search_results(topic, batch), batches))
+        return "\n".join(r for r in results if r)
+
+    def _build_prompt(self, topic: str, combined_text: str) -> str:
         if self.lang == "en":
-            prompt = f"""
+            return f"""
             You are a Wikipedia reliability assessor.
             Extract only "reliable objective facts" that can be used for Wikipedia article "{topic}" from the following search results.
             
@@ -39,7 +79,7 @@ class InformationVetter:
             3. If no relevant info, return "NO_INFO".
             """
         else:
-            prompt = f"""
+            return f"""
             あなたはWikipediaの信頼性評価担当者です。
             以下のWeb検索結果から、トピック「{topic}」のWikipedia記事執筆に使用できる「信頼できる客観的事実」のみを抽出してください。
             
@@ -51,22 +91,3 @@ class InformationVetter:
             2. 事実関係（日付、数値、出来事）を中心に箇条書きで抽出してください。
             3. 該当する情報がない場合は "NO_INFO" と返してください。
             """
-
-        try:
-            resp = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            # vetted_text = resp.choices[0].message.content.strip() を以下に変更
-            content = resp.choices[0].message.content
-            vetted_text = content.strip() if content else ""
-            
-            if "NO_INFO" in vetted_text:
-                return ""
-            
-            return vetted_text
-
-        except Exception as e:
-            print(f"⚠️ Vetting error: {e}")
-            return ""
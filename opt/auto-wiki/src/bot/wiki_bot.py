@@ -4,15 +4,43 @@
 
 import os
 import mwclient
-import datetime
 import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
 from openai import OpenAI
 from src.bot.commons import CommonsAgent
 from src.bot.vetter import InformationVetter
 from src.bot.reviewer import ArticleReviewer
 from src.bot.researcher import DeepResearcher
-from src.rag.vector_store import WikiVectorDB
+from src.bot.research_context import ResearchContext, fingerprint_similarity
+from src.bot.llm_gateway import LLMGateway, LLMOutputAborted, is_chatty
+from src.bot.section_updater import SectionUpdater
+from src.bot.quality import QualityGate
+from src.bot.article_prompts import article_prefix, intro_task, outline_task, section_task
+from src.rag.vector_store import get_vector_db
+from src.rag.research_corpus import get_research_corpus
+from src.utils.stage_limits import stage_slot
+from src.utils.token_budget import PromptBudget
+
+# 分割執筆の同時生成数（Ollama 側の OLLAMA_NUM_PARALLEL 以下にする）
+SECTION_PARALLELISM = int(os.getenv("SECTION_PARALLELISM", "3"))
+# 1セクションあたりのLLM呼び出しタイムアウト（秒）と失敗時の再試行回数
+SECTION_TIMEOUT = float(os.getenv("SECTION_TIMEOUT", "300"))
+SECTION_RETRIES = int(os.getenv("SECTION_RETRIES", "1"))
+# 構成案・導入部・各セクションで共有する調査メモの長さ（トークン。関連度の高い出典から詰める）
+# 全呼び出しのプロンプト先頭を同一にし、Ollama の KV キャッシュで調査メモの再処理を省く
+ARTICLE_CONTEXT_TOKENS = int(os.getenv("ARTICLE_CONTEXT_TOKENS", "3000"))
+# 1セクションの出力用に確保するトークン数
+SECTION_OUTPUT_TOKENS = 1536
+# 各セクションで参照させる出典の最大数（共通の調査メモの中から見出しとの意味的な近さで選ぶ）
+SECTION_TOP_K = 6
+# 前回の調査結果との推定類似度がこれ以上なら「実質的に変化なし」として執筆を省略する
+RESEARCH_UNCHANGED_SIMILARITY = float(os.getenv("RESEARCH_UNCHANGED_SIMILARITY", "0.85"))
+
+# update_article のフェーズ（TopicPipeline のステージ名と stage_slot の名前を兼ねる）
+PHASES = ("research", "image", "writing", "quality", "publish")
 
 class LocalWikiBotV2:
     def __init__(self, wiki_host, bot_user, bot_pass, model_name, base_url, lang="ja"):
@@ -27,14 +55,48 @@ class LocalWikiBotV2:
         
         self.client = OpenAI(base_url=base_url, api_key="ollama")
         self.model_name = model_name
+        # 全エージェントのLLM呼び出しはゲートウェイ経由（ストリーミング + 計測）
+        self.gateway = LLMGateway(self.client, model_name)
+        self.llm = self.gateway.for_agent("writer")
         
-        self.researcher = DeepResearcher(self.client, model_name, lang=lang)
-        self.commons = CommonsAgent(self.client, model_name)
-        self.vetter = InformationVetter(self.client, model_name, lang=lang)
-        self.reviewer = ArticleReviewer(self.client, model_name, lang=lang)
-        self.vector_db = WikiVectorDB()
+        # 取得済みの出典は調査コーパスに蓄積し、関連トピックの調査で Web 検索より先に引く
+        self.researcher = DeepResearcher(self.gateway, lang=lang, corpus=get_research_corpus())
+        self.commons = CommonsAgent(self.gateway)
+        self.vetter = InformationVetter(self.gateway, lang=lang)
+        self.reviewer = ArticleReviewer(self.gateway, lang=lang)
+        # 投稿前の品質ゲート（吟味・査読・修正。どこまで行うかはタスクの優先度で決まる）
+        self.quality = QualityGate(self.gateway, lang=lang, vetter=self.vetter, reviewer=self.reviewer)
+        self.vector_db = get_vector_db()
+        self.section_updater = SectionUpdater(
+            self.gateway, self.vector_db.embedder, lang=lang, parallelism=SECTION_PARALLELISM, timeout=SECTION_TIMEOUT
+        )
 
-    def update_article(self, topic: str):
+    def update_article(self, topic: str, previous_fingerprint: str | None = None, priority: int | None = None) -> dict:
+        """
+        1トピックを調査・執筆・投稿する（全フェーズをこのスレッドで順に実行する）。
+        previous_fingerprint: 前回の調査結果の指紋（既存記事で調査結果が変わっていなければ執筆を省略する）
+        priority: タスクの優先度（品質ゲートのプロファイルを選ぶ）
+        Returns: {"status": "published" | "unchanged" | "no_changes" | "conflict" | "failed",
+                  "fingerprint": 今回の調査結果の指紋, "changed": 前回からの変化（比較できなければ None）}
+        """
+        job: dict[str, Any] = {"topic": topic, "previous_fingerprint": previous_fingerprint, "priority": priority}
+        for stage in PHASES:
+            self.run_phase(stage, job)
+            if "outcome" in job:
+                break
+        return job["outcome"]
+
+    def run_phase(self, stage: str, job: dict):
+        """
+        ジョブの1フェーズを実行する（TopicPipeline はフェーズごとに別のワーカー・別のBotから呼ぶ）。
+        job: {"topic", "previous_fingerprint", "priority"} から始まり、各フェーズが結果を書き足す辞書
+             （どのBotでも続きを処理できるよう、mwclient のページ等は持たせない）。
+             いずれかのフェーズが "outcome" を設定した時点でジョブは終了する
+        """
+        getattr(self, f"_phase_{stage}")(job)
+
+    def _phase_research(self, job: dict):
+        topic = job["topic"]
         print(f"\n📘 Processing Topic ({self.lang}): {topic}")
 
         # --- Phase 0: 既存記事の確認 ---
@@ -48,204 +110,220 @@ class LocalWikiBotV2:
             is_existing = True
         else:
             print(f"   🆕 Creating NEW article: {topic}")
+        job.update(old_text=old_text, is_existing=is_existing)
 
         # --- Phase 1: Deep Research ---
         try:
             # 調査フェーズ（ここが情報の「深さ」の源泉）
-            raw_research_text = self.researcher.conduct_deep_research(topic)
+            with stage_slot("research"):
+                # 前回の調査結果がある記事の再調査は、書き足す内容を新しくするため調査コーパスを引かずに Web から取り直す
+                # （変化の判定に使う指紋は、どちらの場合もトピック名を Web で検索した結果だけから作る）
+                research = self.researcher.research(topic, reuse_corpus=job.get("previous_fingerprint") is None)
         except Exception as e:
             print(f"❌ Research phase failed: {e}")
+            job["outcome"] = {"status": "failed", "fingerprint": None, "changed": None}
             return
 
-        if not raw_research_text:
+        if not research:
             print("❌ No research results found.")
+            job["outcome"] = {"status": "failed", "fingerprint": None, "changed": None}
             return
 
+        # 調査結果の指紋を前回と比べ、既存記事で実質的に同じなら執筆（LLM）を行わない
+        # 指紋用の検索が失敗した場合は比較せず、前回の指紋を残す
+        fingerprint = research.fingerprint() or None
+        changed = None
+        previous_fingerprint = job.get("previous_fingerprint")
+        if previous_fingerprint and fingerprint:
+            similarity = fingerprint_similarity(previous_fingerprint, fingerprint)
+            changed = similarity < RESEARCH_UNCHANGED_SIMILARITY
+            if is_existing and not changed:
+                print(f"   ⏭️  Research unchanged since last run (similarity {similarity:.2f}). Skipping rewrite.")
+                job["outcome"] = {"status": "unchanged", "fingerprint": fingerprint, "changed": False}
+                return
+        job.update(research=research, fingerprint=fingerprint, changed=changed)
+
+    def _phase_image(self, job: dict):
         # --- Phase 2: 画像選定 ---
+        topic, old_text = job["topic"], job["old_text"]
         image_instruction = ""
-        if not is_existing or ("[[File:" not in old_text and "[[ファイル:" not in old_text):
+        if not job["is_existing"] or ("[[File:" not in old_text and "[[ファイル:" not in old_text):
             try:
-                images = self.commons.search_images(topic)
-                best_image = self.commons.select_best_image(topic, images)
+                with stage_slot("image"):
+                    images = self.commons.search_images(topic)
+                    best_image = self.commons.select_best_image(topic, images)
                 if best_image:
                     clean_name = best_image.replace("File:", "")
                     image_instruction = f"[[File:{clean_name}|thumb|250px|{topic}]]"
             except Exception:
                 pass
+        job["image_instruction"] = image_instruction
 
+    def _phase_writing(self, job: dict):
         # --- Phase 3: Writing (執筆) ---
-        print(f"✍️  Starting Writing Process...")
-        final_text = ""
+        topic = job["topic"]
+        print(f"✍️  Starting Writing Process: {topic}")
 
-        if is_existing:
-            # 既存記事は構成を壊さないよう「差分追記モード」で一括処理
-            final_text = self._write_incremental(topic, old_text, raw_research_text, image_instruction)
-        else:
-            # 【重要】新規記事は「分割執筆モード」で深さを出す
-            final_text = self._write_deep_article(topic, raw_research_text, image_instruction)
+        with stage_slot("writing"):
+            if job["is_existing"]:
+                # 既存記事は構成を壊さないよう「差分追記モード」で一括処理
+                final_text = self._write_incremental(topic, job["old_text"], job["research"], job["image_instruction"])
+            else:
+                # 【重要】新規記事は「分割執筆モード」で深さを出す
+                final_text = self._write_deep_article(topic, job["research"], job["image_instruction"])
+        job["final_text"] = final_text
+
+    def _phase_quality(self, job: dict):
+        # --- Phase 3.5: 品質チェック（吟味・査読・修正） ---
+        # 既存記事は old_text を baseline に渡し、差分更新で書き直された節だけを査読・修正する
+        final_text = job["final_text"]
+        if final_text and final_text.strip() != job["old_text"].strip():
+            try:
+                with stage_slot("quality"):
+                    job["final_text"] = self.quality.check(
+                        job["topic"], final_text, job["research"], job.get("priority"), baseline=job["old_text"]
+                    )
+            except Exception as e:
+                print(f"⚠️ Quality check failed: {e}")
+        # 調査結果は大きいので、投稿フェーズには持ち越さない
+        job.pop("research", None)
 
+    def _phase_publish(self, job: dict):
         # --- Phase 4: Publishing (投稿) ---
+        topic, old_text, final_text = job["topic"], job["old_text"], job["final_text"]
+        result = {"fingerprint": job["fingerprint"], "changed": job["changed"]}
         # 簡易チェック: 明らかにチャットっぽい応答が含まれていないか
-        if final_text and len(final_text) > 50 and "Please provide" not in final_text:
-            # チャット定型文の除去（念のため）
-            final_text = self._clean_chat_artifacts(final_text)
-            
-            summary = "Created comprehensive article via Deep Writer." if not is_existing else "Updated with latest research."
-            
-            # 既存記事と完全に一致しない場合のみ保存
-            if final_text.strip() != old_text.strip():
-                page.save(final_text, summary=summary)
-                print("✅ Article published successfully.")
-                self.vector_db.upsert_article(topic, final_text)
-            else:
-                print("⏹️  No changes detected.")
-        else:
+        if not (final_text and len(final_text) > 50 and "Please provide" not in final_text):
             print("❌ Output was invalid or chatty. Aborted.")
+            # 執筆に失敗した調査結果は記録せず、次回も同じ調査結果で書き直せるようにする
+            job["outcome"] = {"status": "failed", "fingerprint": None, "changed": None}
+            return
+
+        # チャット定型文の除去（念のため）
+        final_text = self._clean_chat_artifacts(final_text)
+        summary = "Created comprehensive article via Deep Writer." if not job["is_existing"] else "Updated with latest research."
 
-    def _write_deep_article(self, topic: str, context: str, image_inst: str) -> str:
+        # 既存記事と完全に一致しない場合のみ保存
+        if final_text.strip() == old_text.strip():
+            print("⏹️  No changes detected.")
+            job["outcome"] = {"status": "no_changes", **result}
+            return
+
+        with stage_slot("publish"):
+            # 調査・執筆の間に記事が編集されていたら上書きしない（次回の調査で取り込む）
+            page = self.site.pages[topic]
+            current_text = page.text() if page.exists else ""
+            if current_text.strip() != old_text.strip():
+                print(f"⚠️ '{topic}' was edited while processing. Skipped publishing.")
+                job["outcome"] = {"status": "conflict", "fingerprint": None, "changed": None}
+                return
+            page.save(final_text, summary=summary)
+            print("✅ Article published successfully.")
+            self.vector_db.upsert_article(topic, final_text)
+        job["outcome"] = {"status": "published", **result}
+
+    def _write_deep_article(self, topic: str, research: ResearchContext, image_inst: str) -> str:
         """
         【分割執筆ロジック】
         1. 構成案（目次）を作成
-        2. 各章を個別に執筆
-        3. 結合して長文記事を生成
+        2. 導入部と各章を並列に執筆（各章は調査結果だけを入力とし、互いに依存しない）
+           全呼び出しで「system 指示 + 調査メモ」の共通プレフィックスを使い、呼び出しごとの指示だけを末尾に付ける。
+           各章には、共通の調査メモのうち見出しに意味的に近い出典の番号を指示する
+        3. 構成案の順に結合して長文記事を生成
         """
-        # Step 1: 構成案の作成
+        # 共通プレフィックス（調査メモ）の長さは、最も長い指示と出力の予約分を除いたコンテキストに収める
+        budget = PromptBudget(reserve_output=SECTION_OUTPUT_TOKENS)
+        fixed = "".join(m["content"] for m in article_prefix(topic, "", self.lang))
+        fixed += section_task(topic, "X" * 40, list(range(1, SECTION_TOP_K + 1)))["content"]
+        notes_tokens = min(ARTICLE_CONTEXT_TOKENS, budget.available(fixed))
+        prefix = article_prefix(topic, research.render(notes_tokens), self.lang)
+
+        # Step 1: 構成案の作成（共通プレフィックスを処理させるので、以降の呼び出しはキャッシュから始まる）
         print("   📑 Generating Outline...")
-        outline = self._generate_outline(topic, context)
+        outline = self._generate_outline(topic, prefix)
         print(f"   -> Sections: {outline}")
+        # 各セクションが主に参照する出典の番号（出典の埋め込みは1回だけ）
+        source_numbers = research.sources_for_queries(
+            [f"{topic} {section}" for section in outline], notes_tokens, self.vector_db.embedder, top_k=SECTION_TOP_K
+        )
         
-        full_article = ""
-        
-        # Step 2: 導入部（Lead Section）の執筆
-        # 書き出しを強制してチャット化を防ぐ
-        print("   🖊️  Writing Introduction...")
-        intro = self._write_section_strict(topic, "Introduction", context, image_inst, is_intro=True)
-        full_article += intro + "\n\n"
+        # Step 2-3: 導入部（Lead Section）と各セクションを同時に執筆
+        # 導入部は書き出しを強制してチャット化を防ぐ
+        print(f"   🖊️  Writing Introduction + {len(outline)} sections (parallel: {SECTION_PARALLELISM})...")
+        with ThreadPoolExecutor(max_workers=max(1, SECTION_PARALLELISM), thread_name_prefix="section") as executor:
+            intro_future = executor.submit(
+                self._write_section_strict, "Introduction", prefix + [intro_task(topic, image_inst)], True
+            )
+            section_futures = [
+                executor.submit(self._write_section_strict, section, prefix + [section_task(topic, section, numbers)])
+                for section, numbers in zip(outline, source_numbers)
+            ]
+            # 完了順ではなく構成案の順に組み立てる
+            parts = [intro_future.result()] + [future.result() for future in section_futures]
         
-        # Step 3: 各セクションの執筆
-        for section in outline:
-            print(f"   🖊️  Writing Section: {section}...")
-            section_content = self._write_section_strict(topic, section, context, "")
-            full_article += section_content + "\n\n"
+        full_article = "".join(part + "\n\n" for part in parts)
             
         # Step 4: 関連項目とカテゴリ
         full_article += self._generate_footer(topic)
         
         return full_article
 
-    def _write_section_strict(self, topic: str, section_title: str, context: str, image_inst: str, is_intro: bool = False) -> str:
+    def _write_section_strict(self, section_title: str, messages: list, is_intro: bool = False) -> str:
         """
         各セクションを執筆するメソッド（Strict Mode適用）
+        messages: 共通プレフィックス + このセクションへの指示
         """
-        system_constraint = """
-        [System Command]
-        You are a text generation engine, NOT a chat assistant.
-        - DO NOT talk to the user.
-        - DO NOT say "Here is the article" or "Sure!".
-        - DO NOT ask questions.
-        - Output ONLY the requested Wikitext content.
-        - Language: JAPANESE (日本語)
-        """
-
-        if is_intro:
-            # 導入部：定義から強制的に始めさせる
-            prompt = f"""
-            {system_constraint}
-            
-            Task: Write the lead section for "{topic}".
-            Input Data: {context[:6000]}
-            Image Code: {image_inst}
-            
-            Instruction:
-            - Start strictly with: '''{topic}'''
-            - Write 3-5 summary sentences.
-            - Insert the image code if provided.
-            - NO headings here.
-            """
-        else:
-            # 各セクション
-            prompt = f"""
-            {system_constraint}
-            
-            Task: Write the section "{section_title}" for the article "{topic}".
-            Input Data: {context[:6000]}
-            
-            Instruction:
-            - Start strictly with: == {section_title} ==
-            - Write detailed paragraphs (at least 400 characters).
-            - Use bullet points only for lists.
-            """
-        
-        try:
-            resp = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            content = resp.choices[0].message.content.strip()
-            
-            # Markdownコードブロックの除去
-            content = content.replace("```wikitext", "").replace("```", "")
-            
-            return content
-        except Exception as e:
-            print(f"⚠️ Section write error: {e}")
-            return f"== {section_title} ==\n(Content generation failed)"
+        for attempt in range(SECTION_RETRIES + 1):
+            try:
+                # チャット化した出力はストリーミング途中で打ち切って再試行する
+                content = self.llm.chat(
+                    "intro" if is_intro else "section",
+                    messages,
+                    temperature=0.3,
+                    timeout=SECTION_TIMEOUT,
+                    abort_on=is_chatty
+                ).strip()
+                
+                # Markdownコードブロックの除去
+                content = content.replace("```wikitext", "").replace("```", "")
+                if content:
+                    print(f"   ✔️  Section done: {section_title}")
+                    return content
+                print(f"⚠️ Empty section output: {section_title} (attempt {attempt + 1})")
+            except LLMOutputAborted:
+                print(f"⚠️ Chatty section output aborted: {section_title} (attempt {attempt + 1})")
+            except Exception as e:
+                print(f"⚠️ Section write error: {section_title} (attempt {attempt + 1}): {e}")
+            if attempt < SECTION_RETRIES:
+                time.sleep(2 * (attempt + 1))
+        return f"== {section_title} ==\n(Content generation failed)"
 
-    def _generate_outline(self, topic: str, context: str) -> list:
+    def _generate_outline(self, topic: str, prefix: list) -> list:
         """記事の構成案（セクションリスト）を作成"""
-        prompt = f"""
-        List 4-6 main section titles for a Wikipedia article about "{topic}".
-        Exclude "Introduction" and "See Also".
-        Output ONLY a JSON list of strings. e.g. ["History", "Mechanism", "Impact"]
-        Context: {context[:3000]}
-        """
         try:
-            resp = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            content = resp.choices[0].message.content
+            content = self.llm.chat("outline", prefix + [outline_task(topic)], temperature=0.3)
             # JSON抽出
             if "[" in content and "]" in content:
                 json_str = content[content.find("["):content.rfind("]")+1]
-                return json.loads(json_str)
+                return [str(section) for section in json.loads(json_str)]
             return ["概要", "歴史", "特徴"]
         except:
             return ["概要", "歴史", "特徴"]
 
-    def _write_incremental(self, topic, old_text, context, image_inst):
-        """既存記事の追記用（一括生成）"""
-        # 既存の_build_incremental_update_promptを使用
-        prompt = self._build_incremental_update_prompt(topic, old_text, context, image_inst)
+    def _write_incremental(self, topic, old_text, research, image_inst):
+        """
+        既存記事の追記用（セクション単位の差分更新）
+        新しい情報がある節だけを書き直して差し戻すため、出力量は記事の長さではなく変更量に比例する
+        """
         try:
-            resp = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            return resp.choices[0].message.content.replace("```wikitext", "").replace("```", "")
-        except:
+            new_text = self.section_updater.update(topic, old_text, research)
+        except Exception as e:
+            print(f"⚠️ Section update failed: {e}")
             return old_text
-
-    def _build_incremental_update_prompt(self, topic, old_text, info, image_inst):
-        # 既存のプロンプト構築ロジック（変更なし）
-        current_date = datetime.date.today().strftime("%Y年%m月")
-        return f"""
-        あなたはWikipedia編集者です。既存記事「{topic}」に最新情報を追記してください。
-        
-        # ルール
-        1. 既存の記事は書き換えず、維持してください。
-        2. 新しい情報のみを適切な場所に追記してください。
-        3. 全文（元のテキスト + 追記分）を出力してください。
-        
-        # 入力情報
-        {info[:5000]}
-        
-        # 現在の記事
-        {old_text}
-        """
+        # 画像が未掲載なら導入部の先頭に差し込む
+        if image_inst and "[[File:" not in new_text and "[[ファイル:" not in new_text:
+            new_text = f"{image_inst}\n{new_text.lstrip()}"
+        return new_text
 
     def _generate_footer(self, topic):
         return f"== 関連項目 ==\n* [[Wikipedia]]"
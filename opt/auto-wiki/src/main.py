@@ -1,6 +1,6 @@
 # /opt/auto-wiki/src/main.py
 # 日本語タイトル: システム全体の司令塔 (Idle-Maintenance Enabled)
-# 目的: スケジューラー、Bot、およびファイル取込のメインループを実行する
+# 目的: スケジューラー、Bot（ワーカープール）、およびファイル取込のメインループを実行する
 
 import time
 import schedule
@@ -13,7 +13,12 @@ sys.path.append("/app")
 
 from src.bot.wiki_bot import LocalWikiBotV2
 from src.scheduler.task_manager import WikiScheduler
+from src.scheduler.worker_pool import TopicWorkerPool
+from src.scheduler.pipeline import TopicPipeline
+from src.scheduler.notifier import TaskNotifier
 from src.rag.file_ingestor import LocalFileIngestor
+from src.rag.research_corpus import get_research_corpus
+from src.utils.stage_limits import configure_stage_limits
 
 # --- Logger Class Injection ---
 class DualLogger(object):
@@ -32,74 +37,119 @@ class DualLogger(object):
 
 sys.stdout = DualLogger()
 
-def main():
-    WIKI_LANG = os.getenv("WIKI_LANG", "ja")
-    print(f"🚀 Initializing Autonomous Wiki System ({WIKI_LANG.upper()})...")
-
-    WIKI_HOST = os.getenv("WIKI_HOST", "mediawiki:80")
-    BOT_USER = os.getenv("BOT_USER", "AdminBot")
-    BOT_PASS = os.getenv("BOT_PASS", "password")
-    MODEL_NAME = os.getenv("MODEL_NAME", "gemma2")
-    OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://ollama:11434/v1")
-    TRENDS_RSS = os.getenv("TRENDS_RSS", "https://trends.google.com/trends/trendingsearches/daily/rss?geo=JP")
-
-    # Retry Connection
+def connect_bot(config: dict, label: str = "main"):
+    """Wiki と AI への接続をリトライ付きで確立し、Botを返す（失敗時は None）"""
     max_retries = 10
-    bot = None
     for i in range(max_retries):
         try:
-            print(f"⏳ Connection attempt {i+1}/{max_retries}...")
+            print(f"⏳ [{label}] Connection attempt {i+1}/{max_retries}...")
             bot = LocalWikiBotV2(
-                wiki_host=WIKI_HOST,
-                bot_user=BOT_USER,
-                bot_pass=BOT_PASS,
-                model_name=MODEL_NAME,
-                base_url=OLLAMA_HOST,
-                lang=WIKI_LANG
+                wiki_host=config["wiki_host"],
+                bot_user=config["bot_user"],
+                bot_pass=config["bot_pass"],
+                model_name=config["model_name"],
+                base_url=config["ollama_host"],
+                lang=config["lang"]
             )
-            print("✅ Connected to Wiki and AI!")
-            break
+            print(f"✅ [{label}] Connected to Wiki and AI!")
+            return bot
         except Exception as e:
-            print(f"⚠️ Connection failed: {e}")
+            print(f"⚠️ [{label}] Connection failed: {e}")
             time.sleep(10)
-    
-    if not bot:
+    return None
+
+def main():
+    WIKI_LANG = os.getenv("WIKI_LANG", "ja")
+    print(f"🚀 Initializing Autonomous Wiki System ({WIKI_LANG.upper()})...")
+
+    bot_config = {
+        "wiki_host": os.getenv("WIKI_HOST", "mediawiki:80"),
+        "bot_user": os.getenv("BOT_USER", "AdminBot"),
+        "bot_pass": os.getenv("BOT_PASS", "password"),
+        "model_name": os.getenv("MODEL_NAME", "gemma2"),
+        "ollama_host": os.getenv("OLLAMA_HOST", "http://ollama:11434/v1"),
+        "lang": WIKI_LANG,
+    }
+    TRENDS_RSS = os.getenv("TRENDS_RSS", "https://trends.google.com/trends/trendingsearches/daily/rss?geo=JP")
+
+    # ワーカープール設定
+    # BOT_WORKERS: 並列に処理するトピック数
+    # STAGE_LIMIT_*: フェーズごとの最大同時実行数（0 = 無制限）。
+    #   単一のOllamaコンテナを守るため、LLM主体の執筆フェーズはデフォルトで1に絞る
+    BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+    # PIPELINE=0（デフォルト）: BOT_WORKERS 個のワーカーがそれぞれ1トピックを最初から最後まで処理する
+    # PIPELINE=1: フェーズごとのステージに分け、執筆中に次のトピックの調査を先行させる（BOT_WORKERS は使わない）
+    #   STAGE_WORKERS_*: ステージごとのワーカー数 / PIPELINE_QUEUE_SIZE: 各ステージの入力キューの上限
+    #   ステージのワーカーごとに Bot（Wikiログイン・LLMクライアント）を生成するため、デフォルトでは6つになる
+    PIPELINE = os.getenv("PIPELINE", "0") == "1"
+    configure_stage_limits({
+        "research": int(os.getenv("STAGE_LIMIT_RESEARCH", "0")),
+        "image": int(os.getenv("STAGE_LIMIT_IMAGE", "0")),
+        "writing": int(os.getenv("STAGE_LIMIT_WRITING", "1")),
+        "quality": int(os.getenv("STAGE_LIMIT_QUALITY", "1")),
+        "publish": int(os.getenv("STAGE_LIMIT_PUBLISH", "0")),
+    })
+
+    # 起動時に接続確認（全ワーカーが失敗し続けるのを避ける）
+    first_bot = connect_bot(bot_config, label="worker-1")
+    if not first_bot:
         print("❌ Fatal Error: Could not connect to services.")
         return
 
-    scheduler = WikiScheduler(db_path="/app/scheduler.db", rss_url=TRENDS_RSS)
-    ingestor = LocalFileIngestor(input_dir="/app/data/inputs")
+    def bot_factory(index: int):
+        if index == 1:
+            return first_bot
+        return connect_bot(bot_config, label=f"worker-{index}")
+
+    # APIサーバーからのタスク追加通知を受け取る（ソケットが作れない環境ではポーリングに戻る）
+    notifier = TaskNotifier(os.getenv("NOTIFY_SOCKET", "/app/run/scheduler.sock"))
+    notifier.listen()
+
+    # 完了済み記事の再調査間隔（日）。調査結果が変わらない記事は REFRESH_MAX_DAYS まで倍々に延ばす
+    scheduler = WikiScheduler(
+        db_path=os.getenv("SCHEDULER_DB", "/app/scheduler.db"), rss_url=TRENDS_RSS, notifier=notifier,
+        refresh_days=float(os.getenv("REFRESH_DAYS", "7")),
+        max_refresh_days=float(os.getenv("REFRESH_MAX_DAYS", "90"))
+    )
+    ingestor = LocalFileIngestor(input_dir="/app/data/inputs", scheduler=scheduler)
 
     # Regular Jobs
     schedule.every(4).hours.do(scheduler.fetch_external_trends)
     schedule.every(10).minutes.do(ingestor.process_new_files)
+    # 再調査予定を過ぎた完了済み記事をキューに戻す（1回に1件ずつ）
+    schedule.every(15).minutes.do(scheduler.schedule_maintenance_tasks)
+    # 調査コーパスから有効期限切れの出典を削除する
+    corpus = get_research_corpus()
+    if corpus:
+        schedule.every(1).days.do(corpus.prune)
 
     scheduler.fetch_external_trends()
     ingestor.process_new_files()
 
+    if PIPELINE:
+        pool = TopicPipeline(scheduler, bot_factory, stage_workers={
+            "research": int(os.getenv("STAGE_WORKERS_RESEARCH", "2")),
+            "image": int(os.getenv("STAGE_WORKERS_IMAGE", "1")),
+            "writing": int(os.getenv("STAGE_WORKERS_WRITING", "1")),
+            "quality": int(os.getenv("STAGE_WORKERS_QUALITY", "1")),
+            "publish": int(os.getenv("STAGE_WORKERS_PUBLISH", "1")),
+        }, queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", "2")))
+        print(f"⚙️  Mode: staged pipeline (PIPELINE=1, BOT_WORKERS ignored, {pool.num_workers} bot instances).")
+    else:
+        pool = TopicWorkerPool(scheduler, bot_factory, num_workers=BOT_WORKERS)
+        print(f"⚙️  Mode: worker pool (PIPELINE=0, BOT_WORKERS={BOT_WORKERS}, {pool.num_workers} bot instances).")
+    pool.start()
+
     print("🔄 Starting main loop...")
     while True:
         try:
             schedule.run_pending()
-            
-            task_topic = scheduler.get_next_task()
-            if task_topic:
-                print(f"▶ PROCESSING: {task_topic}")
-                bot.update_article(task_topic)
-                scheduler.complete_task(task_topic)
-                
-                # 【修正】クールダウンを30秒から1秒に短縮
-                # 次のタスクがあれば即座に取り掛かる
-                print("⚡ Ready for next task...") 
-                time.sleep(1) 
-            else:
-                # タスクがない時は少し休む（CPU節約）
-                time.sleep(5)
-                
-        except Exception as e:
-            print(f"❌ Error in main loop: {e}")
-            time.sleep(60)
-                
+            if pool.alive_count() == 0:
+                print("❌ Fatal Error: All workers have stopped.")
+                return
+            # 次の定期ジョブまで眠る（タスクの配信はワーカー側が通知で起床する）
+            idle = schedule.idle_seconds()
+            time.sleep(min(max(idle if idle is not None else 60, 1), 60))
         except Exception as e:
             print(f"❌ Error in main loop: {e}")
             time.sleep(60)
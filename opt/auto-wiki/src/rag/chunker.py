@@ -0,0 +1,73 @@
+# /opt/auto-wiki/src/rag/chunker.py
+# 日本語タイトル: Wikitext チャンク分割
+# 目的: 記事を「== 見出し ==」単位のセクションに分け、さらに埋め込みモデルの入力長（MiniLM: 256トークン）に
+#       収まる重なり付きウィンドウへ分割する（長い記事の後半も検索対象にする）
+
+import re
+from src.utils.tokens import estimate_tokens
+
+_HEADING_RE = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$", re.MULTILINE)
+# 文単位に分割（日本語の句点・英語の終止符・改行）
+_SENTENCE_RE = re.compile(r"[^。．！？!?\n]*(?:[。．！？!?]+|\n+|$)|[^\n]+")
+
+
+def split_sections(text: str) -> list:
+    """Wikitext を [(見出し, 本文), ...] に分割する（導入部の見出しは空文字）"""
+    sections = []
+    last_end = 0
+    last_title = ""
+    for match in _HEADING_RE.finditer(text):
+        sections.append((last_title, text[last_end:match.start()]))
+        last_title = match.group(2).strip()
+        last_end = match.end()
+    sections.append((last_title, text[last_end:]))
+    return [(title, body.strip()) for title, body in sections if body.strip()]
+
+
+def _split_units(body: str, max_tokens: int) -> list:
+    """本文を文単位に分け、1文が上限を超える場合は文字数で強制分割する"""
+    units = []
+    for sentence in _SENTENCE_RE.findall(body):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        tokens = estimate_tokens(sentence)
+        if tokens <= max_tokens:
+            units.append((sentence, tokens))
+            continue
+        # 長すぎる文: トークン比率から文字数を逆算して分割
+        step = max(1, int(len(sentence) * max_tokens / tokens))
+        for i in range(0, len(sentence), step):
+            piece = sentence[i:i + step]
+            units.append((piece, estimate_tokens(piece)))
+    return units
+
+
+def chunk_wikitext(text: str, max_tokens: int = 200, overlap_tokens: int = 40) -> list:
+    """
+    記事をチャンクに分割する。
+    Returns: [{"section": 見出し, "text": チャンク本文}, ...]
+    """
+    chunks = []
+    for title, body in split_sections(text):
+        # 見出し分の余白を確保する
+        budget = max(16, max_tokens - estimate_tokens(title))
+        window: list[tuple[str, int]] = []
+        window_tokens = 0
+        for unit, tokens in _split_units(body, budget):
+            if window and window_tokens + tokens > budget:
+                chunks.append({"section": title, "text": " ".join(u for u, _ in window)})
+                # 末尾から overlap_tokens 分の文を次のウィンドウへ持ち越す
+                carried: list[tuple[str, int]] = []
+                carried_tokens = 0
+                for u, t in reversed(window):
+                    if carried_tokens + t > overlap_tokens or carried_tokens + t + tokens > budget:
+                        break
+                    carried.insert(0, (u, t))
+                    carried_tokens += t
+                window, window_tokens = carried, carried_tokens
+            window.append((unit, tokens))
+            window_tokens += tokens
+        if window:
+            chunks.append({"section": title, "text": " ".join(u for u, _ in window)})
+    return chunks
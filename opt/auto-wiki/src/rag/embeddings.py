@@ -0,0 +1,140 @@
+# /opt/auto-wiki/src/rag/embeddings.py
+# 日本語タイトル: 埋め込みモデルのプロセス共有レジストリ
+# 目的: SentenceTransformer モデルをプロセス内で一度だけ（初回利用時に）読み込み、全コンポーネントで共有する
+#       EMBEDDING_URL が設定されている場合は、ローカルにモデルを持たずに埋め込みワーカー（APIサーバー）へ問い合わせる
+#       計算済みのベクトルは (モデル名, 本文ハッシュ) をキーにディスクへキャッシュし、同じ本文は再計算しない
+
+import hashlib
+import os
+import threading
+from array import array
+import requests
+from src.utils.disk_cache import DiskCache, cache_path
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+# 埋め込みキャッシュの上限（MB）。0 でキャッシュ無効
+EMBEDDING_CACHE_MB = int(os.getenv("EMBEDDING_CACHE_MB", "512"))
+
+
+class LocalEmbedder:
+    """プロセス内で SentenceTransformer を遅延ロードして使う埋め込み器"""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    print(f"🧠 Loading embedding model: {self.model_name}...")
+                    self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def embed(self, texts: list, batch_size: int = 32) -> list:
+        if not texts:
+            return []
+        vectors = self._get_model().encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+        return vectors.tolist()
+
+
+class RemoteEmbedder:
+    """埋め込みワーカー（APIサーバーの /api/embed）に埋め込み計算を委譲する"""
+
+    def __init__(self, base_url: str, model_name: str = DEFAULT_MODEL_NAME, timeout: float = 120.0):
+        self.base_url = base_url.rstrip("/")
+        self.model_name = model_name
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def embed(self, texts: list, batch_size: int = 32) -> list:
+        if not texts:
+            return []
+        resp = self._session.post(
+            f"{self.base_url}/api/embed",
+            json={"texts": list(texts), "batch_size": batch_size},
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        return resp.json()["embeddings"]
+
+
+def text_hash(text: str) -> str:
+    """本文のハッシュ（埋め込みキャッシュ・チャンク差分判定のキー）"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbedder:
+    """埋め込み器をラップし、計算済みベクトルをディスクキャッシュから返す（未計算の本文だけを埋め込む）"""
+
+    def __init__(self, inner, cache: DiskCache):
+        self.inner = inner
+        self.model_name = inner.model_name
+        self.cache = cache
+
+    def embed(self, texts: list, batch_size: int = 32) -> list:
+        if not texts:
+            return []
+        keys = [f"{self.model_name}:{text_hash(t)}" for t in texts]
+        cached = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.inner.embed(list(missing.values()), batch_size=batch_size)
+            computed = {key: array("f", vec).tobytes() for key, vec in zip(missing, vectors)}
+            try:
+                self.cache.set_many(computed)
+            except Exception as e:
+                print(f"⚠️ Embedding cache write failed: {e}")
+            cached.update(computed)
+
+        return [array("f", cached[key]).tolist() for key in keys]
+
+
+def _with_cache(embedder):
+    """EMBEDDING_CACHE_MB > 0 ならディスクキャッシュ付きにする（キャッシュを開けなければそのまま返す）"""
+    if EMBEDDING_CACHE_MB <= 0:
+        return embedder
+    try:
+        cache = DiskCache(cache_path("embeddings.sqlite"), max_bytes=EMBEDDING_CACHE_MB * 1024 * 1024)
+    except Exception as e:
+        print(f"⚠️ Embedding cache disabled: {e}")
+        return embedder
+    return CachedEmbedder(embedder, cache)
+
+
+_embedder = None
+_local_fallback = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """プロセス共有の埋め込み器を返す（モデル本体は初回の embed() 呼び出し時にロード）"""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                remote_url = os.getenv("EMBEDDING_URL", "").strip()
+                if remote_url:
+                    print(f"🧠 Using remote embedding worker: {remote_url}")
+                    _embedder = _with_cache(RemoteEmbedder(remote_url))
+                else:
+                    _embedder = _with_cache(LocalEmbedder())
+    return _embedder
+
+
+def get_local_embedder():
+    """常にローカルモデルを使う埋め込み器（埋め込みワーカー自身が使用）"""
+    global _local_fallback
+    embedder = get_embedder()
+    if isinstance(getattr(embedder, "inner", embedder), LocalEmbedder):
+        return embedder
+    with _embedder_lock:
+        if _local_fallback is None:
+            _local_fallback = _with_cache(LocalEmbedder())
+    return _local_fallback
@@ -1,17 +1,20 @@
 # /opt/auto-wiki/src/rag/file_ingestor.py
 # 日本語タイトル: ローカルファイル取込インジェスター
 # 目的: inputディレクトリ内のテキストファイルを読み込み、VectorDBに知識として登録する
+#       （*.topics ファイルはシードトピック一覧としてスケジューラーへ一括登録する）
 
 import os
 import glob
 import shutil
-from src.rag.vector_store import WikiVectorDB
+from src.rag.vector_store import get_vector_db
 
 class LocalFileIngestor:
-    def __init__(self, input_dir="/app/data/inputs", processed_dir="/app/data/inputs/processed"):
+    def __init__(self, input_dir="/app/data/inputs", processed_dir="/app/data/inputs/processed", scheduler=None, seed_priority: int = 5):
         self.input_dir = input_dir
         self.processed_dir = processed_dir
-        self.vector_db = WikiVectorDB()
+        self.scheduler = scheduler
+        self.seed_priority = seed_priority
+        self.vector_db = get_vector_db()
         
         # ディレクトリ作成
         os.makedirs(self.input_dir, exist_ok=True)
@@ -21,6 +24,8 @@ class LocalFileIngestor:
         """
         新規ファイルをスキャンし、ベクトルDBに登録後、processedフォルダへ移動する
         """
+        self.process_seed_topics()
+
         # 対象拡張子
         extensions = ['*.txt', '*.md']
         files = []
@@ -32,7 +37,9 @@ class LocalFileIngestor:
 
         print(f"📂 Found {len(files)} local documents to ingest...")
         count = 0
-        
+
+        # 全ファイルを読み込んでから、まとめてバッチ埋め込みする
+        documents = []
         for file_path in files:
             try:
                 filename = os.path.basename(file_path)
@@ -45,16 +52,55 @@ class LocalFileIngestor:
                     # 記事としてではなく、知識ドキュメントとしてベクトル化
                     # ここでは簡易的に「トピック名＝ファイル名」の記事として登録する扱いにする
                     print(f"   - Ingesting: {filename}")
-                    self.vector_db.upsert_article(topic_name, content)
-                    
-                    # 処理済み移動
-                    dest_path = os.path.join(self.processed_dir, filename)
-                    shutil.move(file_path, dest_path)
-                    count += 1
+                    documents.append((file_path, topic_name, content))
             except Exception as e:
                 print(f"❌ Failed to ingest {file_path}: {e}")
+
+        if not documents:
+            return 0
+
+        try:
+            stats = self.vector_db.upsert_articles((topic, content) for _, topic, content in documents)
+            print(f"🧠 Vectorized {len(documents)} documents ({stats['chunks']} chunks, {stats['embedded']} re-embedded).")
+        except Exception as e:
+            print(f"❌ Failed to ingest documents: {e}")
+            return 0
+
+        for file_path, _, _ in documents:
+            try:
+                # 処理済み移動
+                dest_path = os.path.join(self.processed_dir, os.path.basename(file_path))
+                shutil.move(file_path, dest_path)
+                count += 1
+            except Exception as e:
+                print(f"❌ Failed to move {file_path}: {e}")
         
         if count > 0:
             print(f"✅ Successfully ingested {count} documents.")
         
-        return count
\ No newline at end of file
+        return count
+
+    def process_seed_topics(self):
+        """
+        *.topics ファイル（1行1トピック、# はコメント）をスケジューラーへ一括登録し、processedフォルダへ移動する
+        """
+        if not self.scheduler:
+            return 0
+
+        files = glob.glob(os.path.join(self.input_dir, "*.topics"))
+        total = 0
+        for file_path in files:
+            try:
+                filename = os.path.basename(file_path)
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    topics = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+                outcomes = self.scheduler.add_or_update_tasks(topics, priority=self.seed_priority)
+                queued = sum(1 for outcome in outcomes.values() if outcome != "skipped")
+                print(f"🌱 Seed topics from {filename}: {queued} queued, {len(outcomes) - queued} already pending.")
+
+                shutil.move(file_path, os.path.join(self.processed_dir, filename))
+                total += queued
+            except Exception as e:
+                print(f"❌ Failed to import seed topics {file_path}: {e}")
+        return total
@@ -0,0 +1,89 @@
+# /opt/auto-wiki/src/rag/reindex.py
+# 日本語タイトル: ベクトルインデックス全件再構築
+# 目的: MediaWiki の全記事を allpages ジェネレーターで50件ずつ本文ごと取得し、
+#       バッチ埋め込みでベクトルDBを作り直す（進捗と docs/sec を表示）
+#
+# 使い方 (Botコンテナ内):
+#   python -m src.rag.reindex [--reset] [--batch-size 64] [--namespace 0]
+
+import argparse
+import os
+import sys
+import time
+import mwclient
+
+sys.path.append("/app")
+
+from src.rag.vector_store import get_vector_db
+
+
+def iter_wiki_pages(site, namespace: int = 0, page_batch: int = 50):
+    """
+    全記事を (タイトル, 本文) で順に返す。
+    generator=allpages + prop=revisions で、1リクエストあたり page_batch 件の本文をまとめて取得する
+    """
+    params = {
+        "generator": "allpages",
+        "gapnamespace": namespace,
+        "gaplimit": page_batch,
+        "gapfilterredir": "nonredirects",
+        "prop": "revisions",
+        "rvprop": "content",
+        "rvslots": "main",
+    }
+    continue_params: dict[str, str] = {}
+    while True:
+        result = site.api("query", **params, **continue_params)
+        for page in result.get("query", {}).get("pages", {}).values():
+            revisions = page.get("revisions")
+            if not revisions:
+                # 本文が次の継続リクエストで返るページはここでは飛ばす
+                continue
+            revision = revisions[0]
+            content = revision.get("slots", {}).get("main", {}).get("*", revision.get("*", ""))
+            yield page["title"], content
+        if "continue" not in result:
+            break
+        continue_params = result["continue"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the wiki vector index from MediaWiki")
+    parser.add_argument("--reset", action="store_true", help="drop the collection before rebuilding")
+    parser.add_argument("--batch-size", type=int, default=64, help="chunks per embedding batch")
+    parser.add_argument("--namespace", type=int, default=0)
+    args = parser.parse_args()
+
+    wiki_host = os.getenv("WIKI_HOST", "mediawiki:80")
+    site = mwclient.Site(wiki_host, path='/', scheme='http')
+    try:
+        site.login(os.getenv("BOT_USER", "AdminBot"), os.getenv("BOT_PASS", "password"))
+    except Exception as e:
+        print(f"⚠️ Wiki Login Warning: {e}")
+
+    vector_db = get_vector_db()
+    if args.reset:
+        print("🗑️  Dropping existing vector collection...")
+        vector_db.reset()
+
+    print(f"📚 Re-indexing all pages from {wiki_host} (namespace {args.namespace})...")
+    started = time.perf_counter()
+    last_report = [started]
+
+    def report(articles: int, chunks: int, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - last_report[0] < 5:
+            return
+        last_report[0] = now
+        elapsed = max(now - started, 1e-9)
+        print(f"   {articles:,} docs / {chunks:,} chunks  ({articles / elapsed:.1f} docs/s, {chunks / elapsed:.1f} chunks/s)")
+
+    pages = iter_wiki_pages(site, namespace=args.namespace)
+    stats = vector_db.upsert_articles(pages, batch_size=args.batch_size, on_flush=report)
+    report(stats["articles"], stats["chunks"], force=True)
+    print(f"   {stats['embedded']:,} chunks re-embedded, {stats['chunks'] - stats['embedded']:,} unchanged.")
+    print(f"✅ Re-index finished in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
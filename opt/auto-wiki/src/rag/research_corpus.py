@@ -0,0 +1,119 @@
+# /opt/auto-wiki/src/rag/research_corpus.py
+# 日本語タイトル: 調査コーパス（取得済み出典の永続ストア）
+# 目的: 調査で取得・事前フィルターを通過した出典（URL・取得時刻・本文・埋め込み）を専用の Chroma コレクションに保存し、
+#       関連するトピックの調査では Web 検索の前にまずここから意味検索で出典を引く（ディスク上で完結するため数ミリ秒）
+#       取得から RESEARCH_CORPUS_MAX_AGE_DAYS を過ぎた出典は使わず、定期的に削除する
+
+import os
+import threading
+import time
+from src.rag.embeddings import text_hash
+from src.rag.vector_store import get_vector_db
+
+COLLECTION_NAME = "research_corpus"
+# 保存した出典を再利用する期間（日）。0 でコーパスを使わない
+RESEARCH_CORPUS_MAX_AGE_DAYS = float(os.getenv("RESEARCH_CORPUS_MAX_AGE_DAYS", "30"))
+# クエリとのコサイン類似度がこれ未満の出典はヒットとみなさない
+CORPUS_MIN_SIMILARITY = 0.5
+
+
+class ResearchCorpus:
+    def __init__(self, client, embedder, max_age_days: float = RESEARCH_CORPUS_MAX_AGE_DAYS):
+        self.client = client
+        self.embedder = embedder
+        self.max_age_days = max_age_days
+        # 埋め込みは事前フィルターで計算・正規化済みのものを渡すため、コサイン距離で索引する
+        self.collection = client.get_or_create_collection(
+            name=COLLECTION_NAME,
+            embedding_function=None,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def add(self, topic: str, results: list) -> int:
+        """
+        事前フィルター済みの検索結果（"vector" 付き）を保存する。同じ URL は取得時刻ごと上書きする。
+        Returns: 保存した件数
+        """
+        now = time.time()
+        items = {}
+        for res in results:
+            url, vector = res.get("href", ""), res.get("vector")
+            if not url or vector is None:
+                continue
+            items[text_hash(url)] = (res.get("body", "") or res.get("snippet", ""), list(vector), {
+                "url": url,
+                "title": res.get("title", "No Title"),
+                "topic": topic,
+                "fetched_at": now,
+            })
+        if not items:
+            return 0
+        self.collection.upsert(
+            ids=list(items),
+            documents=[item[0] for item in items.values()],
+            embeddings=[item[1] for item in items.values()],
+            metadatas=[item[2] for item in items.values()]
+        )
+        return len(items)
+
+    def lookup(self, query: str, limit: int = 5, min_similarity: float = CORPUS_MIN_SIMILARITY) -> list:
+        """
+        クエリに意味的に近い、有効期限内の出典を返す（検索結果と同じ形式 + "vector"）。
+        埋め込みも返すため、事前フィルターと ResearchContext は再計算しない
+        """
+        if self.max_age_days <= 0 or self.collection.count() == 0:
+            return []
+        raw = self.collection.query(
+            query_embeddings=self.embedder.embed([query]),
+            n_results=limit,
+            where={"fetched_at": {"$gte": time.time() - self.max_age_days * 86400}},
+            include=["documents", "metadatas", "embeddings", "distances"]
+        )
+        hits = []
+        for doc, meta, vector, dist in zip(raw["documents"][0], raw["metadatas"][0], raw["embeddings"][0], raw["distances"][0]):
+            if 1.0 - dist < min_similarity:
+                continue
+            hits.append({
+                "title": meta.get("title", "No Title"),
+                "href": meta.get("url", ""),
+                "body": doc,
+                "vector": [float(x) for x in vector],
+            })
+        return hits
+
+    def prune(self) -> int:
+        """有効期限を過ぎた出典を削除する。Returns: 削除した件数"""
+        if self.max_age_days <= 0:
+            return 0
+        try:
+            expired = self.collection.get(
+                where={"fetched_at": {"$lt": time.time() - self.max_age_days * 86400}}, include=[]
+            )["ids"]
+            if expired:
+                self.collection.delete(ids=expired)
+                print(f"🧹 Pruned {len(expired)} expired sources from the research corpus.")
+            return len(expired)
+        except Exception as e:
+            print(f"⚠️ Research corpus prune failed: {e}")
+            return 0
+
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+
+def get_research_corpus(persist_path="/app/wiki_vector_db") -> ResearchCorpus | None:
+    """プロセス共有の調査コーパスを返す（記事用ベクトルDBと同じ Chroma クライアントを使う。無効・初期化失敗時は None）"""
+    global _corpus
+    if RESEARCH_CORPUS_MAX_AGE_DAYS <= 0:
+        return None
+    if _corpus is None:
+        with _corpus_lock:
+            if _corpus is None:
+                try:
+                    vector_db = get_vector_db(persist_path)
+                    _corpus = ResearchCorpus(vector_db.client, vector_db.embedder)
+                except Exception as e:
+                    print(f"⚠️ Research corpus disabled: {e}")
+                    return None
+    return _corpus
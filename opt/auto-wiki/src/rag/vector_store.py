@@ -1,44 +1,156 @@
 # /opt/auto-wiki/src/rag/vector_store.py
 # ベクトルストア管理
-# 目的: 記事をベクトル化してChromaDBに保存し、意味検索を提供する
+# 目的: 記事をチャンク分割・ベクトル化してChromaDBに保存し、記事単位にまとめた意味検索を提供する
+#       （埋め込みモデルとChromaクライアントはプロセス内で共有する）
+#       チャンクごとに本文ハッシュを持ち、内容が変わっていないチャンクは再ベクトル化しない
 
+import threading
 import chromadb
-from chromadb.utils import embedding_functions
+from src.rag.embeddings import get_embedder, text_hash
+from src.rag.chunker import chunk_wikitext
+
+# MiniLM の入力上限（256トークン）に収まるチャンクサイズ
+CHUNK_MAX_TOKENS = 200
+CHUNK_OVERLAP_TOKENS = 40
+# 埋め込み計算のバッチサイズ（CPU上でまとめてベクトル化する）
+EMBED_BATCH_SIZE = 64
 
 class WikiVectorDB:
     def __init__(self, persist_path="/app/wiki_vector_db"):
         self.client = chromadb.PersistentClient(path=persist_path)
-        
-        # 埋め込みモデル（ローカル動作する軽量モデルを使用）
-        self.ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
-        
+
+        # 埋め込みモデル（ローカル動作する軽量モデル）はプロセス共有のものを使い、ベクトルは自前で計算して渡す
+        self.embedder = get_embedder()
+
         self.collection = self.client.get_or_create_collection(
             name="wiki_articles",
-            embedding_function=self.ef
+            embedding_function=None
         )
 
     def upsert_article(self, topic: str, content: str):
-        """記事をベクトルDBに保存・更新する"""
+        """記事をセクション単位のチャンクに分割してベクトルDBに保存・更新する（古いチャンクは置き換え）"""
         try:
-            # チャンク分割などは簡易的に今回は省略し、全文（または先頭）を入れる
-            # 実運用ではLangChain等でChunking推奨
-            short_content = content[:8000] # トークン制限回避のため制限
-            
-            self.collection.upsert(
-                documents=[short_content],
-                metadatas=[{"topic": topic}],
-                ids=[topic]
-            )
-            print(f"🧠 Vectorized: {topic}")
+            stats = self.upsert_articles([(topic, content)])
+            print(f"🧠 Vectorized: {topic} ({stats['chunks']} chunks, {stats['embedded']} re-embedded)")
         except Exception as e:
             print(f"⚠️ Vector DB Error: {e}")
 
-    def search(self, query: str, n_results: int = 3):
-        """関連する記事を検索する"""
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
+    def upsert_articles(self, articles, batch_size: int = EMBED_BATCH_SIZE, on_flush=None) -> dict:
+        """
+        複数記事をまとめて登録する（バッチ埋め込み）。
+        チャンクごとに本文ハッシュをメタデータに保存し、内容が変わっていないチャンクは埋め込みも書き込みも省略する。
+        articles: (topic, content) のイテラブル（ジェネレーター可。逐次チャンク化して batch_size ごとに埋め込む）
+        on_flush: バッチ書き込み後に呼ばれるコールバック (処理済み記事数, 処理済みチャンク数)
+        Returns: {"articles": 記事数, "chunks": チャンク数, "embedded": 新規・変更で埋め込んだチャンク数}
+        """
+        pending: dict[str, list[tuple[str, str, dict]]] = {}
+        pending_chunks = 0
+        stats = {"articles": 0, "chunks": 0, "embedded": 0}
+
+        def flush():
+            nonlocal pending_chunks
+            if not pending:
+                return
+            # 既存チャンクのハッシュを取得し、差分だけを書き込む
+            existing = self.collection.get(where={"topic": {"$in": list(pending)}}, include=["metadatas"])
+            existing_hashes = {
+                chunk_id: (meta or {}).get("hash")
+                for chunk_id, meta in zip(existing["ids"], existing["metadatas"])
+            }
+            items = [item for chunks in pending.values() for item in chunks]
+            new_ids = {item[0] for item in items}
+            stale = [chunk_id for chunk_id in existing_hashes if chunk_id not in new_ids]
+            if stale:
+                self.collection.delete(ids=stale)
+
+            changed = [item for item in items if existing_hashes.get(item[0]) != item[2]["hash"]]
+            if changed:
+                documents = [item[1] for item in changed]
+                self.collection.upsert(
+                    ids=[item[0] for item in changed],
+                    documents=documents,
+                    embeddings=self.embedder.embed(documents, batch_size=batch_size),
+                    metadatas=[item[2] for item in changed]
+                )
+            stats["articles"] += len(pending)
+            stats["chunks"] += len(items)
+            stats["embedded"] += len(changed)
+            pending.clear()
+            pending_chunks = 0
+            if on_flush:
+                on_flush(stats["articles"], stats["chunks"])
+
+        for topic, content in articles:
+            if topic in pending:
+                # 同じ記事がバッチ内で重複した場合は後勝ち
+                pending_chunks -= len(pending.pop(topic))
+            chunks = chunk_wikitext(content or "", max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+            items = []
+            for i, c in enumerate(chunks):
+                # 埋め込む本文には記事名と見出しを含めて文脈を補う
+                document = f"{topic} - {c['section']}\n{c['text']}" if c["section"] else f"{topic}\n{c['text']}"
+                meta = {"topic": topic, "section": c["section"], "chunk": i, "hash": text_hash(document)}
+                items.append((f"{topic}::{i}", document, meta))
+            pending[topic] = items
+            pending_chunks += len(items)
+            if pending_chunks >= batch_size:
+                flush()
+        flush()
+        return stats
+
+    def reset(self):
+        """コレクションを削除して作り直す（全件再構築用）"""
+        self.client.delete_collection(name="wiki_articles")
+        self.collection = self.client.get_or_create_collection(
+            name="wiki_articles",
+            embedding_function=None
         )
-        return results
\ No newline at end of file
+
+    def search(self, query: str, n_results: int = 3, chunks_per_topic: int = 3):
+        """
+        関連する記事を検索する。
+        チャンク単位で検索した結果を記事（topic）ごとにまとめ、上位 n_results 記事を返す
+        （戻り値は Chroma の query 結果と同じ形式: documents[0] / metadatas[0] / distances[0]）
+        """
+        raw = self.collection.query(
+            query_embeddings=self.embedder.embed([query]),
+            n_results=n_results * chunks_per_topic * 2
+        )
+
+        grouped: dict[str, dict] = {}
+        for doc, meta, dist in zip(raw["documents"][0], raw["metadatas"][0], raw["distances"][0]):
+            topic = meta.get("topic", "Unknown")
+            group = grouped.setdefault(topic, {"distance": dist, "chunks": []})
+            group["distance"] = min(group["distance"], dist)
+            if len(group["chunks"]) < chunks_per_topic:
+                group["chunks"].append((meta.get("chunk", 0), meta.get("section", ""), doc))
+
+        ranked = sorted(grouped.items(), key=lambda item: item[1]["distance"])[:n_results]
+        documents, metadatas, distances = [], [], []
+        for topic, group in ranked:
+            # 記事内の順序に並べ直して結合
+            chunks = sorted(group["chunks"])
+            documents.append("\n...\n".join(doc for _, _, doc in chunks))
+            metadatas.append({"topic": topic, "sections": [section for _, section, _ in chunks]})
+            distances.append(group["distance"])
+
+        return {
+            "ids": [[topic for topic, _ in ranked]],
+            "documents": [documents],
+            "metadatas": [metadatas],
+            "distances": [distances],
+        }
+
+
+_instances: dict[str, WikiVectorDB] = {}
+_instances_lock = threading.Lock()
+
+
+def get_vector_db(persist_path="/app/wiki_vector_db") -> WikiVectorDB:
+    """保存先パスごとに1つの WikiVectorDB をプロセス内で共有する"""
+    with _instances_lock:
+        db = _instances.get(persist_path)
+        if db is None:
+            db = WikiVectorDB(persist_path)
+            _instances[persist_path] = db
+        return db
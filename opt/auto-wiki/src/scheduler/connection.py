@@ -0,0 +1,72 @@
+# /opt/auto-wiki/src/scheduler/connection.py
+# 日本語タイトル: SQLite 接続マネージャー
+# 目的: スレッドごとに長寿命のDB接続を保持して再利用し、接続確立コストとジャーナルロック競合を減らす
+#       （Botのメインループ / ワーカープール / FastAPIのスレッドプールから安全に利用できる）
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# 接続ごとに設定するPRAGMA（journal_mode=WAL はDBファイルに永続化されるため migrations 側で設定）
+DEFAULT_PRAGMAS = {
+    "synchronous": "NORMAL",     # WALモードではNORMALでも破損しない（コミット毎のfsyncを省略）
+    "mmap_size": 268435456,      # 256MB までメモリマップドI/Oで読む
+    "cache_size": -16384,        # ページキャッシュ 16MB（負の値はKiB指定）
+    "temp_store": "MEMORY",
+}
+
+
+class SQLiteConnectionManager:
+    def __init__(self, db_path: str, timeout: float = 30.0, pragmas: dict | None = None, cached_statements: int = 256):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        # sqlite3 モジュールのプリペアドステートメントキャッシュ（同一SQL文字列は再コンパイルしない）
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._all: list[sqlite3.Connection] = []
+        self._all_lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        """呼び出し元スレッド専用の接続を返す（初回のみ生成）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=self.timeout,
+                cached_statements=self.cached_statements,
+                isolation_level=None,  # トランザクションは transaction() で明示的に管理する
+                check_same_thread=False,  # 利用は所有スレッドのみ。close_all() を別スレッドから呼べるようにする
+            )
+            for name, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {name}={value}")
+            self._local.conn = conn
+            with self._all_lock:
+                self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate: bool = True):
+        """
+        書き込みトランザクション。
+        immediate=True の場合は開始時に書き込みロックを確保する（途中でのロック昇格待ちによるデッドロックを避ける）
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close_all(self):
+        """全スレッドの接続を閉じる（プロセス終了時用）"""
+        with self._all_lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
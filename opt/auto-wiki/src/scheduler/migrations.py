@@ -0,0 +1,125 @@
+# /opt/auto-wiki/src/scheduler/migrations.py
+# 日本語タイトル: scheduler.db スキーママイグレーション
+# 目的: PRAGMA user_version でスキーマのバージョンを管理し、未適用のマイグレーションだけを順番に適用する
+#       （インデックス追加やカラム追加を既存DBに安全に反映する）
+
+import sqlite3
+
+
+def _m001_create_tasks(cursor):
+    """初期スキーマ"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT UNIQUE NOT NULL,
+            priority INTEGER DEFAULT 5,
+            status TEXT DEFAULT 'PENDING',  -- PENDING, RUNNING, FINISHED
+            next_run TIMESTAMP,
+            last_run TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _m002_add_lease_columns(cursor):
+    """リース方式のタスク取得用カラム（バージョン管理導入前に追加済みのDBもある）"""
+    columns = _columns(cursor, "tasks")
+    if "worker_id" not in columns:
+        cursor.execute("ALTER TABLE tasks ADD COLUMN worker_id TEXT")
+    if "lease_expires" not in columns:
+        cursor.execute("ALTER TABLE tasks ADD COLUMN lease_expires TIMESTAMP")
+
+
+def _m003_add_queue_indexes(cursor):
+    """キュー操作用の複合インデックス"""
+    # タスク取得: WHERE status = 'PENDING' AND next_run <= ? ORDER BY priority DESC, next_run ASC
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_claim ON tasks (status, priority DESC, next_run)")
+    # メンテナンス再キュー: WHERE status = 'FINISHED' AND last_run < ? ORDER BY last_run
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_last_run ON tasks (status, last_run)")
+    # 期限切れリースの回収: WHERE status = 'RUNNING' AND lease_expires < ?
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_lease ON tasks (status, lease_expires)")
+
+
+def _m004_add_status_rank(cursor):
+    """管理画面の並び順（RUNNING → PENDING → その他）をインデックス化された列として保持する"""
+    if "status_rank" not in _columns(cursor, "tasks"):
+        cursor.execute('''
+            ALTER TABLE tasks ADD COLUMN status_rank INTEGER
+            GENERATED ALWAYS AS (
+                CASE status WHEN 'RUNNING' THEN 1 WHEN 'PENDING' THEN 2 ELSE 3 END
+            ) VIRTUAL
+        ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_rank ON tasks (status_rank, next_run)")
+
+
+def _m005_add_next_run_index(cursor):
+    """次回実行時刻の最小値（アイドル時の待機時間計算）用"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_next_run ON tasks (status, next_run)")
+
+
+def _m006_add_refresh_columns(cursor):
+    """記事の再調査間隔を適応的に決めるためのカラム（調査結果の指紋・連続で変化が無かった回数・現在の間隔）"""
+    columns = _columns(cursor, "tasks")
+    if "research_fingerprint" not in columns:
+        cursor.execute("ALTER TABLE tasks ADD COLUMN research_fingerprint TEXT")
+    if "stable_runs" not in columns:
+        cursor.execute("ALTER TABLE tasks ADD COLUMN stable_runs INTEGER DEFAULT 0")
+    if "refresh_days" not in columns:
+        cursor.execute("ALTER TABLE tasks ADD COLUMN refresh_days REAL")
+    # 完了済みタスクの next_run を「次回の再調査予定」として使う（従来の7日間隔で埋める）
+    cursor.execute('''
+        UPDATE tasks SET next_run = datetime(COALESCE(last_run, created_at), '+7 days')
+        WHERE status = 'FINISHED' AND next_run IS NULL
+    ''')
+
+
+# (バージョン, 適用関数) の一覧。追加時は末尾にバージョンを1つ増やして追記すること
+MIGRATIONS = [
+    (1, _m001_create_tasks),
+    (2, _m002_add_lease_columns),
+    (3, _m003_add_queue_indexes),
+    (4, _m004_add_status_rank),
+    (5, _m005_add_next_run_index),
+    (6, _m006_add_refresh_columns),
+]
+
+
+def _columns(cursor, table: str) -> set:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    WALモードを有効化し、未適用のマイグレーションを適用する。
+    各マイグレーションは BEGIN IMMEDIATE で書き込みロックを取ってから user_version を読み直し、
+    DDL とバージョン更新を1トランザクションで適用する（途中で失敗しても中途半端なスキーマが残らず、
+    Bot と APIサーバーが同時に起動しても同じマイグレーションを二重に適用しない）
+    conn は isolation_level=None（自動トランザクションなし）の接続であること
+    Returns: 適用後のスキーマバージョン
+    """
+    # WALはDBファイルに永続化されるため一度設定すれば良い（読み取りと書き込みが互いをブロックしない）
+    conn.execute("PRAGMA journal_mode=WAL")
+
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # ロック待ちの間に他プロセスが適用している場合がある
+            current = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version <= current:
+                cursor.execute("COMMIT")
+                continue
+            migrate(cursor)
+            # PRAGMA はパラメータ束縛できないため整数を直接埋め込む
+            cursor.execute(f"PRAGMA user_version = {int(version)}")
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        print(f"🗄️  Applied scheduler.db migration v{version} ({migrate.__name__}).")
+        current = version
+    return current
@@ -0,0 +1,83 @@
+# /opt/auto-wiki/src/scheduler/notifier.py
+# 日本語タイトル: タスク追加通知チャネル
+# 目的: APIサーバー等でタスクが追加された瞬間にBotを起こす（ローカルUnixソケット経由）
+#       Bot側は「最も早い next_run まで」または「通知が来るまで」眠るため、無駄なポーリングが発生しない
+
+import os
+import socket
+import threading
+
+
+class TaskNotifier:
+    def __init__(self, socket_path: str = "/app/run/scheduler.sock"):
+        self.socket_path = socket_path
+        self.listening = False
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._sock: socket.socket | None = None
+
+    # --- 送信側 (APIサーバー / 同一プロセス内) ---
+    def notify(self):
+        """待機中のワーカーを起こす（同一プロセス内と、ソケットで待ち受けている別プロセスの両方）"""
+        self.wake_local()
+        if self.listening:
+            # 自プロセスが受信側の場合はソケット送信不要
+            return
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                sock.setblocking(False)
+                sock.sendto(b"wake", self.socket_path)
+        except OSError:
+            # 受信側が起動していない / 受信バッファが満杯（既に起床予定）の場合は無視
+            pass
+
+    # --- 受信側 (Bot) ---
+    def listen(self) -> bool:
+        """ソケットを作成して通知の受信を開始する。失敗した場合は False（呼び出し側はポーリングに戻す）"""
+        try:
+            os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                sock.bind(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+        except OSError as e:
+            print(f"⚠️ Task notifier unavailable ({self.socket_path}): {e}. Falling back to polling.")
+            return False
+
+        self._sock = sock
+        self.listening = True
+        t = threading.Thread(target=self._receive_loop, name="task-notifier", daemon=True)
+        t.start()
+        print(f"📡 Listening for task notifications on {self.socket_path}")
+        return True
+
+    def _receive_loop(self):
+        while True:
+            try:
+                self._sock.recv(64)
+            except OSError:
+                return
+            self.wake_local()
+
+    def wake_local(self):
+        """同一プロセス内で待機中のワーカーだけを起こす"""
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def token(self) -> int:
+        """
+        待機前に取得する世代番号。
+        タスク取得を試みる前に取得しておくことで、取得〜待機の間に届いた通知を取りこぼさない
+        """
+        with self._cond:
+            return self._generation
+
+    def wait(self, token: int, timeout: float) -> bool:
+        """通知が来るか timeout 秒経過するまで待つ。通知で起きた場合 True"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._generation != token, timeout=max(0.0, timeout))
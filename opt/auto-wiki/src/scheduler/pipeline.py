@@ -0,0 +1,254 @@
+# /opt/auto-wiki/src/scheduler/pipeline.py
+# 日本語タイトル: ステージ分割型トピック処理パイプライン
+# 目的: update_article の各フェーズ（調査・画像選定・執筆・品質チェック・投稿）を、専用のワーカーと上限付きキューを持つステージに分け、
+#       LLM が現在のトピックを執筆している間に次のトピックの調査（ネットワーク待ち）を先行して進める
+#       ステージごとのキュー長・処理時間を JSON に書き出し、ダッシュボードに表示する
+
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from src.scheduler.worker_pool import TopicWorkerPool
+
+# パイプラインのステージ（LocalWikiBotV2 のフェーズ名と同じ順）
+STAGES = ("research", "image", "writing", "quality", "publish")
+
+# 計測結果の出力先（Botとダッシュボードで共有している src ボリューム上。言語ごとに分ける）
+PIPELINE_METRICS_FILE = os.getenv("PIPELINE_METRICS_FILE", f"/app/src/pipeline_metrics_{os.getenv('WIKI_LANG', 'ja')}.json")
+METRICS_DUMP_INTERVAL = 10.0
+
+
+class StageMetrics:
+    """ステージごとの処理件数・処理時間・キュー待ち時間（プロセス内で共有）"""
+
+    def __init__(self, path: str = PIPELINE_METRICS_FILE, window: int = 200):
+        self.path = path
+        self.window = window
+        self._stats: dict[str, dict] = {}
+        self._gauges: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._last_dump = 0.0
+
+    def _stat(self, stage: str) -> dict:
+        return self._stats.setdefault(stage, {
+            "processed": 0, "failed": 0, "busy": 0,
+            "durations": deque(maxlen=self.window), "waits": deque(maxlen=self.window),
+        })
+
+    def started(self, stage: str, wait: float):
+        with self._lock:
+            stat = self._stat(stage)
+            stat["busy"] += 1
+            stat["waits"].append(wait)
+
+    def finished(self, stage: str, duration: float, ok: bool = True):
+        with self._lock:
+            stat = self._stat(stage)
+            stat["busy"] -= 1
+            stat["processed" if ok else "failed"] += 1
+            stat["durations"].append(duration)
+
+    def set_gauges(self, gauges: dict):
+        """その時点のキュー長などの値（{ステージ: {名前: 値}}）"""
+        with self._lock:
+            self._gauges = gauges
+
+    def snapshot(self) -> dict:
+        """{stage: 集計値} を返す"""
+        result = {}
+        with self._lock:
+            for stage in STAGES:
+                stat = self._stat(stage)
+                durations = sorted(stat["durations"])
+                waits = stat["waits"]
+                result[stage] = {
+                    **self._gauges.get(stage, {}),
+                    "busy": stat["busy"],
+                    "processed": stat["processed"],
+                    "failed": stat["failed"],
+                    "avg_s": round(sum(durations) / len(durations), 2) if durations else 0.0,
+                    "p95_s": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 2) if durations else 0.0,
+                    "avg_wait_s": round(sum(waits) / len(waits), 2) if waits else 0.0,
+                }
+        return result
+
+    def maybe_dump(self):
+        if time.monotonic() - self._last_dump >= METRICS_DUMP_INTERVAL:
+            self.dump()
+
+    def dump(self):
+        """集計値をJSONファイルに書き出す（ダッシュボードが読む）"""
+        self._last_dump = time.monotonic()
+        if not self.path:
+            return
+        data = {"updated_at": time.time(), "stages": self.snapshot()}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Pipeline metrics dump failed: {e}")
+
+
+def load_pipeline_metrics(path: str = PIPELINE_METRICS_FILE) -> dict:
+    """他プロセス（Bot）が書き出した計測結果を読み込む"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class TopicPipeline(TopicWorkerPool):
+    def __init__(self, scheduler, bot_factory, stage_workers: dict | None = None, queue_size: int = 2,
+                 idle_sleep: float = 5.0, max_idle: float = 300.0, metrics: StageMetrics | None = None):
+        """
+        scheduler: WikiScheduler インスタンス
+        bot_factory: ワーカー番号を受け取り LocalWikiBotV2 を返す関数（ステージのワーカーごとに1つ生成する）
+        stage_workers: ステージ名 -> ワーカー数（省略したステージは1）
+        queue_size: 各ステージの入力キューの上限（調査が執筆より先行できるトピック数の上限になる）
+        """
+        stage_workers = stage_workers or {}
+        self.stage_workers = {stage: max(1, int(stage_workers.get(stage) or 1)) for stage in STAGES}
+        super().__init__(scheduler, bot_factory, num_workers=sum(self.stage_workers.values()),
+                         idle_sleep=idle_sleep, max_idle=max_idle)
+        self.queue_size = max(1, queue_size)
+        self.queues: dict[str, queue.Queue] = {stage: queue.Queue(maxsize=self.queue_size) for stage in STAGES}
+        self.metrics = metrics or StageMetrics()
+        self._stage_threads: dict[str, list[threading.Thread]] = {stage: [] for stage in STAGES}
+        # タスクごとに一意のワーカーID（複数トピックが同時に進行するため、リースはタスク単位で持つ）
+        self._task_ids = itertools.count(1)
+
+    def start(self):
+        """ステージごとのワーカーと、タスクを取得して先頭ステージに流すフィーダーを起動する"""
+        print(f"👷 Starting topic pipeline ({', '.join(f'{s}={n}' for s, n in self.stage_workers.items())}, queue={self.queue_size})...")
+        index = 0
+        for stage in STAGES:
+            for n in range(self.stage_workers[stage]):
+                index += 1
+                t = threading.Thread(target=self._stage_loop, args=(stage, index), name=f"{stage}-{n + 1}", daemon=True)
+                t.start()
+                self._threads.append(t)
+                self._stage_threads[stage].append(t)
+
+        feeder = threading.Thread(target=self._feeder_loop, name="pipeline-feeder", daemon=True)
+        feeder.start()
+        self._threads.append(feeder)
+
+        hb = threading.Thread(target=self._heartbeat_loop, name="lease-heartbeat", daemon=True)
+        hb.start()
+
+    def alive_count(self) -> int:
+        """ワーカーが1つも残っていないステージがあればパイプラインは進まないため 0 を返す"""
+        if any(not any(t.is_alive() for t in threads) for threads in self._stage_threads.values()):
+            return 0
+        return super().alive_count()
+
+    def _update_gauges(self):
+        self.metrics.set_gauges({
+            stage: {"workers": self.stage_workers[stage], "queued": self.queues[stage].qsize(), "capacity": self.queue_size}
+            for stage in STAGES
+        })
+        self.metrics.maybe_dump()
+
+    def _put(self, stage: str, job: dict) -> bool:
+        """次のステージのキューに空きができるまで待って投入する（停止時は False）"""
+        job["queued_at"] = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.queues[stage].put(job, timeout=1.0)
+                return True
+            except queue.Full:
+                self._update_gauges()
+        return False
+
+    def _feeder_loop(self):
+        """先頭ステージのキューに空きがある間だけタスクを取得する（先行取得は queue_size 件まで）"""
+        notifier = self.scheduler.notifier
+        while not self._stop.is_set():
+            self._update_gauges()
+            if self.queues[STAGES[0]].full():
+                self._stop.wait(1.0)
+                continue
+
+            token = notifier.token() if notifier else None
+            worker_id = f"{self._id_prefix}-p{next(self._task_ids)}"
+            try:
+                tasks = self.scheduler.claim_tasks(worker_id, limit=1)
+            except Exception as e:
+                print(f"❌ [feeder] Failed to fetch task: {e}")
+                self._stop.wait(60)
+                continue
+
+            if not tasks:
+                try:
+                    self._wait_for_work(token)
+                except Exception as e:
+                    print(f"⚠️ [feeder] Wait failed: {e}")
+                    self._stop.wait(self.idle_sleep)
+                continue
+
+            topic, priority = tasks[0]["topic"], tasks[0]["priority"]
+            with self._active_lock:
+                self._active[worker_id] = topic
+            try:
+                previous_fingerprint = self.scheduler.get_research_fingerprint(topic)
+            except Exception as e:
+                print(f"⚠️ [feeder] Could not read fingerprint for '{topic}': {e}")
+                previous_fingerprint = None
+            print(f"▶ [feeder] QUEUED: {topic}")
+            job = {"worker_id": worker_id, "topic": topic, "previous_fingerprint": previous_fingerprint, "priority": priority}
+            if not self._put(STAGES[0], job):
+                self._release(job)
+
+    def _stage_loop(self, stage: str, index: int):
+        name = f"{stage}-worker-{index}"
+        # Botはワーカーごとに生成する（mwclient / OpenAIクライアントをスレッド間で共有しない）
+        bot = self.bot_factory(index)
+        if not bot:
+            print(f"❌ [{name}] Could not initialize bot. Worker exiting.")
+            return
+
+        next_stage = STAGES[STAGES.index(stage) + 1] if stage != STAGES[-1] else None
+        while not self._stop.is_set():
+            try:
+                job = self.queues[stage].get(timeout=1.0)
+            except queue.Empty:
+                self._update_gauges()
+                continue
+
+            topic = job["topic"]
+            self.metrics.started(stage, time.monotonic() - job.pop("queued_at", time.monotonic()))
+            started = time.monotonic()
+            try:
+                bot.run_phase(stage, job)
+            except Exception as e:
+                self.metrics.finished(stage, time.monotonic() - started, ok=False)
+                print(f"❌ [{name}] Task '{topic}' failed: {e}")
+                self._release(job, failed=True)
+                continue
+            self.metrics.finished(stage, time.monotonic() - started)
+
+            if "outcome" in job or next_stage is None:
+                self._release(job)
+                print(f"⚡ [{name}] Finished: {topic} ({job.get('outcome', {}).get('status')})")
+            elif not self._put(next_stage, job):
+                self._release(job)
+
+    def _release(self, job: dict, failed: bool = False):
+        """ジョブの結果をスケジューラーに記録してリースを手放す（停止で中断したジョブは再試行に回す）"""
+        worker_id, topic = job["worker_id"], job["topic"]
+        try:
+            if failed or "outcome" not in job:
+                self.scheduler.fail_task(topic, worker_id)
+            else:
+                self.scheduler.complete_task(topic, worker_id, outcome=job["outcome"])
+        except Exception as e:
+            print(f"⚠️ Could not record result for '{topic}': {e}")
+        finally:
+            with self._active_lock:
+                self._active.pop(worker_id, None)
@@ -1,80 +1,109 @@
 # /opt/auto-wiki/src/scheduler/task_manager.py
-# タスク管理マネージャー (v2.8 - タスク削除機能追加)
+# タスク管理マネージャー (v3.2 - イベント駆動のタスク配信)
 # 目的: タスクのキューイング、トレンド情報の取得、DB操作を行う
 
 import sqlite3
 import time
 import feedparser
 from datetime import datetime, timedelta
+from src.scheduler.connection import SQLiteConnectionManager
+from src.scheduler.migrations import apply_migrations
+
+# UPDATE ... RETURNING は SQLite 3.35 以降で利用可能
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
 
 class WikiScheduler:
-    def __init__(self, db_path="/app/scheduler.db", rss_url="https://trends.google.com/trends/trendingsearches/daily/rss?geo=JP"):
+    def __init__(self, db_path="/app/scheduler.db", rss_url="https://trends.google.com/trends/trendingsearches/daily/rss?geo=JP", lease_seconds: int = 600, notifier=None,
+                 refresh_days: float = 7.0, min_refresh_days: float = 1.0, max_refresh_days: float = 90.0):
         self.db_path = db_path
+        # タスク追加時に待機中のワーカーを起こす通知チャネル（TaskNotifier、任意）
+        self.notifier = notifier
         self.rss_url = rss_url
+        # タスク取得時に付与するリース期間（ハートビートで延長されない場合、期限切れで再キューされる）
+        self.lease_seconds = lease_seconds
+        # 期限切れリースの回収はポーリング毎ではなく一定間隔でのみ行う
+        self._reclaim_interval = 30
+        self._last_reclaim = 0.0
+        # 完了済み記事の再調査間隔（日）。調査結果が変わらなければ倍々に延ばし、変われば半分に縮める
+        self.refresh_days = refresh_days
+        self.min_refresh_days = min_refresh_days
+        self.max_refresh_days = max(refresh_days, max_refresh_days)
+        # スレッドごとの長寿命接続（毎回の connect/close を行わない）
+        self._db = SQLiteConnectionManager(db_path, timeout=30.0)
         self._init_db()
         self._reset_stuck_tasks() # 起動時にスタックしたタスクをリセット
 
     def _get_conn(self):
-        """タイムアウト設定付きのDB接続を取得"""
-        return sqlite3.connect(self.db_path, timeout=30.0)
+        """呼び出し元スレッド用のDB接続を取得（接続は再利用されるため close しないこと）"""
+        return self._db.connection()
+
+    def _notify(self):
+        if self.notifier:
+            self.notifier.notify()
+
+    def close(self):
+        """全スレッドのDB接続を閉じる"""
+        self._db.close_all()
 
     def _init_db(self):
-        """データベースとテーブルの初期化"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                topic TEXT UNIQUE NOT NULL,
-                priority INTEGER DEFAULT 5,
-                status TEXT DEFAULT 'PENDING',  -- PENDING, RUNNING, FINISHED
-                next_run TIMESTAMP,
-                last_run TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        """データベースの初期化（WAL有効化とスキーママイグレーション）"""
+        apply_migrations(self._get_conn())
 
     def _reset_stuck_tasks(self):
-        """起動時にRUNNING状態のままのタスクをPENDINGに戻す（異常終了対策）"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE tasks SET status = 'PENDING' WHERE status = 'RUNNING'")
-        if cursor.rowcount > 0:
-            print(f"🔄 Reset {cursor.rowcount} stuck tasks from RUNNING to PENDING.")
-        conn.commit()
-        conn.close()
-
-    def schedule_maintenance_tasks(self, interval_days=7):
-        """アイドル時に実行: 古い記事を再チェックリストに追加する"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        
-        threshold = datetime.now() - timedelta(days=interval_days)
-        cursor.execute('''
-            SELECT id, topic FROM tasks 
-            WHERE status = 'FINISHED' 
-            AND (last_run IS NULL OR last_run < ?)
-            ORDER BY last_run ASC
-            LIMIT 1
-        ''', (threshold,))
-        
-        row = cursor.fetchone()
-        if row:
-            task_id, topic = row
-            print(f"♻️  Scheduling maintenance for old article: {topic}")
-            cursor.execute('''
-                UPDATE tasks 
-                SET status = 'PENDING', priority = 3, next_run = ? 
-                WHERE id = ?
-            ''', (datetime.now(), task_id))
-            conn.commit()
-            conn.close()
-            return True
+        """
+        起動時にRUNNING状態のままのタスクをPENDINGに戻す（異常終了対策）
+        他プロセスが有効なリースを保持しているタスクには触れない
+        """
+        count = self._reclaim_expired_leases(force=True)
+        if count > 0:
+            print(f"🔄 Reset {count} stuck tasks from RUNNING to PENDING.")
+
+    def _reclaim_expired_leases(self, force: bool = False) -> int:
+        """
+        リース期限が切れたRUNNINGタスク（ゾンビ）をPENDINGに戻す
+        force=True（起動時）は、リースを持たないRUNNINGタスクも経過時間によらずすべて戻す
+        """
+        if not force and time.monotonic() - self._last_reclaim < self._reclaim_interval:
+            return 0
+        self._last_reclaim = time.monotonic()
+
+        now = datetime.now()
+        # リース導入前のタスク（lease_expires が NULL）は通常30分で救出する。
+        # 取得時には必ずリースを付けるため、起動時に残っているものは異常終了で取り残されたタスクとみなす
+        legacy_threshold = now - timedelta(minutes=30)
+        cursor = self._get_conn().execute('''
+            UPDATE tasks 
+            SET status = 'PENDING', worker_id = NULL, lease_expires = NULL 
+            WHERE status = 'RUNNING' 
+            AND (lease_expires < ? OR (lease_expires IS NULL AND (? OR last_run IS NULL OR last_run < ?)))
+        ''', (now, force, legacy_threshold))
+        return cursor.rowcount
+
+    def schedule_maintenance_tasks(self):
+        """アイドル時に実行: 再調査の予定時刻（完了時に記事ごとに決めた next_run）を過ぎた記事を1件再キューする"""
+        now = datetime.now()
+        with self._db.transaction() as conn:
+            # 完了済みタスクの next_run は再調査予定（idx_tasks_status_next_run で最も早い1件だけを読む）
+            row = conn.execute('''
+                SELECT id, topic FROM tasks 
+                WHERE status = 'FINISHED' AND next_run <= ?
+                ORDER BY next_run ASC
+                LIMIT 1
+            ''', (now,)).fetchone()
             
-        conn.close()
-        return False
+            if row:
+                task_id, topic = row
+                print(f"♻️  Scheduling maintenance for old article: {topic}")
+                conn.execute('''
+                    UPDATE tasks 
+                    SET status = 'PENDING', priority = 3, next_run = ? 
+                    WHERE id = ?
+                ''', (now, task_id))
+            else:
+                return False
+
+        self._notify()
+        return True
 
     def fetch_external_trends(self):
         """Google Trends (RSS) から急上昇ワードを取得してタスクに追加"""
@@ -82,123 +111,214 @@ class WikiScheduler:
         
         try:
             feed = feedparser.parse(self.rss_url)
-            
-            count = 0
-            for entry in feed.entries:
-                topic = entry.title
-                if self.add_or_update_task(topic, priority=8):
-                    count += 1
+            outcomes = self.add_or_update_tasks((entry.title for entry in feed.entries), priority=8)
+            count = sum(1 for outcome in outcomes.values() if outcome != "skipped")
             print(f"🌍 Added {count} new trending topics.")
         except Exception as e:
             print(f"⚠️ Failed to fetch trends: {e}")
 
     def add_or_update_task(self, topic: str, priority: int = 5, volatility_days: int = 1):
-        """タスクを追加または更新する"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id, status FROM tasks WHERE topic = ?", (topic,))
-        row = cursor.fetchone()
-        
-        if row:
-            if row[1] == 'FINISHED':
-                next_run = datetime.now()
-                cursor.execute('''
-                    UPDATE tasks 
-                    SET status = 'PENDING', priority = ?, next_run = ? 
-                    WHERE id = ?
-                ''', (priority, next_run, row[0]))
-                conn.commit()
-                conn.close()
-                return True
-            
-            conn.commit()
-            conn.close()
-            return False
-        else:
-            next_run = datetime.now()
-            cursor.execute('''
+        """タスクを追加または更新する（追加・再キューされた場合 True）"""
+        outcomes = self.add_or_update_tasks([(topic, priority)])
+        return outcomes.get(topic, "skipped") != "skipped"
+
+    def add_or_update_tasks(self, topics, priority: int = 5) -> dict:
+        """
+        複数タスクを1トランザクションで追加・更新する。
+        topics: トピック名、または (トピック名, 優先度) のイテラブル
+        Returns: {topic: "added" | "requeued" | "skipped"}
+          added    : 新規追加
+          requeued : FINISHED だったタスクを PENDING に戻した
+          skipped  : 既に PENDING / RUNNING のため変更なし
+        """
+        items = {}
+        for item in topics:
+            if isinstance(item, (tuple, list)):
+                topic, item_priority = item[0], item[1]
+            else:
+                topic, item_priority = item, priority
+            if topic:
+                items[topic] = item_priority
+        if not items:
+            return {}
+
+        now = datetime.now()
+        outcomes = {}
+        with self._db.transaction() as conn:
+            # 書き込みロック確保済みなので、事前に読んだ状態と UPSERT の結果は一致する
+            existing = {}
+            names = list(items)
+            for i in range(0, len(names), 500):
+                chunk = names[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for row in conn.execute(f"SELECT topic, status FROM tasks WHERE topic IN ({placeholders})", chunk):
+                    existing[row[0]] = row[1]
+
+            conn.executemany('''
                 INSERT INTO tasks (topic, priority, status, next_run)
                 VALUES (?, ?, 'PENDING', ?)
-            ''', (topic, priority, next_run))
-            conn.commit()
-            conn.close()
-            return True
+                ON CONFLICT(topic) DO UPDATE 
+                SET status = 'PENDING', priority = excluded.priority, next_run = excluded.next_run 
+                WHERE tasks.status = 'FINISHED'
+            ''', [(topic, item_priority, now) for topic, item_priority in items.items()])
+
+        if any(existing.get(topic, "FINISHED") == "FINISHED" for topic in items):
+            self._notify()
+
+        for topic in items:
+            status = existing.get(topic)
+            if status is None:
+                outcomes[topic] = "added"
+            elif status == "FINISHED":
+                outcomes[topic] = "requeued"
+            else:
+                outcomes[topic] = "skipped"
+        return outcomes
 
     # --- 追加: タスク削除メソッド ---
     def delete_task(self, task_id: int):
         """指定されたIDのタスクを削除する"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-        conn.commit()
-        conn.close()
+        self._get_conn().execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def get_next_task(self, worker_id: str = "default"):
+        """実行すべきタスクを一つ取得し、RUNNING状態にする（トピック名を返す）"""
+        tasks = self.claim_tasks(worker_id, limit=1)
+        return tasks[0]["topic"] if tasks else None
+
+    def claim_tasks(self, worker_id: str, limit: int = 1) -> list:
+        """
+        実行可能なタスクを最大 limit 件、単一の原子的な文で取得してリースを付与する。
+        複数プロセス・複数スレッドが同じキューを共有しても二重処理にならない。
+        Returns: [{"id", "topic", "priority"}, ...]（優先度順）
+        """
+        recovered = self._reclaim_expired_leases()
+        if recovered > 0:
+            print(f"🚑 Recovered {recovered} timed-out tasks.")
 
-    def get_next_task(self):
-        """実行すべきタスクを一つ取得し、RUNNING状態にする"""
+        now = datetime.now()
+        lease_expires = now + timedelta(seconds=self.lease_seconds)
+        with self._db.transaction() as conn:
+            if SUPPORTS_RETURNING:
+                cursor = conn.execute('''
+                    UPDATE tasks 
+                    SET status = 'RUNNING', worker_id = ?, lease_expires = ?, last_run = ? 
+                    WHERE id IN (
+                        SELECT id FROM tasks 
+                        WHERE status = 'PENDING' AND next_run <= ?
+                        ORDER BY priority DESC, next_run ASC
+                        LIMIT ?
+                    ) AND status = 'PENDING'
+                    RETURNING id, topic, priority, next_run
+                ''', (worker_id, lease_expires, now, now, limit))
+                rows = cursor.fetchall()
+            else:
+                # 古いSQLite: 書き込みロックを確保済みのトランザクション内で SELECT → UPDATE
+                rows = conn.execute('''
+                    SELECT id, topic, priority, next_run FROM tasks 
+                    WHERE status = 'PENDING' AND next_run <= ?
+                    ORDER BY priority DESC, next_run ASC
+                    LIMIT ?
+                ''', (now, limit)).fetchall()
+                conn.executemany(
+                    "UPDATE tasks SET status = 'RUNNING', worker_id = ?, lease_expires = ?, last_run = ? WHERE id = ?",
+                    [(worker_id, lease_expires, now, row[0]) for row in rows]
+                )
+
+        # RETURNING の返却順は保証されないため、取得後に優先度順へ並べ直す
+        rows.sort(key=lambda r: (-r[2], r[3] or ""))
+        return [{"id": r[0], "topic": r[1], "priority": r[2]} for r in rows]
+
+    def seconds_until_next_task(self, max_wait: float = 300.0) -> float:
+        """
+        次にタスクが実行可能になるまでの秒数（最大 max_wait）。
+        PENDINGタスクの最も早い next_run と、RUNNINGタスクの最も早いリース期限（ゾンビ回収）を考慮する
+        """
         conn = self._get_conn()
-        cursor = conn.cursor()
-        
+        next_run = conn.execute("SELECT MIN(next_run) FROM tasks WHERE status = 'PENDING'").fetchone()[0]
+        lease = conn.execute("SELECT MIN(lease_expires) FROM tasks WHERE status = 'RUNNING'").fetchone()[0]
+
         now = datetime.now()
+        wait = max_wait
+        if next_run:
+            wait = min(wait, (datetime.fromisoformat(next_run) - now).total_seconds())
+        if lease:
+            # 期限切れリースの回収は間引かれているため、次に回収可能になる時刻より前には起きない
+            reclaim_ready = self._reclaim_interval - (time.monotonic() - self._last_reclaim)
+            wait = min(wait, max((datetime.fromisoformat(lease) - now).total_seconds(), reclaim_ready))
+        return max(0.0, wait)
 
-        # ゾンビタスクの救出 (30分タイムアウト)
-        timeout_threshold = now - timedelta(minutes=30)
-        cursor.execute('''
+    def renew_lease(self, topic: str, worker_id: str) -> bool:
+        """
+        ハートビート: 保持中のリースを延長する。
+        リースを失っていた場合（期限切れで他ワーカーに再割当て等）は False を返す。
+        """
+        cursor = self._get_conn().execute('''
             UPDATE tasks 
-            SET status = 'PENDING' 
-            WHERE status = 'RUNNING' AND last_run < ?
-        ''', (timeout_threshold,))
-        if cursor.rowcount > 0:
-            print(f"🚑 Recovered {cursor.rowcount} timed-out tasks.")
-            conn.commit()
-        
-        cursor.execute('''
-            SELECT id, topic FROM tasks 
-            WHERE status = 'PENDING' AND next_run <= ?
-            ORDER BY priority DESC, next_run ASC
-            LIMIT 1
-        ''', (now,))
-        
-        row = cursor.fetchone()
-        if row:
-            task_id, topic = row
-            cursor.execute("UPDATE tasks SET status = 'RUNNING', last_run = ? WHERE id = ?", (now, task_id))
-            conn.commit()
-            conn.close()
-            return topic
-        
-        conn.close()
-        return None
+            SET lease_expires = ? 
+            WHERE topic = ? AND worker_id = ? AND status = 'RUNNING'
+        ''', (datetime.now() + timedelta(seconds=self.lease_seconds), topic, worker_id))
+        return cursor.rowcount > 0
 
-    def complete_task(self, topic: str):
-        """タスクを完了状態にする"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute('''
+    def get_research_fingerprint(self, topic: str) -> str | None:
+        """前回の調査結果の指紋（未記録なら None）"""
+        row = self._get_conn().execute("SELECT research_fingerprint FROM tasks WHERE topic = ?", (topic,)).fetchone()
+        return row[0] if row else None
+
+    def _next_refresh(self, stable_runs: int, refresh_days: float | None, changed: bool | None) -> tuple:
+        """
+        調査結果の変化から次の再調査間隔を決める。
+        changed: True = 前回から変化あり / False = 実質的に同じ / None = 比較できない（初回・失敗）
+        Returns: (stable_runs, refresh_days)
+        """
+        current = refresh_days or self.refresh_days
+        if changed is None:
+            return stable_runs, current
+        if changed:
+            # 変化の多い（話題性の高い）記事は間隔を縮める
+            return 0, max(self.min_refresh_days, current / 2)
+        # 変化が無い記事は指数的に間隔を延ばす
+        stable_runs += 1
+        return stable_runs, min(self.max_refresh_days, self.refresh_days * 2 ** stable_runs)
+
+    def complete_task(self, topic: str, worker_id: str | None = None, outcome: dict | None = None):
+        """
+        タスクを完了状態にし、次回の再調査予定（next_run）を設定する。
+        outcome: Bot の処理結果 {"fingerprint": 調査結果の指紋, "changed": 前回からの変化}（任意）
+        """
+        outcome = outcome or {}
+        fingerprint = outcome.get("fingerprint")
+        now = datetime.now()
+        with self._db.transaction() as conn:
+            row = conn.execute("SELECT stable_runs, refresh_days FROM tasks WHERE topic = ?", (topic,)).fetchone()
+            stable_runs, refresh_days = self._next_refresh(
+                (row[0] or 0) if row else 0, row[1] if row else None, outcome.get("changed")
+            )
+            conn.execute('''
+                UPDATE tasks 
+                SET status = 'FINISHED', last_run = ?, next_run = ?, worker_id = NULL, lease_expires = NULL, 
+                    research_fingerprint = COALESCE(?, research_fingerprint), stable_runs = ?, refresh_days = ? 
+                WHERE topic = ? AND (? IS NULL OR worker_id = ? OR worker_id IS NULL)
+            ''', (now, now + timedelta(days=refresh_days), fingerprint, stable_runs, refresh_days, topic, worker_id, worker_id))
+        if fingerprint and outcome.get("changed") is not None:
+            print(f"📅 Next refresh of '{topic}' in {refresh_days:g} days (stable runs: {stable_runs}).")
+
+    def fail_task(self, topic: str, worker_id: str | None = None, retry_delay_minutes: int = 10):
+        """処理に失敗したタスクを一定時間後に再試行できるようPENDINGへ戻す"""
+        self._get_conn().execute('''
             UPDATE tasks 
-            SET status = 'FINISHED', last_run = ?, next_run = NULL 
-            WHERE topic = ?
-        ''', (datetime.now(), topic))
-        conn.commit()
-        conn.close()
+            SET status = 'PENDING', next_run = ?, worker_id = NULL, lease_expires = NULL 
+            WHERE topic = ? AND status = 'RUNNING' AND (? IS NULL OR worker_id = ? OR worker_id IS NULL)
+        ''', (datetime.now() + timedelta(minutes=retry_delay_minutes), topic, worker_id, worker_id))
 
     def get_recent_tasks(self, limit: int = 50) -> list:
         """
         管理画面用：タスク一覧を取得する
         """
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        # 実行中、保留中、完了の順に取得
-        cursor.execute('''
+        # 実行中、保留中、完了の順に取得（status_rank, next_run のインデックスで上位だけを読む）
+        cursor = self._get_conn().execute('''
             SELECT id, topic, priority, status, next_run 
             FROM tasks
-            ORDER BY 
-                CASE status
-                    WHEN 'RUNNING' THEN 1
-                    WHEN 'PENDING' THEN 2
-                    ELSE 3
-                END,
-                next_run ASC
+            ORDER BY status_rank, next_run ASC
             LIMIT ?
         ''', (limit,))
         
@@ -211,5 +331,4 @@ class WikiScheduler:
                 "status": row[3],
                 "next_run": row[4] if row[4] else "Now"
             })
-        conn.close()
         return tasks
@@ -0,0 +1,119 @@
+# /opt/auto-wiki/src/scheduler/worker_pool.py
+# 日本語タイトル: トピック並列処理ワーカープール
+# 目的: 複数のワーカースレッドがそれぞれ独立したBotパイプラインを持ち、
+#       スケジューラーからタスクを取得して並列に処理する（Ollama/DDG/MediaWikiの待ち時間を有効活用）
+
+import os
+import socket
+import threading
+
+
+class TopicWorkerPool:
+    def __init__(self, scheduler, bot_factory, num_workers: int = 2, idle_sleep: float = 5.0, max_idle: float = 300.0):
+        """
+        scheduler: WikiScheduler インスタンス（全ワーカーで共有）
+        bot_factory: ワーカー番号を受け取り LocalWikiBotV2 を返す関数（失敗時は None）
+        idle_sleep: 通知チャネルが使えない場合のポーリング間隔
+        max_idle: 通知チャネル使用時の最大待機時間（取りこぼし対策の保険）
+        """
+        self.scheduler = scheduler
+        self.bot_factory = bot_factory
+        self.num_workers = max(1, num_workers)
+        self.idle_sleep = idle_sleep
+        self.max_idle = max_idle
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        # ワーカーID（プロセスをまたいでも一意）と処理中トピックの対応表（ハートビート用）
+        self._id_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._active: dict[str, str] = {}
+        self._active_lock = threading.Lock()
+
+    def start(self):
+        """ワーカースレッドを起動する"""
+        print(f"👷 Starting worker pool ({self.num_workers} workers)...")
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._worker_loop, args=(i + 1,), name=f"worker-{i + 1}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+        # リース延長用のハートビートスレッド（リース期間の1/3ごとに更新）
+        hb = threading.Thread(target=self._heartbeat_loop, name="lease-heartbeat", daemon=True)
+        hb.start()
+
+    def stop(self, timeout: float = 10.0):
+        """ワーカーに停止を通知し、終了を待つ"""
+        self._stop.set()
+        if self.scheduler.notifier:
+            self.scheduler.notifier.wake_local()
+        for t in self._threads:
+            t.join(timeout=timeout)
+
+    def alive_count(self) -> int:
+        return sum(1 for t in self._threads if t.is_alive())
+
+    def _heartbeat_loop(self):
+        interval = max(5, self.scheduler.lease_seconds // 3)
+        while not self._stop.wait(interval):
+            with self._active_lock:
+                active = list(self._active.items())
+            for worker_id, topic in active:
+                try:
+                    if not self.scheduler.renew_lease(topic, worker_id):
+                        print(f"⚠️ [{worker_id}] Lease lost for '{topic}' (may be re-processed elsewhere).")
+                except Exception as e:
+                    print(f"⚠️ [{worker_id}] Heartbeat failed: {e}")
+
+    def _wait_for_work(self, token):
+        """次のタスクが実行可能になるか、タスク追加の通知が来るまで待つ"""
+        notifier = self.scheduler.notifier
+        if not notifier:
+            self._stop.wait(self.idle_sleep)
+            return
+        max_wait = self.max_idle if notifier.listening else self.idle_sleep
+        notifier.wait(token, self.scheduler.seconds_until_next_task(max_wait))
+
+    def _worker_loop(self, index: int):
+        name = f"worker-{index}"
+        worker_id = f"{self._id_prefix}-{index}"
+        # Botはワーカーごとに生成する（mwclient / OpenAIクライアントをスレッド間で共有しない）
+        bot = self.bot_factory(index)
+        if not bot:
+            print(f"❌ [{name}] Could not initialize bot. Worker exiting.")
+            return
+
+        notifier = self.scheduler.notifier
+        while not self._stop.is_set():
+            token = notifier.token() if notifier else None
+            try:
+                tasks = self.scheduler.claim_tasks(worker_id, limit=1)
+            except Exception as e:
+                print(f"❌ [{name}] Failed to fetch task: {e}")
+                self._stop.wait(60)
+                continue
+
+            if not tasks:
+                # タスクがない時は次の実行予定時刻か通知まで眠る（CPU・DB節約）
+                try:
+                    self._wait_for_work(token)
+                except Exception as e:
+                    print(f"⚠️ [{name}] Wait failed: {e}")
+                    self._stop.wait(self.idle_sleep)
+                continue
+
+            task_topic, priority = tasks[0]["topic"], tasks[0]["priority"]
+            print(f"▶ [{name}] PROCESSING: {task_topic}")
+            with self._active_lock:
+                self._active[worker_id] = task_topic
+            try:
+                # 前回の調査結果の指紋を渡し、変化が無ければ執筆を省略させる。結果は再調査間隔の調整に使う
+                outcome = bot.update_article(
+                    task_topic, previous_fingerprint=self.scheduler.get_research_fingerprint(task_topic), priority=priority
+                )
+                self.scheduler.complete_task(task_topic, worker_id, outcome=outcome)
+                print(f"⚡ [{name}] Ready for next task...")
+            except Exception as e:
+                print(f"❌ [{name}] Task '{task_topic}' failed: {e}")
+                self.scheduler.fail_task(task_topic, worker_id)
+            finally:
+                with self._active_lock:
+                    self._active.pop(worker_id, None)
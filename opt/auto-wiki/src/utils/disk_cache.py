@@ -0,0 +1,137 @@
+# /opt/auto-wiki/src/utils/disk_cache.py
+# 日本語タイトル: SQLite ベースのディスクキャッシュ
+# 目的: 計算結果（埋め込みベクトル・LLM応答・検索結果など）をキー/バイト列でディスクに保存し、
+#       サイズ上限を超えたら最終アクセスの古いものから削除する（LRU）。任意でTTLも指定できる
+
+import os
+import sqlite3
+import threading
+import time
+
+# キャッシュ置き場（Botとダッシュボードで共有するボリューム）
+CACHE_DIR = os.getenv("CACHE_DIR", "/app/cache")
+
+# SQLite のバインド変数上限（古いビルドは999）に収まるよう IN 句を分割する
+_IN_CHUNK = 500
+
+
+def cache_path(name: str) -> str:
+    """CACHE_DIR 配下のキャッシュファイルパスを返す"""
+    return os.path.join(CACHE_DIR, name)
+
+
+class DiskCache:
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: float | None = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def get(self, key: str, max_age: float | None = None) -> bytes | None:
+        return self.get_many([key], max_age=max_age).get(key)
+
+    def get_many(self, keys, max_age: float | None = None) -> dict:
+        """
+        複数キーをまとめて引く。Returns: {key: value}（見つからない・期限切れのキーは含まない）
+        max_age: この呼び出しに限って使う有効期限（秒）。省略時はキャッシュ全体の ttl_seconds
+        """
+        keys = list(dict.fromkeys(keys))
+        found: dict[str, bytes] = {}
+        if not keys:
+            return found
+        now = time.time()
+        ttl = max_age if max_age is not None else self.ttl_seconds
+        min_created = now - ttl if ttl else None
+        with self._lock:
+            for i in range(0, len(keys), _IN_CHUNK):
+                batch = keys[i:i + _IN_CHUNK]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created_at FROM cache WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                hits = []
+                for key, value, created_at in rows:
+                    if min_created is not None and created_at < min_created:
+                        continue
+                    found[key] = value
+                    hits.append(key)
+                if hits:
+                    # LRU 用に最終アクセス時刻を更新
+                    self._conn.executemany(
+                        "UPDATE cache SET accessed_at = ? WHERE key = ?", [(now, k) for k in hits]
+                    )
+        return found
+
+    def set(self, key: str, value: bytes):
+        self.set_many({key: value})
+
+    def set_many(self, items: dict):
+        """複数の値をまとめて書き込み、上限を超えていれば古いものから削除する"""
+        if not items:
+            return
+        now = time.time()
+        keys = list(items)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 上書きされるエントリの分を合計サイズから差し引く
+                replaced = 0
+                for i in range(0, len(keys), _IN_CHUNK):
+                    batch = keys[i:i + _IN_CHUNK]
+                    placeholders = ",".join("?" * len(batch))
+                    replaced += self._conn.execute(
+                        f"SELECT COALESCE(SUM(size), 0) FROM cache WHERE key IN ({placeholders})", batch
+                    ).fetchone()[0]
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    [(k, v, len(k) + len(v), now, now) for k, v in items.items()]
+                )
+                self._total += sum(len(k) + len(v) for k, v in items.items()) - replaced
+                if self._total > self.max_bytes:
+                    self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        """合計サイズが上限の90%になるまで、最終アクセスの古いエントリから削除する"""
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        # 他プロセスの書き込みも反映するため実際の合計を取り直す
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        if self._total <= self.max_bytes:
+            return
+        freed = 0
+        to_delete = []
+        excess = self._total - target
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+            if freed >= excess:
+                break
+            to_delete.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", to_delete)
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,40 @@
+# /opt/auto-wiki/src/utils/rate_limit.py
+# 日本語タイトル: トークンバケット方式のレートリミッター
+# 目的: 外部サービス（検索エンジンなど）へのリクエスト頻度を、スレッド間で共有する1つのバケットで平準化する
+
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        rate: 1秒あたりに補充されるトークン数（0以下なら無制限）
+        burst: バケットの容量（連続して即座に実行できる回数）
+        """
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """トークンを1つ取得するまで待つ（timeout 秒を過ぎたら False）"""
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return True
+                wait = (1.0 - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
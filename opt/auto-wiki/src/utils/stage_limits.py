@@ -0,0 +1,38 @@
+# /opt/auto-wiki/src/utils/stage_limits.py
+# 日本語タイトル: ステージ別同時実行数リミッター
+# 目的: ワーカープール稼働時に、処理フェーズ（調査・執筆・投稿など）ごとの同時実行数を制限し、
+#       単一のOllamaコンテナやMediaWikiへ負荷が集中しないようにする
+
+import threading
+from contextlib import contextmanager
+
+_limits: dict = {}
+_lock = threading.Lock()
+
+
+def configure_stage_limits(limits: dict):
+    """
+    ステージ名 -> 最大同時実行数 の辞書で制限を設定する。
+    0以下（または None）のステージは無制限として扱う。
+    """
+    with _lock:
+        for stage, max_concurrent in limits.items():
+            if max_concurrent and max_concurrent > 0:
+                _limits[stage] = threading.BoundedSemaphore(max_concurrent)
+            else:
+                _limits.pop(stage, None)
+
+
+@contextmanager
+def stage_slot(stage: str):
+    """指定ステージの実行枠を確保する（未設定のステージは即座に通過）"""
+    semaphore = _limits.get(stage)
+    if semaphore is None:
+        yield
+        return
+
+    semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
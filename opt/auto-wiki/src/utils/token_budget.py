@@ -0,0 +1,133 @@
+# /opt/auto-wiki/src/utils/token_budget.py
+# 日本語タイトル: プロンプトのトークン予算管理
+# 目的: モデルのコンテキスト長（NUM_CTX）から出力用の予約分を差し引いた範囲にプロンプトを収める。
+#       入力の切り詰めは段落・文の境界で決定的に行い、Ollama の num_ctx 超過（先頭からの再処理）を防ぐ
+#       TOKENIZER_NAME を指定するとモデルに合ったトークナイザーで数え、未指定なら概算（src.utils.tokens）を使う
+
+import os
+import threading
+from src.utils.tokens import estimate_tokens
+
+# Ollama 側のコンテキスト長（docker-compose で OLLAMA_CONTEXT_LENGTH と揃える）
+NUM_CTX = int(os.getenv("NUM_CTX", "8192"))
+# Hugging Face のトークナイザー名（例: google/gemma-2-9b-it）。空なら概算
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "").strip()
+# 数え方の誤差とチャットテンプレート分の余白
+SAFETY_MARGIN = 0.1
+
+_TRUNCATION_MARK = "\n...\n"
+_tokenizer = None
+_tokenizer_failed = False
+_tokenizer_lock = threading.Lock()
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_failed
+    if not TOKENIZER_NAME or _tokenizer_failed:
+        return None
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None and not _tokenizer_failed:
+                try:
+                    from transformers import AutoTokenizer
+                    _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+                except Exception as e:
+                    print(f"⚠️ Tokenizer '{TOKENIZER_NAME}' unavailable, using estimates: {e}")
+                    _tokenizer_failed = True
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """設定されたモデルのトークン数（トークナイザーが無ければ概算）"""
+    if not text:
+        return 0
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return estimate_tokens(text)
+
+
+def _cut(text: str, max_chars: int, from_end: bool = False) -> str:
+    """max_chars 以内で、なるべく段落・行・文の境界で切る"""
+    if len(text) <= max_chars:
+        return text
+    if from_end:
+        piece = text[len(text) - max_chars:]
+        for sep in ("\n\n", "\n", "。", ". "):
+            pos = piece.find(sep)
+            if 0 <= pos < max_chars * 0.2:
+                return piece[pos + len(sep):]
+        return piece
+    piece = text[:max_chars]
+    for sep in ("\n\n", "\n", "。", ". "):
+        pos = piece.rfind(sep)
+        if pos >= max_chars * 0.8:
+            return piece[:pos + len(sep)]
+    return piece
+
+
+def truncate_tokens(text: str, max_tokens: int, keep_tail: bool = False) -> str:
+    """
+    text を max_tokens 以内に切り詰める（同じ入力には常に同じ結果を返す）。
+    keep_tail=True なら先頭と末尾を残して中間を省略する
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+
+    ratio = max_tokens / tokens
+    while True:
+        max_chars = max(1, int(len(text) * ratio))
+        if keep_tail:
+            head = _cut(text, max_chars * 2 // 3)
+            tail = _cut(text, max_chars - len(head), from_end=True)
+            result = head.rstrip() + _TRUNCATION_MARK + tail.lstrip()
+        else:
+            result = _cut(text, max_chars)
+        if count_tokens(result) <= max_tokens or max_chars <= 1:
+            return result
+        ratio *= 0.9
+
+
+class PromptBudget:
+    """1回のLLM呼び出しのトークン予算（コンテキスト長 - 出力の予約分 - 余白）"""
+
+    def __init__(self, reserve_output: int = 1024, num_ctx: int = NUM_CTX):
+        self.num_ctx = num_ctx
+        self.reserve_output = reserve_output
+        self.total = int(num_ctx * (1 - SAFETY_MARGIN)) - reserve_output
+
+    def available(self, fixed_text: str) -> int:
+        """固定部分（指示文など）を除いて可変部分に使えるトークン数"""
+        return max(0, self.total - count_tokens(fixed_text))
+
+    def allocate(self, fixed_text: str, parts: dict, weights: dict | None = None, keep_tail: set | None = None) -> dict:
+        """
+        可変部分 parts（名前 -> テキスト）を、残りの予算内に weights の比で切り詰めて返す。
+        割り当てより短い部分の余りは他の部分に回す
+        """
+        weights = weights or {}
+        keep_tail = keep_tail or set()
+        remaining = self.available(fixed_text)
+        sizes = {name: count_tokens(text) for name, text in parts.items()}
+        budgets = {}
+        open_parts = set(parts)
+        # 収まる部分から順に確定させ、余った予算を残りで分け合う
+        while open_parts:
+            total_weight = sum(weights.get(name, 1) for name in open_parts)
+            share = {name: remaining * weights.get(name, 1) / total_weight for name in open_parts}
+            fitting = [name for name in open_parts if sizes[name] <= share[name]]
+            if not fitting:
+                for name in open_parts:
+                    budgets[name] = int(share[name])
+                break
+            for name in fitting:
+                budgets[name] = sizes[name]
+                remaining -= sizes[name]
+                open_parts.discard(name)
+        return {
+            name: text if sizes[name] <= budgets[name] else truncate_tokens(text, budgets[name], keep_tail=name in keep_tail)
+            for name, text in parts.items()
+        }
@@ -0,0 +1,24 @@
+# /opt/auto-wiki/src/utils/tokens.py
+# 日本語タイトル: トークン数の概算ユーティリティ
+# 目的: トークナイザーを読み込まずに、日本語（1文字≒1トークン）と英語（1単語≒1.3トークン）の
+#       混在テキストのトークン数を高速に見積もる
+
+import math
+import re
+
+# CJK文字（かな・漢字）は1文字ずつ、英数字は単語単位、それ以外の記号は1文字ずつ数える
+_TOKEN_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uff66-\uff9f]|[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+
+
+def estimate_tokens(text: str) -> int:
+    """テキストのトークン数を概算する"""
+    if not text:
+        return 0
+    count = 0.0
+    for piece in _TOKEN_RE.findall(text):
+        if len(piece) > 1:
+            # 英単語はサブワード分割されるため長さに応じて加算
+            count += 1.0 + max(0, len(piece) - 4) / 4.0
+        else:
+            count += 1.0
+    return math.ceil(count)
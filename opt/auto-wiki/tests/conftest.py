@@ -0,0 +1,10 @@
+# /opt/auto-wiki/tests/conftest.py
+# 日本語タイトル: テスト共通設定
+# 目的: コンテナ内（PYTHONPATH=/app）と同じく、リポジトリの opt/auto-wiki を起点に src パッケージを import できるようにする
+#
+# 実行方法: cd opt/auto-wiki && python -m pytest -q tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,62 @@
+# /opt/auto-wiki/tests/test_migrations.py
+# 日本語タイトル: scheduler.db マイグレーションのテスト
+# 目的: マイグレーションが1件ずつ原子的に適用され、複数プロセス（接続）が同時に起動しても二重に適用されないことを確認する
+
+import sqlite3
+import threading
+import pytest
+from src.scheduler import migrations
+from src.scheduler.migrations import MIGRATIONS, apply_migrations
+
+
+def _connect(path):
+    return sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+
+
+def _columns(conn):
+    return {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+
+
+@pytest.mark.parametrize("run", range(15))
+def test_concurrent_startup_on_fresh_db(tmp_path, run):
+    path = str(tmp_path / "scheduler.db")
+    barrier = threading.Barrier(2)
+    results, errors = [], []
+
+    def start():
+        conn = _connect(path)
+        try:
+            barrier.wait()
+            results.append(apply_migrations(conn))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=start) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert results == [MIGRATIONS[-1][0]] * 2
+
+
+def test_failed_migration_leaves_no_partial_schema(tmp_path, monkeypatch):
+    path = str(tmp_path / "scheduler.db")
+    conn = _connect(path)
+    latest = apply_migrations(conn)
+
+    def broken(cursor):
+        cursor.execute("ALTER TABLE tasks ADD COLUMN half_applied TEXT")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS + [(latest + 1, broken)])
+    with pytest.raises(RuntimeError):
+        migrations.apply_migrations(conn)
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == latest
+    assert "half_applied" not in _columns(conn)
+    assert not conn.in_transaction
+    conn.close()
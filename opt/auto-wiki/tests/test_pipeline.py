@@ -0,0 +1,107 @@
+# /opt/auto-wiki/tests/test_pipeline.py
+# 日本語タイトル: ステージ分割型パイプラインのテスト
+# 目的: ジョブが全ステージを通って complete_task で解放されること、途中のステージの例外が fail_task になり、
+#       リース（ハートビート対象）とステージの実行枠を手放すことを、スタブのBotとスケジューラーで確認する
+
+import threading
+import time
+import pytest
+from src.scheduler.pipeline import STAGES, StageMetrics, TopicPipeline
+from src.utils.stage_limits import configure_stage_limits, stage_slot
+
+
+class StubScheduler:
+    """渡されたトピックを1件ずつ払い出し、完了・失敗の記録だけを残すスケジューラー"""
+
+    notifier = None
+    lease_seconds = 600
+
+    def __init__(self, topics):
+        self.pending = list(topics)
+        self.completed = []
+        self.failed = []
+        self._lock = threading.Lock()
+
+    def claim_tasks(self, worker_id, limit=1):
+        with self._lock:
+            if not self.pending:
+                return []
+            return [{"id": 1, "topic": self.pending.pop(0), "priority": 5}]
+
+    def get_research_fingerprint(self, topic):
+        return None
+
+    def renew_lease(self, topic, worker_id):
+        return True
+
+    def complete_task(self, topic, worker_id=None, outcome=None):
+        with self._lock:
+            self.completed.append((topic, worker_id, outcome))
+
+    def fail_task(self, topic, worker_id=None, retry_delay_minutes=10):
+        with self._lock:
+            self.failed.append((topic, worker_id))
+
+
+class StubBot:
+    """各フェーズをステージの実行枠の中で記録し、"broken" トピックは執筆フェーズで例外を送出する"""
+
+    def __init__(self, log):
+        self.log = log
+
+    def run_phase(self, stage, job):
+        with stage_slot(stage):
+            self.log.append((job["topic"], stage))
+            if stage == "writing" and job["topic"] == "broken":
+                raise RuntimeError("LLM unavailable")
+            if stage == STAGES[-1]:
+                job["outcome"] = {"status": "published", "fingerprint": None, "changed": None}
+
+
+def _run(scheduler, done):
+    log = []
+    pipeline = TopicPipeline(scheduler, lambda index: StubBot(log), idle_sleep=0.05, metrics=StageMetrics(path=""))
+    pipeline.start()
+    try:
+        deadline = time.monotonic() + 10.0
+        while not done() and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        pipeline.stop(timeout=5.0)
+    return pipeline, log
+
+
+@pytest.fixture
+def single_writer():
+    # 執筆の実行枠を1つにし、失敗したジョブが枠を手放さなければ後続のジョブが進めないようにする
+    configure_stage_limits({"writing": 1})
+    yield
+    configure_stage_limits({"writing": 0})
+
+
+def test_job_passes_through_every_stage_and_completes():
+    scheduler = StubScheduler(["東京タワー"])
+
+    pipeline, log = _run(scheduler, lambda: scheduler.completed)
+
+    assert log == [("東京タワー", stage) for stage in STAGES]
+    [(topic, worker_id, outcome)] = scheduler.completed
+    assert topic == "東京タワー" and outcome["status"] == "published"
+    assert scheduler.failed == []
+    assert pipeline._active == {}
+
+
+def test_failing_middle_stage_fails_task_and_releases_lease_and_slot(single_writer):
+    scheduler = StubScheduler(["broken", "東京タワー"])
+
+    pipeline, log = _run(scheduler, lambda: scheduler.completed)
+
+    assert [topic for topic, _ in scheduler.failed] == ["broken"]
+    # 失敗したジョブは後続のステージに進まない
+    assert [stage for topic, stage in log if topic == "broken"] == ["research", "image", "writing"]
+    # 執筆の実行枠が解放されていたので、次のトピックは最後まで処理される
+    assert [topic for topic, _, _ in scheduler.completed] == ["東京タワー"]
+    # リースはタスクごとのワーカーIDで手放し、ハートビートの対象にも残らない
+    failed_worker, completed_worker = scheduler.failed[0][1], scheduler.completed[0][1]
+    assert failed_worker != completed_worker
+    assert pipeline._active == {}
@@ -0,0 +1,106 @@
+# /opt/auto-wiki/tests/test_quality.py
+# 日本語タイトル: 品質ゲートのテスト
+# 目的: 既存記事の更新では、差分更新で書き直された節だけを査読・修正し、他の節が1バイトも変わらないことを確認する
+
+from src.bot.quality import QualityGate
+from src.bot.research_context import ResearchContext
+from src.bot.section_updater import parse_sections
+
+TOPIC = "東京タワー"
+BASELINE = """'''東京タワー'''は、東京都港区芝公園にある総合電波塔である。
+
+== 歴史 ==
+1958年12月に完成し、開業した。
+
+== 構造 ==
+高さは333メートルで、地上150メートルと250メートルに展望台がある。
+
+== 脚注 ==
+<references />
+"""
+# SectionUpdater が「歴史」節だけを書き直した結果
+UPDATED = BASELINE.replace("1958年12月に完成し、開業した。", "1958年12月に完成し、開業した。\n2012年に送信機能は東京スカイツリーへ移転した。")
+# メンテナンス（優先度3）は "thorough" プロファイル（常に査読・修正）
+MAINTENANCE_PRIORITY = 3
+
+
+class RejectingReviewer:
+    """常に FAIL を返し、修正では渡された文章の各行末に注記を付ける"""
+
+    def __init__(self):
+        self.reviewed = []
+        self.refined = []
+
+    def review_draft(self, topic, draft, sources, section=None):
+        self.reviewed.append(draft)
+        return False, "FAIL: cite sources"
+
+    def refine_draft(self, topic, draft, feedback, timeout=None, section=None):
+        self.refined.append(draft)
+        return "\n".join(line + "（出典）" if line and not line.startswith("==") else line for line in draft.splitlines())
+
+
+class WholeArticleReviewer(RejectingReviewer):
+    """節の修正を頼まれても、導入部・節・関連項目を含む記事全体を返す"""
+
+    def refine_draft(self, topic, draft, feedback, timeout=None, section=None):
+        self.refined.append(draft)
+        return f"'''{topic}'''は、総合電波塔である。\n\n== {section} ==\n{draft}（出典）\n\n== 関連項目 ==\n* 東京スカイツリー"
+
+
+class StaticVetter:
+    def vet_in_batches(self, topic, results, **kwargs):
+        return "- 2012年に送信機能は東京スカイツリーへ移転した。"
+
+
+def _gate(reviewer_class=RejectingReviewer):
+    reviewer = reviewer_class()
+    return QualityGate(None, vetter=StaticVetter(), reviewer=reviewer), reviewer
+
+
+def _research():
+    research = ResearchContext(TOPIC)
+    research.add([{"title": TOPIC, "href": "https://example.org/1", "body": "2012年に送信機能は東京スカイツリーへ移転した。"}])
+    return research
+
+
+def test_update_refines_only_rewritten_sections():
+    gate, reviewer = _gate()
+
+    result = gate.check(TOPIC, UPDATED, _research(), MAINTENANCE_PRIORITY, baseline=BASELINE)
+
+    before, after = parse_sections(BASELINE), parse_sections(result)
+    assert [s["heading"] for s in after] == [s["heading"] for s in before]
+    # 書き直されていない節は1バイトも変わらない
+    for i in (0, 2, 3):
+        assert after[i]["heading"] + after[i]["body"] == before[i]["heading"] + before[i]["body"]
+    # 査読・修正には書き直された節だけを渡し、その修正結果が元の位置に戻る
+    assert reviewer.reviewed and all("== 構造 ==" not in draft and "東京都港区" not in draft for draft in reviewer.reviewed)
+    assert "東京スカイツリーへ移転した。（出典）" in after[1]["body"]
+    assert after[1]["body"].endswith("\n\n")
+
+
+def test_update_rejects_refined_section_containing_whole_article():
+    gate, reviewer = _gate(WholeArticleReviewer)
+
+    result = gate.check(TOPIC, UPDATED, _research(), MAINTENANCE_PRIORITY, baseline=BASELINE)
+
+    # 節に記事全体を差し込まず（導入部・見出しの重複なし）、書き直し済みの節をそのまま投稿する
+    assert reviewer.refined
+    assert result == UPDATED
+
+
+def test_update_without_changes_is_not_reviewed():
+    gate, reviewer = _gate()
+
+    assert gate.check(TOPIC, BASELINE, _research(), MAINTENANCE_PRIORITY, baseline=BASELINE) == BASELINE
+    assert reviewer.reviewed == []
+
+
+def test_new_article_is_reviewed_as_a_whole():
+    gate, reviewer = _gate()
+
+    result = gate.check(TOPIC, UPDATED, _research(), MAINTENANCE_PRIORITY)
+
+    assert reviewer.reviewed[0] == UPDATED
+    assert "総合電波塔である。（出典）" in result
@@ -0,0 +1,38 @@
+# /opt/auto-wiki/tests/test_research_engine.py
+# 日本語タイトル: 非同期リサーチエンジンのテスト
+# 目的: 応答しない検索が、LLM 呼び出しなど検索以外の処理のスレッドを奪わないことを確認する
+
+import asyncio
+import threading
+import time
+from src.bot.research_engine import ResearchEngine
+
+
+def test_blocked_searches_do_not_delay_llm_calls():
+    engine = ResearchEngine(concurrency=2, call_workers=2)
+    release = threading.Event()
+
+    def hung_search(query):
+        release.wait(10)
+        return []
+
+    def llm_call():
+        return "plan"
+
+    async def scenario():
+        # 予算を大きく超える数の検索が応答しなくなった状態
+        searches = [asyncio.ensure_future(engine.search(hung_search, f"q{i}")) for i in range(8)]
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        result = await asyncio.wait_for(engine.call(llm_call), timeout=2.0)
+        elapsed = time.monotonic() - started
+        release.set()
+        await asyncio.gather(*searches)
+        return result, elapsed
+
+    try:
+        result, elapsed = engine.run(scenario())
+    finally:
+        release.set()
+    assert result == "plan"
+    assert elapsed < 0.5
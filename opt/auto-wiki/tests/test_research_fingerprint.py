@@ -0,0 +1,60 @@
+# /opt/auto-wiki/tests/test_research_fingerprint.py
+# 日本語タイトル: 調査結果の指紋のテスト
+# 目的: 初回（調査コーパスを再利用）と再調査（すべて Web）で、Web 上の情報が変わっていなければ指紋が一致することを確認する
+
+from src.bot.researcher import DeepResearcher
+from src.bot.research_context import fingerprint_similarity
+from src.bot.source_filter import SourceFilter
+
+TOPIC = "Tokyo Tower"
+
+
+class FlatEmbedder:
+    def embed(self, texts, batch_size=32):
+        return [[1.0, 0.0] for _ in texts]
+
+
+class PlanningLLM:
+    def for_agent(self, name):
+        return self
+
+    def chat(self, call_site, prompt, **kwargs):
+        return '["History", "Structure"]' if call_site == "initial_plan" else "[]"
+
+
+class WebSearch:
+    """クエリごとに固定の結果を返す（Web 上の情報は変わっていない）"""
+
+    def search(self, query, region="us-en", limit=5):
+        return [
+            {"title": f"{query} {i}", "href": f"https://example.org/{query}/{i}",
+             "body": f"{query} fact number {i}: the tower is a landmark of Minato with details {i * 7}."}
+            for i in range(limit)
+        ]
+
+
+class Corpus:
+    """別トピックの調査で保存された出典（どのクエリにも十分ヒットする）"""
+
+    def lookup(self, query, limit=5):
+        return [
+            {"title": f"related {i}", "href": f"https://example.net/related/{i}",
+             "body": f"Related page {i} about Minato landmarks and broadcasting history.", "vector": [1.0, 0.0]}
+            for i in range(limit)
+        ]
+
+    def add(self, topic, results):
+        return len(results)
+
+
+def _researcher(corpus):
+    return DeepResearcher(PlanningLLM(), lang="en", search_client=WebSearch(),
+                          source_filter=SourceFilter("en", "/nonexistent", 0.0, FlatEmbedder()), corpus=corpus)
+
+
+def test_first_run_with_corpus_matches_refresh_without_corpus():
+    first = _researcher(Corpus()).research(TOPIC, max_iterations=1, reuse_corpus=True)
+    refresh = _researcher(Corpus()).research(TOPIC, max_iterations=1, reuse_corpus=False)
+
+    assert first.fingerprint()
+    assert fingerprint_similarity(first.fingerprint(), refresh.fingerprint()) == 1.0
@@ -0,0 +1,174 @@
+# /opt/auto-wiki/tests/test_search.py
+# 日本語タイトル: 検索クライアントのテスト
+# 目的: フィクスチャバックエンドを通して、ディスクキャッシュ（TTL・LRU）・同一クエリの集約・共有レート制限を確認し、
+#       レート制限待ち・同一クエリの集約待ちを含めて、1クエリの待ち時間が timeout 内に収まることを確認する
+
+import json
+import threading
+import time
+import pytest
+from src.bot.search import FixtureBackend, SearchClient
+from src.utils.disk_cache import DiskCache
+from src.utils.rate_limit import TokenBucket
+
+FIXTURE = {
+    query: [{"title": query, "href": f"https://example.org/{query}", "body": f"{query} " + "x" * 200}]
+    for query in ("alpha", "bravo", "charlie", "delta", "echo")
+}
+
+
+class CountingFixtureBackend(FixtureBackend):
+    """バックエンドまで届いた検索の回数を数えるフィクスチャ"""
+
+    def __init__(self, path, latency=0.0):
+        super().__init__(path, latency=latency)
+        self.calls = []
+
+    def search(self, query, region, limit, timeout=30.0):
+        self.calls.append(query)
+        return super().search(query, region, limit, timeout=timeout)
+
+
+@pytest.fixture
+def fixture_path(tmp_path):
+    path = tmp_path / "search_fixture.json"
+    path.write_text(json.dumps(FIXTURE), encoding="utf-8")
+    return str(path)
+
+
+def test_fixture_backend_normalizes_queries_and_applies_limit(tmp_path):
+    path = tmp_path / "search_fixture.json"
+    path.write_text(json.dumps({"Tokyo  Tower": [{"title": str(i), "href": f"https://example.org/{i}", "body": ""} for i in range(5)]}), encoding="utf-8")
+    backend = FixtureBackend(str(path))
+
+    assert [r["title"] for r in backend.search("  tokyo tower ", "jp-jp", 3)] == ["0", "1", "2"]
+    assert backend.search("unknown", "jp-jp", 3) == []
+
+
+def test_fixture_backend_latency_beyond_timeout_raises(fixture_path):
+    backend = FixtureBackend(fixture_path, latency=0.5)
+
+    with pytest.raises(TimeoutError):
+        backend.search("alpha", "jp-jp", 5, timeout=0.05)
+
+
+def test_disk_cache_serves_repeats_until_ttl_expires(fixture_path, tmp_path):
+    backend = CountingFixtureBackend(fixture_path)
+    client = SearchClient(backend, cache=DiskCache(str(tmp_path / "search.sqlite")), ttl=0.3)
+
+    first = client.search("alpha")
+    assert client.search("alpha") == first
+    assert backend.calls == ["alpha"] and client.stats["cache_hits"] == 1
+
+    time.sleep(0.4)
+    assert client.search("alpha") == first
+    assert backend.calls == ["alpha", "alpha"]
+
+
+def test_disk_cache_evicts_least_recently_used_query(fixture_path, tmp_path):
+    backend = CountingFixtureBackend(fixture_path)
+    probe = SearchClient(backend)
+    entry_size = len(probe._key("alpha", "jp-jp", 5)) + len(json.dumps(probe.search("alpha"), ensure_ascii=False).encode("utf-8"))
+    # 2件分と少しの上限: 3件目を書き込むと最終アクセスの最も古い1件だけが消える
+    cache = DiskCache(str(tmp_path / "search.sqlite"), max_bytes=int(entry_size * 2.5))
+    client = SearchClient(backend, cache=cache)
+    backend.calls.clear()
+
+    for query in ("alpha", "bravo"):
+        client.search(query)
+        time.sleep(0.01)
+    client.search("alpha")  # alpha を最近使ったものにする
+    time.sleep(0.01)
+    client.search("charlie")
+
+    client.search("alpha")
+    client.search("bravo")
+    assert backend.calls == ["alpha", "bravo", "charlie", "bravo"]
+
+
+def test_identical_inflight_queries_share_one_backend_call(fixture_path):
+    backend = CountingFixtureBackend(fixture_path, latency=0.3)
+    client = SearchClient(backend)
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(client.search("alpha"))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert backend.calls == ["alpha"]
+    assert client.stats["coalesced"] == 3
+    assert len(results) == 4 and all(r == FIXTURE["alpha"] for r in results)
+
+
+def test_rate_limiter_is_shared_across_threads(fixture_path):
+    backend = CountingFixtureBackend(fixture_path)
+    client = SearchClient(backend, limiter=TokenBucket(rate=10, burst=1))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client.search, args=(query,)) for query in FIXTURE]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # 5スレッドが同時に検索しても、1件目以降は 1/rate 秒ごとにしか外部検索しない
+    assert time.monotonic() - started >= (len(FIXTURE) - 1) / 10 * 0.9
+    assert sorted(backend.calls) == sorted(FIXTURE)
+
+
+class BlockingBackend:
+    name = "blocking"
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def search(self, query, region, limit, timeout=30.0):
+        self.calls += 1
+        if not self.release.wait(timeout):
+            raise TimeoutError("backend timed out")
+        return [{"title": query, "href": f"https://example.org/{query}", "body": query}]
+
+
+def test_rate_limiter_wait_counts_toward_timeout():
+    limiter = TokenBucket(rate=0.01, burst=1)
+    limiter.acquire()
+    backend = BlockingBackend()
+    client = SearchClient(backend, limiter=limiter, timeout=0.2)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.search("tokyo tower")
+    assert time.monotonic() - started < 1.0
+    assert backend.calls == 0
+
+
+def test_backend_receives_remaining_time():
+    backend = BlockingBackend()
+    client = SearchClient(backend, timeout=0.2)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.search("tokyo tower")
+    assert time.monotonic() - started < 1.0
+
+
+def test_coalesced_waiter_times_out_while_leader_hangs():
+    backend = BlockingBackend()
+    client = SearchClient(backend, timeout=5.0)
+    leader = threading.Thread(target=client.search, args=("tokyo tower",))
+    leader.start()
+    while backend.calls == 0:
+        time.sleep(0.01)
+
+    # 後から来た同じクエリは実行中の検索を待つが、自分の timeout で打ち切る
+    client.timeout = 0.2
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.search("tokyo tower")
+    assert time.monotonic() - started < 1.0
+
+    backend.release.set()
+    leader.join()
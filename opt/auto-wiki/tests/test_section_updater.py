@@ -0,0 +1,85 @@
+# /opt/auto-wiki/tests/test_section_updater.py
+# 日本語タイトル: セクション単位差分更新のテスト
+# 目的: 言い換えただけの調査結果では節を書き直さず、新しい事実がある節だけを書き直すことを確認する
+#       （埋め込みモデルの代わりに、同義語を同じ概念の次元に写す決定的な埋め込み器を使う）
+
+from src.bot.research_context import ResearchContext
+from src.bot.section_updater import SectionUpdater, parse_sections
+
+TOPIC = "東京タワー"
+ARTICLE = """'''東京タワー'''は、東京都港区芝公園にある総合電波塔である。
+
+== 歴史 ==
+1958年12月に完成し、開業した。
+
+== 構造 ==
+高さは333メートルで、地上150メートルと250メートルに展望台がある。
+
+== 脚注 ==
+<references />
+"""
+
+CONCEPTS = {
+    "topic": ["東京タワー"],
+    "location": ["港区", "芝公園"],
+    "broadcast": ["電波塔", "送信", "放送"],
+    "opened": ["1958", "完成", "開業", "竣工"],
+    "height": ["333", "高さ"],
+    "observatory": ["展望台"],
+    "skytree": ["スカイツリー"],
+}
+
+
+class ConceptEmbedder:
+    """文に含まれる概念（同義語のどれかが現れるか）を次元とする埋め込み"""
+
+    def embed(self, texts, batch_size=32):
+        return [[1.0 if any(word in text for word in words) else 0.0 for words in CONCEPTS.values()] for text in texts]
+
+
+class RecordingLLM:
+    def __init__(self):
+        self.calls = []
+
+    def for_agent(self, name):
+        return self
+
+    def chat(self, call_site, prompt, **kwargs):
+        self.calls.append(prompt)
+        original = prompt.split("Current Section:", 1)[1].strip()
+        return original + "\n2012年に放送の送信機能は東京スカイツリーへ移転した。"
+
+
+def _research(results):
+    research = ResearchContext(TOPIC)
+    research.add([{"title": f"{TOPIC} - {i}", "href": f"https://example.org/{i}", "body": body} for i, body in enumerate(results)])
+    return research
+
+
+def test_lightly_reworded_research_rewrites_no_sections():
+    llm = RecordingLLM()
+    updater = SectionUpdater(llm, ConceptEmbedder(), lang="ja")
+    research = _research([
+        "東京タワーは港区の芝公園に建つ電波塔です。",
+        "東京タワーは1958年に竣工・開業しました。",
+        "東京タワーの高さは333mで、展望台が2つあります。",
+    ])
+
+    assert updater.update(TOPIC, ARTICLE, research) == ARTICLE
+    assert llm.calls == []
+
+
+def test_new_fact_rewrites_only_its_section():
+    llm = RecordingLLM()
+    updater = SectionUpdater(llm, ConceptEmbedder(), lang="ja")
+    research = _research([
+        "東京タワーは1958年に竣工・開業しました。",
+        "2012年に東京スカイツリーへ放送の送信機能が移った。",
+    ])
+
+    updated = updater.update(TOPIC, ARTICLE, research)
+    assert len(llm.calls) == 1
+    before, after = parse_sections(ARTICLE), parse_sections(updated)
+    assert [s["title"] for s in after] == [s["title"] for s in before]
+    assert "スカイツリー" in after[0]["body"]
+    assert after[1:] == before[1:]
@@ -0,0 +1,42 @@
+# /opt/auto-wiki/tests/test_source_filter.py
+# 日本語タイトル: 検索結果の事前フィルターのテスト
+# 目的: 文字種による言語判定と、ブロックリストのドメイン（＋パス）ルールの判定を確認する
+
+from src.bot.source_filter import DomainRules, detect_script_language
+
+
+def test_japanese_with_mostly_latin_text_is_japanese():
+    assert detect_script_language("Kubernetes (K8s) Deployment ReplicaSet StatefulSet DaemonSet の違いを解説") == "ja"
+    assert detect_script_language("Python 3.12 の新機能: PEP 695 type parameter syntax and f-string improvements") == "ja"
+
+
+def test_script_languages():
+    assert detect_script_language("東京タワーは、東京都港区芝公園にある総合電波塔である。") == "ja"
+    assert detect_script_language("Tokyo Tower is a communications and observation tower in Minato, Tokyo.") == "en"
+    assert detect_script_language("东京铁塔是位于日本东京都港区芝公园的一座电波塔，高三百三十三米。") == "other"
+    assert detect_script_language("GPT-5") is None
+
+
+def test_domain_rules_match_subdomains_but_not_suffixes():
+    rules = DomainRules(["5ch.net"])
+
+    assert rules.verdict("https://5ch.net/thread/1") == "block"
+    assert rules.verdict("https://egg.5ch.net/test/read.cgi") == "block"
+    assert rules.verdict("https://not5ch.net/thread/1") is None
+
+
+def test_domain_rules_path_rules():
+    rules = DomainRules(["example.com/forum  # 掲示板だけを除外"])
+
+    assert rules.verdict("https://example.com/forum/topic/1") == "block"
+    assert rules.verdict("https://www.example.com/forum") == "block"
+    assert rules.verdict("https://example.com/docs/guide") is None
+
+
+def test_domain_rules_allow_entries_take_priority_over_blocks():
+    rules = DomainRules(["example.com", "+docs.example.com", "*.spam.org", "+spam.org/good"])
+
+    assert rules.verdict("https://docs.example.com/guide") == "allow"
+    assert rules.verdict("https://blog.example.com/post") == "block"
+    assert rules.verdict("https://spam.org/good/page") == "allow"
+    assert rules.verdict("https://spam.org/bad/page") == "block"
@@ -0,0 +1,46 @@
+# /opt/auto-wiki/tests/test_task_manager.py
+# 日本語タイトル: WikiScheduler のテスト
+# 目的: 起動時のスタックタスク回収など、タスクキューの状態遷移を一時DBで確認する
+
+from datetime import datetime, timedelta
+from src.scheduler.task_manager import WikiScheduler
+
+
+def _status(scheduler, topic):
+    return scheduler._get_conn().execute("SELECT status, worker_id FROM tasks WHERE topic = ?", (topic,)).fetchone()
+
+
+def test_startup_resets_leaseless_running_tasks_regardless_of_age(tmp_path):
+    db_path = str(tmp_path / "scheduler.db")
+    scheduler = WikiScheduler(db_path=db_path)
+    scheduler.add_or_update_tasks(["stranded", "leased"])
+    now = datetime.now()
+    conn = scheduler._get_conn()
+    # アップグレード直前の異常終了で取り残された、リースなしのRUNNINGタスク（直前まで実行中）
+    conn.execute("UPDATE tasks SET status = 'RUNNING', worker_id = 'old', lease_expires = NULL, last_run = ? "
+                 "WHERE topic = 'stranded'", (now - timedelta(minutes=1),))
+    # 他プロセスが有効なリースを保持しているタスク
+    conn.execute("UPDATE tasks SET status = 'RUNNING', worker_id = 'other', lease_expires = ?, last_run = ? "
+                 "WHERE topic = 'leased'", (now + timedelta(minutes=10), now))
+    scheduler.close()
+
+    restarted = WikiScheduler(db_path=db_path)
+    try:
+        assert _status(restarted, "stranded") == ("PENDING", None)
+        assert _status(restarted, "leased") == ("RUNNING", "other")
+    finally:
+        restarted.close()
+
+
+def test_periodic_reclaim_keeps_recent_leaseless_running_tasks(tmp_path):
+    scheduler = WikiScheduler(db_path=str(tmp_path / "scheduler.db"))
+    try:
+        scheduler.add_or_update_tasks(["recent"])
+        scheduler._get_conn().execute(
+            "UPDATE tasks SET status = 'RUNNING', worker_id = 'w', lease_expires = NULL, last_run = ? WHERE topic = 'recent'",
+            (datetime.now() - timedelta(minutes=1),)
+        )
+        assert scheduler._reclaim_expired_leases() == 0
+        assert _status(scheduler, "recent") == ("RUNNING", "w")
+    finally:
+        scheduler.close()